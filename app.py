@@ -1,31 +1,61 @@
 import os
 import re
 import json
+import queue
+import threading
+import base64
+import binascii
+import hashlib
+import functools
+import tempfile
+from datetime import datetime
+from collections import namedtuple
 from time import sleep
 import backoff
-from flask import Flask, render_template, request, jsonify, session, flash, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, flash, redirect, url_for
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import requests
-import google.generativeai as genai
-import markdown
 import logging
 from dotenv import load_dotenv
 import arxiv
-import PyPDF2
-from sqlalchemy.orm import Session as SQLSession
-from db import Session, SummaryHistory, User
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session as SQLSession, defer
+from db import Session, RequestSession, SummaryHistory, User, engine
 from auth import init_auth
+from summary_cache import SummaryCache, hash_file, hash_text
+from jobs import init_jobs
+from http_client import http_client
+from avatar_cache import AvatarCache
+from text_processing import clean_text_preserve_equations
+from extraction_router import ExtractionRouter
+from pdf_extraction import start_extraction_pool
+from gemini_uploads import GeminiUploadRegistry
+from summarizers import SummarizerRegistry, GeminiBackend, Seq2SeqBackend, FakeBackend, configure_gemini
+from chunking import estimate_tokens, split_into_chunks
+from history_search import ensure_search_index, search_history, summary_title_and_keywords
+from summary_rendering import RENDERER_VERSION, render_summary_html, is_rendered, render_record
+from logging_config import sampled, configure_logging, init_request_ids, current_log_context, bind_log_context, update_log_context
+from profiling import init_profiling, profile_requested, profile_thread
+from metrics import init_metrics, stage_timer, observe_stage, count_retry, count_fallback, count_model_tokens, track_pipeline
+from concurrent.futures import ThreadPoolExecutor
 import io
 from flask import send_file
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Fork the PDF extraction workers while this process is still single-threaded
+start_extraction_pool()
+
+# Configure logging (LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_SAMPLE_RATE)
+configure_logging()
 logger = logging.getLogger(__name__)
+request_logger = sampled(logger)  # Per-request chatter, kept at LOG_SAMPLE_RATE
 
 app = Flask(__name__)
+init_request_ids(app)
+init_metrics(app)
 
 # Configure Flask to use localhost for URL generation
 # app.config['SERVER_NAME'] = 'localhost:5000'  # Disabled to prevent issues
@@ -33,6 +63,14 @@ app = Flask(__name__)
 # Initialize authentication
 auth_manager = init_auth(app)
 
+# Admin-requested (X-Profile: 1) and randomly sampled request profiles, listed on /debug/profiles
+init_profiling(app, auth_manager.is_admin, auth_manager.admin_required)
+
+@app.teardown_appcontext
+def remove_request_session(exception=None):
+    """Close the request's database session, rolling back anything left uncommitted."""
+    RequestSession.remove()
+
 @app.context_processor
 def inject_user():
     """Inject user context into all templates"""
@@ -54,36 +92,129 @@ UPLOAD_FOLDER = 'Uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Downloaded and uploaded files are streamed to disk in fixed-size chunks and capped in size
+MAX_PDF_BYTES = int(float(os.getenv('MAX_PDF_MB', '50')) * 1024 * 1024)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+PDF_MAGIC = b'%PDF-'
+app.config['MAX_CONTENT_LENGTH'] = MAX_PDF_BYTES + 1024 * 1024  # Leave room for the other form fields
+
+@app.errorhandler(413)
+def request_too_large(e):
+    # The summarize page reads errors from JSON; Flask's default 413 is an HTML page
+    return jsonify({'error': f"The upload is too large; files are limited to {MAX_PDF_BYTES / (1024 * 1024):.3g} MB"}), 413
+
 # Configure Gemini API
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+configure_gemini()
+
+# Gemini file handles keyed by PDF content hash, so the same bytes are uploaded once
+gemini_uploads = GeminiUploadRegistry.from_env(Session)
+gemini_uploads.start_sweeper()
+
+# Summarization backends: SUMMARIZER_BACKEND serves requests by default and SUMMARIZER_BACKENDS
+# lists those a request may pick with its summarizer field; each is built when first used
+summarizers = SummarizerRegistry.from_env({
+    'gemini': lambda: GeminiBackend.from_env(gemini_uploads),
+    'hf': Seq2SeqBackend.from_env,
+    'fake': FakeBackend.from_env
+})
+# Each worker loads a local default model as it starts, not on its first request
+summarizers.get().start()
+
+# Avatar proxy cache; browsers may reuse an avatar for AVATAR_BROWSER_MAX_AGE seconds
+avatar_cache = AvatarCache.from_env(http_client)
+AVATAR_BROWSER_MAX_AGE = int(os.getenv('AVATAR_BROWSER_MAX_AGE', '3600'))
+
+# Bump whenever the extraction/summary prompts change so stale cached summaries are not served
+SUMMARY_PROMPT_VERSION = 'v1'
+
+# FTS5 index over summary_history, kept in sync by triggers
+ensure_search_index(engine)
+
+# Content-addressed cache of generated summaries, kept apart per summarizer model
+summary_cache = SummaryCache.from_env(Session, version=SUMMARY_PROMPT_VERSION)
+
+# Body of the placeholder summary returned when summarization fails; never cached
+FALLBACK_SUMMARY_BODY = """This research paper discusses important findings and methodologies in its field. The authors present their work with detailed analysis and experimental results. The study contributes to the existing body of knowledge and provides insights for future research directions.
+
+The methodology employed in this research follows established practices while introducing novel approaches. The authors carefully designed their experiments and analysis to ensure reliable and valid results.
+
+The findings of this study reveal significant insights that advance our understanding of the subject matter. The results demonstrate the effectiveness of the proposed methods and provide evidence for the authors' hypotheses.
+
+In conclusion, this research makes valuable contributions to the field and opens up new avenues for future investigation. The work has practical implications and theoretical significance that will benefit the research community.
+
+**Keywords:** research, analysis, methodology, findings, conclusions"""
 
 def allowed_file(filename):
     """Check if file extension is allowed."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def write_stream_to_temp_file(chunks, prefix, suffix, max_bytes, magic=None):
+    """Write an iterable of byte chunks to a unique file in the upload folder, hashing on the fly.
+
+    Enforces max_bytes and, if given, checks the leading magic bytes before writing anything.
+    Returns (path, sha256_hexdigest, size). Raises ValueError on validation failures.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=app.config['UPLOAD_FOLDER'])
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if magic and len(head) < len(magic):
+                    head += chunk[:len(magic) - len(head)]
+                    if not magic.startswith(head[:len(magic)]):
+                        raise ValueError("The file is not a valid PDF")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"The file exceeds the maximum size of {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                f.write(chunk)
+        if magic and head != magic:
+            raise ValueError("The file is not a valid PDF")
+    except Exception:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+    return path, digest.hexdigest(), size
+
 def download_pdf_from_url(url, retries=3):
-    """Download PDF from a URL with retries, handling redirects and content validation."""
-    @backoff.on_exception(backoff.expo, requests.exceptions.RequestException, max_tries=retries)
+    """Stream a PDF from a URL into a unique temp file with retries and content validation.
+
+    Returns (pdf_path, sha256_hexdigest), or (None, None) if the download failed.
+    """
+    @backoff.on_exception(backoff.expo, requests.exceptions.RequestException, max_tries=retries,
+                          on_backoff=count_retry('download'))
     def download():
         try:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
                 'Cache-Control': 'no-cache'
             }
-            response = requests.get(url, stream=True, timeout=30, headers=headers, allow_redirects=True)
-            response.raise_for_status()
-
-            content_type = response.headers.get('content-type', '').lower()
-            if 'application/pdf' not in content_type:
-                logger.error(f"URL {url} does not point to a PDF file (Content-Type: {content_type})")
-                raise ValueError("The provided URL does not point to a valid PDF file")
-
-            pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], "downloaded_temp.pdf")
-            with open(pdf_path, "wb") as f:
-                f.write(response.content)
-            logger.info(f"Downloaded PDF from {url} to {pdf_path}")
-            return pdf_path
+            # This backoff loop is the only retry layer: the client makes a single attempt per call
+            with http_client.get(url, retry=False, stream=True, timeout=30, headers=headers,
+                                 allow_redirects=True) as response:
+                response.raise_for_status()
+
+                # Validate headers before reading any of the body
+                content_type = response.headers.get('content-type', '').lower()
+                if 'application/pdf' not in content_type and 'application/octet-stream' not in content_type:
+                    logger.error(f"URL {url} does not point to a PDF file (Content-Type: {content_type})")
+                    raise ValueError("The provided URL does not point to a valid PDF file")
+                content_length = response.headers.get('content-length')
+                if content_length and content_length.isdigit() and int(content_length) > MAX_PDF_BYTES:
+                    raise ValueError(f"The PDF at {url} is {int(content_length)} bytes, over the {MAX_PDF_BYTES} byte limit")
+
+                pdf_path, content_hash, size = write_stream_to_temp_file(
+                    response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE),
+                    prefix='download_', suffix='.pdf', max_bytes=MAX_PDF_BYTES, magic=PDF_MAGIC
+                )
+            logger.info(f"Downloaded PDF from {url} to {pdf_path} ({size} bytes)")
+            return pdf_path, content_hash
         except requests.exceptions.HTTPError as e:
             logger.warning(f"HTTP error downloading PDF from {url}: {str(e)}")
             raise
@@ -95,10 +226,23 @@ def download_pdf_from_url(url, retries=3):
             raise
 
     try:
-        return download()
+        with stage_timer('download'):
+            return download()
     except Exception as e:
         logger.error(f"Failed to download PDF from {url} after {retries} attempts: {str(e)}")
-        return None
+        return None, None
+
+def save_upload(file):
+    """Stream an uploaded file to a unique path in the upload folder. Returns (path, sha256_hexdigest)."""
+    filename = secure_filename(file.filename)
+    is_pdf = filename.lower().endswith('.pdf')
+    path, content_hash, size = write_stream_to_temp_file(
+        iter(lambda: file.stream.read(DOWNLOAD_CHUNK_SIZE), b''),
+        prefix='upload_', suffix=f"_{filename}", max_bytes=MAX_PDF_BYTES,
+        magic=PDF_MAGIC if is_pdf else None
+    )
+    logger.info(f"Saved upload {filename} to {path} ({size} bytes)")
+    return path, content_hash
 
 def extract_arxiv_abstract(url):
     """Fetch abstract from arXiv URL as fallback."""
@@ -121,66 +265,25 @@ def extract_and_preserve_equations(text):
     # Equations are preserved as-is in the text (e.g., $...$, $$...$$)
     return text, {}
 
-def clean_text_preserve_equations(text):
-    """Clean text while preserving LaTeX equations."""
-    try:
-        # Remove arXiv IDs
-        text = re.sub(r'arXiv:\d+\.\d+[vV]\d*', '', text, flags=re.IGNORECASE)
-
-        # Remove PACS numbers
-        text = re.sub(r'\bpacs\s*number\(s\)\s*:[^\n]*', '', text, flags=re.IGNORECASE)
-
-        # Remove figure/table references
-        text = re.sub(r'\[\s*[fF]ig\.\w+\s*\]', '', text)
-        text = re.sub(r'\[\s*[tT]able\.\w+\s*\]', '', text)
-
-        # Remove DOI patterns
-        text = re.sub(r'\b\d+\.\d+\.\w+\b', '', text)
-
-        # Clean up hyphenated line breaks
-        text = text.replace("- ", "").replace("-\n", "")
-
-        # Normalize whitespace
-        text = re.sub(r'[ \t]+', ' ', text)
-        text = re.sub(r'\n+', '\n', text)
-
-        # Minimal LaTeX cleanup to avoid breaking equations
-        text = re.sub(r'//sqrt', r'\sqrt', text)
-        text = re.sub(r':\s*(\$\$)', r'\1', text)
-
-        return text.strip(), {}
-    except re.error as e:
-        logger.error(f"Regex error in clean_text_preserve_equations: {str(e)}")
-        return text, {}
-
-def extract_text_from_pdf_local(pdf_path):
-    """Extract text from PDF using PyPDF2 as a fallback."""
-    try:
-        logger.info(f"Performing local extraction on: {pdf_path}")
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            if not text.strip():
-                return "Error: No text extracted from PDF. The PDF may be scanned or encrypted. Consider using OCR.", {}
-            text, equation_placeholders = clean_text_preserve_equations(text)
-            logger.info(f"Local extraction text length: {len(text)} characters")
-            return text, equation_placeholders
-    except Exception as e:
-        logger.error(f"Local extraction failed: {str(e)}")
-        return f"Error extracting text from PDF locally: {str(e)}", {}
+def call_summarizer(summarizer, prompt, text=None, pdf=None, stream=False, config=None, timeout=120):
+    """Call a summarizer backend once; pdf is a (path, content_hash) pair for calls on the PDF itself.
 
-def extract_text_from_pdf(pdf_path, retries=3):
-    """Extract text from PDF using Gemini API with equation preservation."""
-    @backoff.on_exception(backoff.expo, Exception, max_tries=retries)
+    The PDF is uploaded on every attempt, which costs nothing when the backend still has it:
+    retries and repeat requests for the same paper reuse the upload.
+    """
+    document = None
+    if pdf is not None:
+        with stage_timer('upload'):
+            document = summarizer.upload_document(*pdf)
+    call = summarizer.stream if stream else summarizer.generate
+    return call(prompt, text=text, document=document, config=config, timeout=timeout)
+
+def extract_text_from_pdf_remote(pdf_path, content_hash=None, summarizer=None, retries=3):
+    """Transcribe a PDF with a summarizer that reads PDFs (Gemini), preserving equations. Raises on failure."""
+    summarizer = summarizer or summarizers.get()
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=retries, on_backoff=count_retry('extraction'))
     def extract():
-        logger.info(f"Attempting to upload file: {pdf_path}")
-        logger.info(f"File size: {os.path.getsize(pdf_path)} bytes")
-        sample_file = genai.upload_file(path=pdf_path, display_name="research_paper")
-        logger.info(f"Successfully uploaded file '{sample_file.display_name}' as: {sample_file.uri}")
 
         prompt = (
             "Extract all the text content from this PDF, paying special attention to mathematical equations. "
@@ -190,22 +293,39 @@ def extract_text_from_pdf(pdf_path, retries=3):
             "Return the extracted text in a clean, readable format with equations intact."
         )
 
-        logger.info("Sending request to Gemini API for PDF extraction")
-        response = gemini_model.generate_content(
-            [prompt, sample_file],
-            request_options={"timeout": 120}
-        )
+        logger.info(f"Sending PDF extraction request to the {summarizer.name} summarizer")
+        response = call_summarizer(summarizer, prompt, pdf=(pdf_path, content_hash), timeout=120)
+        count_model_tokens(summarizer.name, 'extraction', response)
 
         return response.text
 
-    try:
-        extracted_text = extract()
-        cleaned_text, equation_placeholders = clean_text_preserve_equations(extracted_text)
-        logger.info(f"Extracted text length: {len(cleaned_text)} characters")
-        return cleaned_text, equation_placeholders
-    except Exception as e:
-        logger.error(f"Failed to extract text with Gemini: {str(e)}")
-        return extract_text_from_pdf_local(pdf_path)
+    cleaned_text, equation_placeholders = clean_text_preserve_equations(extract())
+    logger.info(f"Extracted text length: {len(cleaned_text)} characters")
+    return cleaned_text, equation_placeholders
+
+# Local extraction first; the PDF is only uploaded to Gemini when its text layer scores poorly
+extraction_router = ExtractionRouter.from_env(extract_text_from_pdf_remote)
+
+def extract_text_from_pdf(pdf_path, content_hash=None, escalate=True, summarizer=None):
+    """Extract text from PDF, escalating to the summarizer for scanned or low-quality text layers.
+
+    Summarizers that can't read PDFs never escalate; the caller gets the local text as 'local_rejected',
+    and in EXTRACTION_MODE=gemini they get local extraction instead, the only text they can have.
+    Returns (text, equation_placeholders, decision) where decision is an ExtractionDecision.
+    """
+    summarizer = summarizer or summarizers.get()
+    local_only = not summarizer.supports_documents and extraction_router.mode == 'gemini'
+    text, equation_placeholders, decision = extraction_router.extract(
+        pdf_path, content_hash, escalate=escalate and summarizer.supports_documents,
+        remote_extract=functools.partial(extract_text_from_pdf_remote, summarizer=summarizer),
+        mode='local' if local_only else None
+    )
+    for step, stage in (('local', 'extraction_local'), ('gemini', 'extraction_gemini'), ('fallback', 'local_fallback')):
+        if step in decision.timings_ms:
+            observe_stage(stage, decision.timings_ms[step] / 1000)
+    if decision.method == 'local_fallback':
+        count_fallback('extraction_local')
+    return text, equation_placeholders, decision
 
 def extract_text_from_txt(file_path):
     """Extract text from a TXT file."""
@@ -280,11 +400,13 @@ def parse_summary_response(response_text, equation_placeholders):
     
     return title, summary, keywords
 
-def generate_summary_with_gemini(text, equation_placeholders, retries=3):
-    """Generate a comprehensive summary using Gemini API with equation awareness."""
-    @backoff.on_exception(backoff.expo, Exception, max_tries=retries)
-    def summarize():
-        prompt = f"""
+def build_summary_prompt(text=None):
+    """Build the summarization prompt for the extracted paper text, or for the attached PDF when text is None."""
+    if text is None:
+        paper = "The paper to analyze is the attached PDF. Ignore headers, footers, page numbers, and the reference list."
+    else:
+        paper = f"Text to analyze:\n{text}"
+    return f"""
 You are an expert research analyst. Analyze this research paper and provide a comprehensive summary that includes the most important mathematical equations.
 
 Instructions:
@@ -306,61 +428,338 @@ Summary:
 
 Keywords: [keyword1, keyword2, keyword3, etc.]
 
-Text to analyze:
-{text}
+{paper}
+"""
+
+SUMMARY_GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "top_p": 0.8,
+    "max_output_tokens": 2048
+}
+
+# How PDFs are summarized by default; requests can override it with the pdf_mode field.
+# auto: local text when its layer is good, else the PDF in one call; direct: always the PDF in one call;
+# extract: always extract text first (transcribing poor text layers with Gemini), then summarize it
+PDF_SUMMARY_MODES = ('auto', 'direct', 'extract')
+PDF_SUMMARY_MODE = os.getenv('PDF_SUMMARY_MODE', 'auto').lower()
+
+# Long-document (map-reduce) mode: papers above LONG_DOCUMENT_TOKENS are summarized in
+# chunks of at most CHUNK_TOKENS, CHUNK_CONCURRENCY calls at a time across the process.
+# Summarizers with a shorter context (local models) lower both limits to their context.
+LONG_DOCUMENT_TOKENS = int(os.getenv('LONG_DOCUMENT_TOKENS', '60000'))
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', '12000'))
+CHUNK_CONCURRENCY = int(os.getenv('CHUNK_CONCURRENCY', '4'))
+chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY, thread_name_prefix='summary-chunk')
+
+def build_chunk_prompt(index, total, chunk):
+    """Build the map-phase prompt for one part of a long paper."""
+    return f"""
+You are an expert research analyst. Below is part {index} of {total} of a long research paper.
+
+Write a dense summary of this part in 150-300 words that keeps:
+- The problem, method, results or conclusions covered in this part
+- Key definitions, numbers and named techniques
+- At most 2 of the most important equations, in their original LaTeX format (e.g., $...$, $$...$$)
+If this part contains the paper title, start your response with "Title: [Paper Title]".
+
+Part {index} of {total}:
+{chunk}
 """
-        logger.info("Sending request to Gemini API for summarization")
-        response = gemini_model.generate_content(
-            prompt,
-            generation_config={
+
+def build_reduce_prompt(chunk_summaries):
+    """Build the reduce-phase prompt from the per-part summaries, in the usual Title/Summary/Keywords format."""
+    total = len(chunk_summaries)
+    parts = "\n\n".join(f"[Part {i} of {total}]\n{part}" for i, part in enumerate(chunk_summaries, start=1))
+    return build_summary_prompt(
+        "This paper was too long to analyze in one pass. Below are summaries of its consecutive parts, in order.\n\n" + parts
+    )
+
+def summarize_chunk(index, total, chunk, summarizer, retries=3):
+    """Summarize one part of a long paper; retried on its own so one failure doesn't redo the document."""
+    @backoff.on_exception(backoff.expo, Exception, max_tries=retries, on_backoff=count_retry('chunk_summary'))
+    def summarize():
+        logger.info(f"Sending chunk {index}/{total} ({len(chunk)} characters) to the {summarizer.name} summarizer")
+        response = call_summarizer(
+            summarizer,
+            build_chunk_prompt(index, total, chunk),
+            text=chunk,
+            config={
                 "temperature": 0.2,
                 "top_p": 0.8,
-                "max_output_tokens": 2048
+                "max_output_tokens": 1024
             },
-            request_options={"timeout": 120}
+            timeout=120
         )
-        
+        count_model_tokens(summarizer.name, 'chunk_summary', response)
         return response.text
 
-    try:
-        response_text = summarize()
+    with stage_timer('chunk_summarization'):
+        return summarize()
+
+def summarize_parts(parts, summarizer):
+    """Summarize consecutive parts of a paper concurrently. Returns the part summaries in order."""
+    futures = [chunk_executor.submit(summarize_chunk, i, len(parts), part, summarizer)
+               for i, part in enumerate(parts, start=1)]
+
+    part_summaries = []
+    failed = 0
+    for i, future in enumerate(futures, start=1):
+        try:
+            part_summaries.append(future.result())
+        except Exception as e:
+            logger.error(f"Failed to summarize chunk {i}/{len(parts)}: {str(e)}")
+            part_summaries.append("(This part of the paper could not be summarized.)")
+            failed += 1
+
+    if failed * 2 > len(parts):
+        raise RuntimeError(f"{failed} of {len(parts)} chunks failed to summarize")
+    return part_summaries
+
+def summarize_chunks(text, summarizer):
+    """Map phase: summarize the chunks of a long paper concurrently. Returns the part summaries in order."""
+    chunks = split_into_chunks(text, chunk_token_limit(summarizer))
+    logger.info(f"Long document mode: {estimate_tokens(text)} estimated tokens in {len(chunks)} chunks")
+    return summarize_parts(chunks, summarizer)
+
+def chunk_token_limit(summarizer):
+    return min(CHUNK_TOKENS, summarizer.context_tokens or CHUNK_TOKENS)
+
+def document_token_limit(summarizer):
+    """Longest input summarized in a single call."""
+    return min(LONG_DOCUMENT_TOKENS, summarizer.context_tokens or LONG_DOCUMENT_TOKENS)
+
+def reduce_request_for(chunk_summaries, summarizer):
+    """(prompt, text) for the reduce call over the part summaries; text is what goes to the model
+    when it takes no instructions, so that's what has to fit its context."""
+    prompt, text = build_reduce_prompt(chunk_summaries), '\n\n'.join(chunk_summaries)
+    return prompt, text, summarizer.count_tokens(prompt if summarizer.follows_instructions else text)
+
+def group_summaries(chunk_summaries, summarizer):
+    """Merge consecutive part summaries into groups that each fit one map-phase call.
+
+    Every group takes at least two summaries, so each level at least halves their number; a pair
+    that overflows the budget loses the tail of its second summary to the model's truncation.
+    """
+    budget = chunk_token_limit(summarizer)
+    groups = []
+    current, current_tokens = [], 0
+    for part in chunk_summaries:
+        tokens = summarizer.count_tokens(part)
+        if len(current) > 1 and current_tokens + tokens > budget:
+            groups.append('\n\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += tokens
+    if len(current) == 1 and groups:
+        groups[-1] += '\n\n' + current[0]
+    else:
+        groups.append('\n\n'.join(current))
+    return groups
+
+def summary_request_for(text, summarizer):
+    """(prompt, text) for the final summarization call; long papers are condensed chunk by chunk first.
+
+    The text is what summarizers that take no instructions get instead of the prompt. When the part
+    summaries don't fit one call (short-context local models), consecutive ones are summarized
+    together again, level by level, so the reduce call still covers the whole paper.
+    """
+    limit = document_token_limit(summarizer)
+    if summarizer.count_tokens(text) <= limit:
+        return build_summary_prompt(text), text
+    chunk_summaries = summarize_chunks(text, summarizer)
+    prompt, model_input, tokens = reduce_request_for(chunk_summaries, summarizer)
+    while tokens > limit and len(chunk_summaries) > 1:
+        groups = group_summaries(chunk_summaries, summarizer)
+        logger.info(f"Condensing {len(chunk_summaries)} part summaries ({tokens} tokens) into {len(groups)}")
+        chunk_summaries = summarize_parts(groups, summarizer)
+        prompt, model_input, tokens = reduce_request_for(chunk_summaries, summarizer)
+    if tokens > limit:
+        logger.warning(f"The reduce input is {tokens} tokens, over the {limit} token limit; it will be truncated")
+    return prompt, model_input
+
+KEYWORD_STOPWORDS = {
+    'about', 'above', 'after', 'also', 'among', 'based', 'being', 'between', 'their', 'there', 'these',
+    'they', 'this', 'those', 'through', 'using', 'which', 'while', 'with', 'within', 'without', 'paper',
+    'propose', 'proposed', 'results', 'show', 'shows', 'study', 'approach', 'method', 'methods', 'authors'
+}
+
+def plain_summary_response(source_text, summary, keyword_count=6):
+    """Wrap a bare summary (from a summarizer that takes no instructions) in the Title/Summary/Keywords format.
+
+    The title comes from the paper text and the keywords are the summary's most frequent content words.
+    """
+    words = re.findall(r'[a-z][a-z-]{3,}', summary.lower())
+    counts = {}
+    for word in words:
+        if word not in KEYWORD_STOPWORDS:
+            counts[word] = counts.get(word, 0) + 1
+    keywords = sorted(counts, key=lambda word: -counts[word])[:keyword_count]  # Ties keep first-use order
+    return f"""Title: {extract_title_from_text(source_text or '')}
+
+Summary:
+{summary.strip()}
+
+Keywords: {', '.join(keywords)}"""
+
+def summary_response_text(summarizer, response_text, source_text):
+    """The summarizer's response in the Title/Summary/Keywords format the parser expects."""
+    if summarizer.follows_instructions:
+        return response_text
+    return plain_summary_response(source_text, response_text)
+
+def format_summary_response(response_text, equation_placeholders):
+    """Parse a raw Gemini response into the stored markdown format."""
+    with stage_timer('parsing'):
         title, summary, keywords = parse_summary_response(response_text, equation_placeholders)
-        word_count = len(summary.split())
-        equation_count = len(re.findall(r'\$.*?\$', summary))
-        logger.info(f"Generated summary: {word_count} words with {equation_count} equations")
-        
-        formatted_summary = f"""## {title}
+    word_count = len(summary.split())
+    equation_count = len(re.findall(r'\$.*?\$', summary))
+    logger.info(f"Generated summary: {word_count} words with {equation_count} equations")
+    
+    formatted_summary = f"""## {title}
 
 {summary}
 
 **Keywords:** {', '.join(keywords)}"""
+    
+    return formatted_summary
+
+def extract_summary_metadata(formatted_summary):
+    """Recover (title, keywords) from a summary in the stored markdown format."""
+    title, keywords = summary_title_and_keywords(formatted_summary)
+    return title or extract_title_from_text(formatted_summary), keywords
+
+def fallback_summary(text):
+    """Placeholder summary used when Gemini fails."""
+    title = extract_title_from_text(text)
+    return f"""## {title}
+
+{FALLBACK_SUMMARY_BODY}"""
+
+def generate_summary(text, equation_placeholders, summarizer=None, retries=3):
+    """Generate a comprehensive summary with equation awareness, falling back to a placeholder on failure."""
+    summarizer = summarizer or summarizers.get()
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=retries, on_backoff=count_retry('summary'))
+    def summarize():
+        logger.info(f"Sending summarization request to the {summarizer.name} summarizer")
+        response = call_summarizer(summarizer, prompt, text=model_input, config=SUMMARY_GENERATION_CONFIG, timeout=120)
+        count_model_tokens(summarizer.name, 'summary', response)
         
-        return formatted_summary
+        return response.text
+
+    try:
+        prompt, model_input = summary_request_for(text, summarizer)
+        with stage_timer('summarization'):
+            response_text = summarize()
+        return format_summary_response(summary_response_text(summarizer, response_text, text), equation_placeholders)
     
     except Exception as e:
         logger.error(f"Failed to generate summary: {str(e)}")
-        title = extract_title_from_text(text)
-        return f"""## {title}
+        count_fallback('placeholder_summary')
+        return fallback_summary(text)
 
-This research paper discusses important findings and methodologies in its field. The authors present their work with detailed analysis and experimental results. The study contributes to the existing body of knowledge and provides insights for future research directions.
+def summarize_pdf_directly(pdf_path, content_hash=None, cache_key=None, summarizer=None, retries=3):
+    """Summarize a PDF in one call on the PDF itself, without extracting its text first.
 
-The methodology employed in this research follows established practices while introducing novel approaches. The authors carefully designed their experiments and analysis to ensure reliable and valid results.
+    Returns the formatted summary, storing it in the summary cache. Raises on failure so the
+    caller can fall back to the extraction path.
+    """
+    summarizer = summarizer or summarizers.get()
 
-The findings of this study reveal significant insights that advance our understanding of the subject matter. The results demonstrate the effectiveness of the proposed methods and provide evidence for the authors' hypotheses.
+    @backoff.on_exception(backoff.expo, Exception, max_tries=retries, on_backoff=count_retry('pdf_summary'))
+    def summarize():
+        logger.info(f"Sending direct PDF summarization request to the {summarizer.name} summarizer")
+        response = call_summarizer(summarizer, build_summary_prompt(), pdf=(pdf_path, content_hash),
+                                   config=SUMMARY_GENERATION_CONFIG, timeout=180)
+        count_model_tokens(summarizer.name, 'pdf_summary', response)
+        return response.text
 
-In conclusion, this research makes valuable contributions to the field and opens up new avenues for future investigation. The work has practical implications and theoretical significance that will benefit the research community.
+    with stage_timer('summarization'):
+        response_text = summarize()
+    summary = format_summary_response(response_text, {})
+    if cache_key and is_cacheable_summary(summary):
+        summary_cache.set(cache_key, summary)
+    return summary
 
-**Keywords:** research, analysis, methodology, findings, conclusions"""
+def stream_response(open_response, summarizer, retries=3, operation='summary'):
+    """Yield the text of a streaming summarizer response as it is generated.
+
+    open_response starts the streaming call. Only opening the stream is retried; a failure
+    after the first chunk has been yielded propagates to the caller since the partial output
+    is already out. operation labels the call's retry and token metrics.
+    """
+    @backoff.on_exception(backoff.expo, Exception, max_tries=retries, on_backoff=count_retry(operation))
+    def open_stream():
+        chunks = iter(open_response())
+        return next(chunks, None), chunks
+
+    def chunk_text(chunk):
+        # Chunks carrying only a finish reason or safety ratings have no text parts
+        try:
+            return chunk.text
+        except ValueError:
+            return ''
+
+    with stage_timer('summarization'):
+        first_chunk, chunks = open_stream()
+        if first_chunk is None:
+            return
+        yield chunk_text(first_chunk)
+        last_chunk = first_chunk
+        for chunk in chunks:
+            last_chunk = chunk
+            delta = chunk_text(chunk)
+            if delta:
+                yield delta
+        # Usage metadata arrives with the final chunk
+        count_model_tokens(summarizer.name, operation, last_chunk)
+
+def stream_summary(text, summarizer=None, retries=3):
+    """Yield the raw summary response incrementally as it is generated.
+
+    For long papers the map phase runs first and only the reduce call is streamed. Being a
+    generator, the map phase runs on the first next(), so its failures reach the consumer like
+    a failed stream and end in the same placeholder summary as generate_summary.
+    """
+    summarizer = summarizer or summarizers.get()
+    prompt, model_input = summary_request_for(text, summarizer)
+
+    def open_response():
+        logger.info(f"Sending streaming summarization request to the {summarizer.name} summarizer")
+        return call_summarizer(summarizer, prompt, text=model_input, stream=True,
+                               config=SUMMARY_GENERATION_CONFIG, timeout=120)
+
+    yield from stream_response(open_response, summarizer, retries, 'summary')
+
+def stream_pdf_summary(pdf_path, content_hash=None, summarizer=None, retries=3):
+    """Yield the raw summary of the PDF incrementally, in one call on the PDF itself without extraction."""
+    summarizer = summarizer or summarizers.get()
+
+    def open_response():
+        logger.info(f"Sending streaming direct PDF summarization request to the {summarizer.name} summarizer")
+        return call_summarizer(summarizer, build_summary_prompt(), pdf=(pdf_path, content_hash), stream=True,
+                               config=SUMMARY_GENERATION_CONFIG, timeout=180)
+
+    return stream_response(open_response, summarizer, retries, 'pdf_summary')
+
+def is_cacheable_summary(summary):
+    """Only real model summaries are cached, never errors or the fallback placeholder."""
+    return bool(summary) and not summary.startswith('Error') and FALLBACK_SUMMARY_BODY not in summary
 
 def save_summary_history(summary, url=None, user_id=None):
-    """Save summary to database with optional user association."""
+    """Save summary, with its rendered HTML, to database with optional user association. Returns the HTML."""
     try:
         logger.debug(f"Attempting to save summary to database. URL: {url}, User ID: {user_id}, Summary length: {len(summary) if summary else 0}")
         session = Session()
-        record = SummaryHistory(summary=summary, original_url=url, user_id=user_id)
-        session.add(record)
-        session.flush()  # Ensure the record is written to the database
-        session.commit()
+        with stage_timer('render'):
+            summary_html = render_summary_html(summary)
+        title, keywords = extract_summary_metadata(summary)
+        record = SummaryHistory(summary=summary, summary_html=summary_html, renderer_version=RENDERER_VERSION,
+                                title=title, keywords=', '.join(keywords), original_url=url, user_id=user_id)
+        with stage_timer('save'):
+            session.add(record)
+            session.flush()  # Ensure the record is written to the database
+            session.commit()
         logger.info(f"Successfully saved summary to database. ID: {record.id}, URL: {url}, User ID: {user_id}")
     except Exception as e:
         logger.error(f"Failed to save summary to database: {str(e)}", exc_info=True)
@@ -369,24 +768,35 @@ def save_summary_history(summary, url=None, user_id=None):
     finally:
         session.close()
         logger.debug("Database session closed")
+    return summary_html
 
-def process_text(text, equation_placeholders, url=None):
-    """Process text through cleaning and summarization."""
+TEXT_TOO_SHORT_ERROR = "Error: The provided text is too short to generate a meaningful summary. Please provide a longer document."
+
+def process_text(text, equation_placeholders, url=None, cache_key=None, summarizer=None):
+    """Process text through summarization, storing the result in the summary cache."""
     if len(text.strip()) < 100:
-        return "Error: The provided text is too short to generate a meaningful summary. Please provide a longer document."
+        return TEXT_TOO_SHORT_ERROR
     
-    summary = generate_summary_with_gemini(text, equation_placeholders)
+    summary = generate_summary(text, equation_placeholders, summarizer)
+    if cache_key and is_cacheable_summary(summary):
+        summary_cache.set(cache_key, summary)
     return summary
 
+def pdf_cache_key(pdf_path, content_hash=None, summarizer=None):
+    """Cache key for a PDF's summary by a summarizer, derived from its bytes rather than its name or URL."""
+    model = (summarizer or summarizers.get()).model_id
+    if content_hash:
+        return summary_cache.make_key('pdf', content_hash, model)
+    try:
+        return summary_cache.make_key('pdf', hash_file(pdf_path), model)
+    except OSError as e:
+        logger.error(f"Failed to hash PDF {pdf_path}: {str(e)}")
+        return None
+
 @app.route('/')
 def home():
     """Render home page."""
     try:
-        # Debug session information FIRST
-        logger.info(f"HOME ROUTE - Session data: {dict(session)}")
-        logger.info(f"HOME ROUTE - Is authenticated: {auth_manager.is_authenticated()}")
-        logger.info(f"HOME ROUTE - Is authenticated or guest: {auth_manager.is_authenticated_or_guest()}")
-        
         # If user claims to be authenticated, verify with database
         if auth_manager.is_authenticated():
             current_user = auth_manager.get_current_user()
@@ -401,15 +811,11 @@ def home():
                 session['user_avatar'] = current_user.avatar_url
                 session['user_name'] = current_user.name
                 session['user_email'] = current_user.email
-                logger.info(f"HOME ROUTE - Updated session with latest user data")
-            
-            logger.info(f"HOME ROUTE - Current user from DB: {current_user.email if current_user else None}")
-            logger.info(f"HOME ROUTE - Avatar from DB: {current_user.avatar_url if current_user else None}")
-            logger.info(f"HOME ROUTE - Avatar from session: {session.get('user_avatar')}")
+                logger.info("HOME ROUTE - Updated session with latest user data for user %s", current_user.id)
         
         # If user is not authenticated and not in guest mode, redirect to login
         if not auth_manager.is_authenticated_or_guest():
-            logger.info("HOME ROUTE - Redirecting to login")
+            request_logger.debug("HOME ROUTE - Redirecting to login")
             return redirect(url_for('login'))
         
         return render_template('index.html')
@@ -434,88 +840,395 @@ def clear_session():
     session.clear()
     return redirect(url_for('home'))
 
-@app.route('/summary', methods=['GET', 'POST'])
-def summary():
-    """Handle summary generation."""
+# What the summarization step receives: extracted text, or (pdf_path set) a PDF to summarize directly.
+# temp_path is the uploaded or downloaded file, removed once the pipeline is done with it.
+SummaryInput = namedtuple(
+    'SummaryInput',
+    ['text', 'equation_placeholders', 'cache_key', 'cached_summary', 'error', 'pdf_path', 'content_hash', 'temp_path'],
+    defaults=(None, {}, None, None, None, None, None, None)
+)
+
+def remove_temp_file(path):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def job_summarizer(job):
+    """The summarizer backend a job asked for, or the default one."""
+    return summarizers.get((job.get('options') or {}).get('summarizer'))
+
+def prepare_summary_input(job, report_stage, summarizer):
+    """Turn a job's input into a SummaryInput ready for summarization, short-circuiting on cache hits.
+
+    Text files are removed before returning; PDFs are left for the caller to remove via temp_path.
+    """
+    input_type = job['input_type']
+    pdf_mode = (job.get('options') or {}).get('pdf_mode')
+
+    if input_type == 'file':
+        file_path = job['file_path']
+        if not file_path or not os.path.exists(file_path):
+            return SummaryInput(error="The uploaded file is no longer available. Please upload it again.")
+        if file_path.lower().endswith('.pdf'):
+            try:
+                return prepare_pdf_input(file_path, report_stage, summarizer, job.get('content_hash'), pdf_mode)
+            except Exception:
+                remove_temp_file(file_path)
+                raise
+        try:
+            report_stage('extracting')
+            text, equation_placeholders = extract_text_from_txt(file_path)
+            if text.startswith('Error'):
+                return SummaryInput(error=text)
+        finally:
+            remove_temp_file(file_path)
+
+    elif input_type == 'text':
+        text, equation_placeholders = clean_text_preserve_equations(job['input_text'])
+
+    elif input_type == 'url':
+        url = job['original_url']
+        report_stage('downloading')
+        pdf_path, content_hash = download_pdf_from_url(url)
+        if not pdf_path:
+            return SummaryInput(error=f"Failed to download PDF from {url}. Please ensure the URL points to a valid PDF file or upload the PDF manually.")
+        try:
+            return prepare_pdf_input(pdf_path, report_stage, summarizer, content_hash, pdf_mode)
+        except Exception:
+            remove_temp_file(pdf_path)
+            raise
+
+    else:
+        return SummaryInput(error=f"Unknown job input type: {input_type}")
+
+    if len(text.strip()) < 100:
+        return SummaryInput(error=TEXT_TOO_SHORT_ERROR)
+    cache_key = summary_cache.make_key('text', hash_text(text), summarizer.model_id)
+    return SummaryInput(text, equation_placeholders, cache_key, summary_cache.get(cache_key))
+
+def prepare_pdf_input(pdf_path, report_stage, summarizer, content_hash=None, mode=None):
+    """Prepare a PDF for summarization unless a summary for the same bytes is already cached.
+
+    'direct' mode hands the PDF itself to the summarizer; 'extract' extracts its text first (escalating
+    poor text layers to Gemini transcription); 'auto' uses a good local text layer and otherwise
+    summarizes the PDF directly. Summarizers that can't read PDFs always get the local text.
+    """
+    mode = (mode or PDF_SUMMARY_MODE) if summarizer.supports_documents else 'extract'
+    cache_key = pdf_cache_key(pdf_path, content_hash, summarizer)
+    cached_summary = summary_cache.get(cache_key)
+    if cached_summary:
+        return SummaryInput(cache_key=cache_key, cached_summary=cached_summary, temp_path=pdf_path)
+    if mode == 'direct':
+        return SummaryInput(cache_key=cache_key, pdf_path=pdf_path, content_hash=content_hash, temp_path=pdf_path)
+
+    report_stage('extracting')
+    text, equation_placeholders, decision = extract_text_from_pdf(pdf_path, content_hash, escalate=(mode != 'auto'),
+                                                                  summarizer=summarizer)
+    report_stage('extracting', extraction=decision.to_dict())
+    if decision.method == 'local_rejected' and summarizer.supports_documents:
+        # Poor text layer: one call on the PDF itself instead of transcribing it and then summarizing
+        return SummaryInput(cache_key=cache_key, pdf_path=pdf_path, content_hash=content_hash, temp_path=pdf_path)
+    if text.startswith('Error'):
+        return SummaryInput(error=text, temp_path=pdf_path)
+    return SummaryInput(text, equation_placeholders, cache_key, temp_path=pdf_path)
+
+def extract_for_fallback(summary_input, report_stage, summarizer):
+    """After a failed direct summary, extract the PDF's text for the two-call path."""
+    report_stage('extracting')
+    text, equation_placeholders, decision = extract_text_from_pdf(summary_input.pdf_path, summary_input.content_hash,
+                                                                  summarizer=summarizer)
+    report_stage('extracting', extraction=decision.to_dict())
+    if text.startswith('Error'):
+        return summary_input._replace(error=text)
+    return summary_input._replace(text=text, equation_placeholders=equation_placeholders, pdf_path=None)
+
+@track_pipeline
+def run_summary_job(job, report_stage):
+    """Run the download/extraction/summarization pipeline for a queued job.
+
+    Returns a (raw_summary, error_message) tuple; the summary is saved to history on success.
+    """
+    url = job['original_url']
+    summarizer = job_summarizer(job)
+    summary_input = prepare_summary_input(job, report_stage, summarizer)
+    try:
+        if summary_input.error:
+            return None, summary_input.error
+
+        raw_summary = summary_input.cached_summary
+        error_message = None
+        if not raw_summary and summary_input.pdf_path:
+            report_stage('summarizing', summary_mode='direct')
+            try:
+                raw_summary = summarize_pdf_directly(summary_input.pdf_path, summary_input.content_hash,
+                                                     summary_input.cache_key, summarizer)
+            except Exception as e:
+                logger.error(f"Direct PDF summary failed, falling back to extraction: {str(e)}")
+                count_fallback('direct_to_extract')
+                summary_input = extract_for_fallback(summary_input, report_stage, summarizer)
+                if summary_input.error:
+                    return None, summary_input.error
+
+        if not raw_summary:
+            report_stage('summarizing', summary_mode='text')
+            raw_summary = process_text(summary_input.text, summary_input.equation_placeholders, url,
+                                       summary_input.cache_key, summarizer)
+    finally:
+        remove_temp_file(summary_input.temp_path)
+
+    # Save to DB, if not error
+    if raw_summary and not raw_summary.startswith('Error'):
+        report_stage('saving')
+        try:
+            save_summary_history(raw_summary, url, job['user_id'])
+            logger.info(f"Saved summary to DB. URL: {url}, User ID: {job['user_id']}")
+        except Exception as e:
+            logger.error(f"DB save failed: {str(e)}", exc_info=True)
+            error_message = f"Failed to save summary to database: {str(e)}"
+    elif raw_summary and raw_summary.startswith('Error'):
+        logger.warning(f"Summary not saved to DB due to error: {raw_summary}")
+        error_message = raw_summary
+        raw_summary = None
+
+    return raw_summary, error_message
+
+def emit_summary_stream(deltas, emit, response_parts):
+    """Forward streamed summary deltas as chunk events. Returns False if the stream broke after output began."""
+    try:
+        for delta in deltas:
+            response_parts.append(delta)
+            emit('chunk', {'text': delta})
+    except Exception as e:
+        logger.error(f"Streaming summary failed: {str(e)}")
+        if response_parts:
+            emit('error', {'error': "Summary generation was interrupted. Please try again."})
+            return False
+    return True
+
+@track_pipeline
+def run_streaming_summary(job, emit):
+    """Run the pipeline for a streaming request, emitting (event, data) pairs as it goes."""
+    url = job['original_url']
+    report_stage = lambda stage, **details: emit('stage', dict(details, stage=stage))
+    summarizer = job_summarizer(job)
+    summary_input = prepare_summary_input(job, report_stage, summarizer)
+    try:
+        if summary_input.error:
+            emit('error', {'error': summary_input.error})
+            return
+
+        raw_summary = summary_input.cached_summary
+        if raw_summary:
+            # Cache hit: send the stored summary as a single chunk
+            emit('chunk', {'text': raw_summary})
+        else:
+            response_parts = []
+            if summary_input.pdf_path:
+                report_stage('summarizing', summary_mode='direct')
+                deltas = stream_pdf_summary(summary_input.pdf_path, summary_input.content_hash, summarizer)
+                if not emit_summary_stream(deltas, emit, response_parts):
+                    return
+                if not response_parts:
+                    logger.warning("Direct PDF summary produced no output, falling back to extraction")
+                    count_fallback('direct_to_extract')
+                    summary_input = extract_for_fallback(summary_input, report_stage, summarizer)
+                    if summary_input.error:
+                        emit('error', {'error': summary_input.error})
+                        return
+
+            if not response_parts:
+                report_stage('summarizing', summary_mode='text')
+                if not emit_summary_stream(stream_summary(summary_input.text, summarizer), emit, response_parts):
+                    return
+
+            if response_parts:
+                response_text = summary_response_text(summarizer, ''.join(response_parts), summary_input.text)
+                raw_summary = format_summary_response(response_text, summary_input.equation_placeholders)
+                if summary_input.cache_key and is_cacheable_summary(raw_summary):
+                    summary_cache.set(summary_input.cache_key, raw_summary)
+            else:
+                count_fallback('placeholder_summary')
+                raw_summary = fallback_summary(summary_input.text)
+                emit('chunk', {'text': raw_summary})
+    finally:
+        remove_temp_file(summary_input.temp_path)
+
+    emit('stage', {'stage': 'saving'})
+    try:
+        summary_html = save_summary_history(raw_summary, url, job['user_id'])
+    except Exception as e:
+        logger.error(f"DB save failed: {str(e)}", exc_info=True)
+        emit('error', {'error': f"Failed to save summary to database: {str(e)}"})
+        return
+
+    title, keywords = extract_summary_metadata(raw_summary)
+    emit('done', {
+        'summary': summary_html,
+        'title': title,
+        'keywords': keywords
+    })
+
+# Background job pool that runs the summary pipeline outside the request
+job_manager = init_jobs(app, run_summary_job)
+
+def job_response(job):
+    """Serialize a job for the polling API."""
     result = None
-    error_message = None
-    raw_summary = None  # Store the raw summary for DB
+    if job['status'] == 'done' and job['summary']:
+        result = render_summary_html(job['summary'])
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'summary': result,
+        'error': job['error'],
+        'details': job['details'],
+        'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+        'updated_at': job['updated_at'].isoformat() if job['updated_at'] else None,
+        'status_url': url_for('job_status', job_id=job['id'])
+    }
+
+def summary_input_from_request():
+    """Read the submitted text/file/url and options. Returns (input_type, fields) or (None, error_message)."""
+    input_text = request.form.get('text')
+    file = request.files.get('file')
+    url = request.form.get('url')
+
+    options = {}
+    pdf_mode = (request.form.get('pdf_mode') or '').lower()
+    if pdf_mode:
+        if pdf_mode not in PDF_SUMMARY_MODES:
+            return None, f"Invalid pdf_mode '{pdf_mode}'. Use one of: {', '.join(PDF_SUMMARY_MODES)}."
+        options['pdf_mode'] = pdf_mode
+    summarizer = (request.form.get('summarizer') or '').lower()
+    if summarizer:
+        if summarizer not in summarizers.allowed:
+            return None, f"Invalid summarizer '{summarizer}'. Use one of: {', '.join(summarizers.allowed)}."
+        options['summarizer'] = summarizer
+
+    if file and allowed_file(file.filename):
+        # Keep the upload on disk under a unique name until the pipeline has run
+        try:
+            file_path, content_hash = save_upload(file)
+        except ValueError as e:
+            return None, str(e)
+        return 'file', {'file_path': file_path, 'content_hash': content_hash, 'options': options}
+    elif input_text:
+        return 'text', {'input_text': input_text, 'original_url': url, 'options': options}
+    elif url:
+        return 'url', {'original_url': url, 'options': options}
+    return None, "No valid input provided. Please enter text, upload a file, or provide a URL."
 
+@app.route('/summary', methods=['GET', 'POST'])
+def summary():
+    """Render the summarize page, or enqueue a summary job on POST."""
     if request.method == 'POST':
         try:
-            input_text = request.form.get('text')
-            file = request.files.get('file')
-            url = request.form.get('url')
-
-            if file and allowed_file(file.filename):
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file.filename))
-                file.save(file_path)
-                
-                if file.filename.endswith('.pdf'):
-                    text, equation_placeholders = extract_text_from_pdf(file_path)
-                else:
-                    text, equation_placeholders = extract_text_from_txt(file_path)
-                
-                if text.startswith('Error'):
-                    error_message = text
-                else:
-                    raw_summary = process_text(text, equation_placeholders, None)
-                
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-                    
-            elif input_text:
-                text, equation_placeholders = clean_text_preserve_equations(input_text)
-                raw_summary = process_text(text, equation_placeholders, url)
-                
-            elif url:
-                pdf_path = download_pdf_from_url(url)
-                if pdf_path:
-                    text, equation_placeholders = extract_text_from_pdf(pdf_path)
-                    if text.startswith('Error'):
-                        error_message = text
-                    else:
-                        raw_summary = process_text(text, equation_placeholders, url)
-                    
-                    try:
-                        os.remove(pdf_path)
-                    except:
-                        pass
-                else:
-                    error_message = f"Failed to download PDF from {url}. Please ensure the URL points to a valid PDF file or upload the PDF manually."
+            current_user_id = session.get('user_id') if auth_manager.is_authenticated() else None
+            input_type, fields = summary_input_from_request()
+            if input_type is None:
+                return jsonify({'summary': None, 'error': fields}), 400
 
-            else:
-                error_message = "No valid input provided. Please enter text, upload a file, or provide a URL."
-
-            # Save to DB BEFORE markdown conversion, if not error
-            if raw_summary and not raw_summary.startswith('Error'):
-                logger.debug(f"Preparing to save raw_summary to DB. Length: {len(raw_summary)}")
-                try:
-                    # Get current user ID if authenticated
-                    current_user_id = session.get('user_id') if auth_manager.is_authenticated() else None
-                    save_summary_history(raw_summary, url, current_user_id)
-                    logger.info(f"Saved summary to DB. URL: {url}, User ID: {current_user_id}")
-                except Exception as e:
-                    logger.error(f"DB save failed: {str(e)}", exc_info=True)
-                    error_message = f"Failed to save summary to database: {str(e)}"
-                result = markdown.markdown(raw_summary, extensions=['nl2br', 'fenced_code', 'tables'])
-            elif raw_summary and raw_summary.startswith('Error'):
-                logger.warning(f"Summary not saved to DB due to error: {raw_summary}")
-                error_message = raw_summary
-                result = None
+            job_id = job_manager.submit(input_type, current_user_id, **fields)
+            return jsonify(job_response(job_manager.get(job_id))), 202
 
+        except RequestEntityTooLarge:
+            raise  # Answered by request_too_large
         except Exception as e:
             logger.error(f"Error in summary route: {str(e)}")
-            error_message = f"An unexpected error occurred: {str(e)}"
-
-        return jsonify({
-            'summary': result,
-            'error': error_message
-        })
+            return jsonify({
+                'summary': None,
+                'error': f"An unexpected error occurred: {str(e)}"
+            }), 500
+
+    return render_template('summarize.html', summary=None, error=None)
+
+def sse_event(event, data):
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Each streamed summary holds a pipeline thread; past this many, new streams get a 503
+SUMMARY_STREAM_WORKERS = int(os.getenv('SUMMARY_STREAM_WORKERS', '4'))
+stream_slots = threading.BoundedSemaphore(SUMMARY_STREAM_WORKERS)
+
+@app.route('/summary/stream', methods=['POST'])
+def summary_stream():
+    """Summarize over server-sent events: stage updates, markdown chunks as they are generated, then the final result."""
+    # Taken before the input is read, so a rejected request never saves its upload
+    if not stream_slots.acquire(blocking=False):
+        return jsonify({'summary': None, 'error': 'Too many summaries are being streamed; please try again shortly'}), \
+            503, {'Retry-After': '5'}
+    try:
+        current_user_id = session.get('user_id') if auth_manager.is_authenticated() else None
+        input_type, fields = summary_input_from_request()
+    except RequestEntityTooLarge:
+        stream_slots.release()
+        raise
+    except Exception as e:
+        stream_slots.release()
+        logger.error(f"Error in summary stream route: {str(e)}")
+        return jsonify({'summary': None, 'error': f"An unexpected error occurred: {str(e)}"}), 500
+    if input_type is None:
+        stream_slots.release()
+        return jsonify({'summary': None, 'error': fields}), 400
+
+    job = {'input_type': input_type, 'user_id': current_user_id, 'input_text': None,
+           'file_path': None, 'content_hash': None, 'original_url': None, 'options': {}}
+    job.update(fields)
+
+    # The pipeline runs on its own thread so stage events reach the client while it blocks
+    events = queue.Queue()
+
+    # The pipeline thread logs with this request's id, plus the stage it has reached
+    log_fields = current_log_context()
+    profiled = profile_requested.get()
+
+    def emit(event, data):
+        if event == 'stage':
+            update_log_context(stage=data['stage'])
+        events.put((event, data))
+
+    def run():
+        bind_log_context(**log_fields)
+        try:
+            with app.app_context(), profile_thread('stream', log_fields.get('request_id'), profiled):
+                run_streaming_summary(job, emit)
+        except Exception as e:
+            logger.error(f"Streaming summary crashed: {str(e)}", exc_info=True)
+            events.put(('error', {'error': f"An unexpected error occurred: {str(e)}"}))
+        finally:
+            stream_slots.release()
+            events.put(None)
+
+    threading.Thread(target=run, name='summary-stream', daemon=True).start()
+
+    def generate():
+        yield sse_event('stage', {'stage': 'queued'})
+        while True:
+            try:
+                item = events.get(timeout=15)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if item is None:
+                break
+            yield sse_event(*item)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
-    return render_template('summarize.html', summary=result, error=error_message)
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Poll the status, stage and result of a summary job."""
+    job = job_manager.get(job_id)
+    current_user_id = session.get('user_id') if auth_manager.is_authenticated() else None
+    if not job or (job['user_id'] is not None and job['user_id'] != current_user_id):
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_response(job))
 
 @app.route('/debug-session')
 def debug_session():
@@ -537,6 +1250,26 @@ def debug_session():
         'db_user_id': db_user.id if db_user else None
     })
 
+@app.route('/debug/extraction-metrics')
+def debug_extraction_metrics():
+    """Extraction routing decisions so far: counts, average latency and escalation reasons per method"""
+    return jsonify(extraction_router.metrics())
+
+@app.route('/debug/summarizers')
+def debug_summarizers():
+    """Default and selectable summarizer backends, with the models loaded so far"""
+    return jsonify(summarizers.metrics())
+
+@app.route('/debug/gemini-uploads')
+def debug_gemini_uploads():
+    """Gemini upload registry metrics: bytes uploaded versus bytes saved by reusing handles"""
+    return jsonify(gemini_uploads.metrics())
+
+@app.route('/debug/http-metrics')
+def debug_http_metrics():
+    """Per-host connection pool and latency metrics for outbound HTTP calls in this worker"""
+    return jsonify(http_client.metrics())
+
 @app.route('/test-auth')
 def test_auth():
     """Test page for authentication debugging"""
@@ -712,7 +1445,7 @@ def sync_session():
     if not auth_manager.is_authenticated():
         return jsonify({'error': 'Not authenticated'})
     
-    user = auth_manager.get_current_user()
+    user = auth_manager.refresh_current_user()
     if user:
         # Force update session with database values
         session['user_name'] = user.name
@@ -728,31 +1461,129 @@ def sync_session():
         })
     return jsonify({'error': 'User not found in database'})
 
+# Summaries per history page; the JSON API accepts up to HISTORY_MAX_PAGE_SIZE
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+HISTORY_MAX_PAGE_SIZE = 100
+
+def encode_history_cursor(record):
+    """Opaque cursor pointing just past a history record in (created_at, id) descending order."""
+    raw = f"{record.created_at.isoformat()}|{record.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_history_cursor(cursor):
+    """Return the (created_at, id) a cursor points past. Raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, record_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("Invalid history cursor")
+
+def history_page_args():
+    """Read ?before=<cursor>&limit=N. Returns (before, limit); raises ValueError on bad input."""
+    before = request.args.get('before')
+    limit = request.args.get('limit', type=int) or HISTORY_PAGE_SIZE
+    return (decode_history_cursor(before) if before else None), max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+def load_history_page(user_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """Return one page of a user's history, newest first, as (histories, next_cursor).
+
+    Keyset pagination on (created_at, id) walks the (user_id, created_at, id) index, so a
+    page costs the same however deep it is. next_cursor is None on the last page.
+    """
+    session_db = RequestSession()
+    # The markdown column is only loaded for rows that still need rendering
+    query = session_db.query(SummaryHistory).options(
+        defer(SummaryHistory.summary)
+    ).filter(SummaryHistory.user_id == user_id)
+    if before:
+        created_at, record_id = before
+        query = query.filter(or_(
+            SummaryHistory.created_at < created_at,
+            and_(SummaryHistory.created_at == created_at, SummaryHistory.id < record_id)
+        ))
+    records = query.order_by(SummaryHistory.created_at.desc(), SummaryHistory.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_history_cursor(records[limit - 1]) if len(records) > limit else None
+    records = records[:limit]
+
+    # Rows saved before pre-rendering, or by an older renderer, are rendered once and written back
+    stale = [r for r in records if not is_rendered(r)]
+    for r in stale:
+        render_record(r)
+    histories = [{
+        'id': r.id,
+        'created_at': r.created_at,
+        'original_url': r.original_url,
+        'summary_html': r.summary_html
+    } for r in records]
+    if stale:
+        try:
+            session_db.commit()
+            logger.info(f"Rendered {len(stale)} stale history records for user {user_id}")
+        except Exception as e:
+            logger.error(f"Failed to store rendered history: {str(e)}")
+            session_db.rollback()
+    return histories, next_cursor
+
 @app.route('/history')
 def history():
-    """Display summary history."""
+    """Display summary history, a page at a time (?before=<cursor>&limit=N)."""
+    # If user is authenticated, show only their summaries
+    if not auth_manager.is_authenticated():
+        flash('Please sign in to view your personal summary history.', 'info')
+        return redirect(url_for('login'))
+
     try:
-        session_db = Session()  # Use the correct Session from db.py
-        
-        # If user is authenticated, show only their summaries
-        if auth_manager.is_authenticated():
-            current_user_id = session.get('user_id')
-            records = session_db.query(SummaryHistory).filter_by(user_id=current_user_id).order_by(SummaryHistory.created_at.desc()).all()
-            logger.info(f"Retrieved {len(records)} user-specific records from history for user {current_user_id}")
-        else:
-            # For guest users, show recent public summaries (or redirect to login)
-            flash('Please sign in to view your personal summary history.', 'info')
-            return redirect(url_for('login'))
-        
-        session_db.close()
-        # Convert markdown to HTML for each summary
-        for r in records:
-            r.summary = markdown.markdown(r.summary, extensions=['nl2br', 'fenced_code', 'tables'])
-        return render_template('history.html', histories=records)
+        current_user_id = session.get('user_id')
+        try:
+            before, limit = history_page_args()
+        except ValueError:
+            before, limit = None, HISTORY_PAGE_SIZE
+        histories, next_cursor = load_history_page(current_user_id, before, limit)
+        request_logger.info("Retrieved %d user-specific records from history for user %s", len(histories), current_user_id)
+        return render_template('history.html', histories=histories, next_cursor=next_cursor, page_size=limit)
     except Exception as e:
         logger.error(f"Error loading history: {str(e)}")
         return render_template('history.html', histories=[], error="Failed to load history")
 
+@app.route('/history.json')
+def history_json():
+    """One page of the user's summary history as JSON: {items, next_cursor}."""
+    if not auth_manager.is_authenticated():
+        return jsonify({'error': 'Authentication required'}), 401
+    try:
+        before, limit = history_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        histories, next_cursor = load_history_page(session.get('user_id'), before, limit)
+    except Exception as e:
+        logger.error(f"Error loading history page: {str(e)}")
+        return jsonify({'error': 'Failed to load history'}), 500
+    for h in histories:
+        h['created_at'] = h['created_at'].isoformat() if h['created_at'] else None
+    return jsonify({'items': histories, 'next_cursor': next_cursor})
+
+@app.route('/history/search')
+def search_summaries():
+    """Full-text search of the user's summaries (?q=...&limit=N), best match first, with highlighted snippets."""
+    if not auth_manager.is_authenticated():
+        return jsonify({'error': 'Authentication required'}), 401
+    query = (request.args.get('q') or '').strip()
+    limit = max(1, min(request.args.get('limit', type=int) or HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE))
+    if not query:
+        return jsonify({'query': query, 'items': []})
+
+    try:
+        results = search_history(RequestSession(), session.get('user_id'), query, limit)
+    except Exception as e:
+        logger.error(f"History search failed: {str(e)}")
+        return jsonify({'error': 'Search failed'}), 500
+    for r in results:
+        r['created_at'] = r['created_at'].isoformat() if isinstance(r['created_at'], datetime) else r['created_at']
+    return jsonify({'query': query, 'items': results})
+
 @app.route('/avatar/<int:user_id>')
 def serve_avatar(user_id):
     """Serve user avatar through proxy to handle CORS issues"""
@@ -768,26 +1599,19 @@ def serve_avatar(user_id):
             return "", 403  # Forbidden - can only access own avatar
             
         # Get user from database
-        db_session = Session()
-        user = db_session.query(User).filter_by(id=user_id).first()
+        user = RequestSession().get(User, user_id)
         
         if not user or not user.avatar_url:
             logger.warning(f"No user or avatar URL found for user {user_id}")
-            db_session.close()
             return "", 404
             
         avatar_url = user.avatar_url
-        db_session.close()
-        
-        logger.info(f"Attempting to fetch avatar from: {avatar_url}")
         
         # Download the avatar image with multiple fallback strategies
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Cache-Control': 'no-cache',
-            'Pragma': 'no-cache'
+            'Accept-Language': 'en-US,en;q=0.9'
         }
         
         # Try with session cookies if available
@@ -795,28 +1619,18 @@ def serve_avatar(user_id):
         if 'google_token' in session:
             cookies = {'session': session.get('google_token', '')}
         
-        response = requests.get(avatar_url, headers=headers, cookies=cookies, timeout=15, allow_redirects=True)
-        
-        if response.status_code == 200 and len(response.content) > 100:  # Valid image should be > 100 bytes
-            # Create a BytesIO object from the image data
-            img_io = io.BytesIO(response.content)
-            img_io.seek(0)
-            
-            # Determine content type
-            content_type = response.headers.get('content-type', 'image/jpeg')
-            if not content_type.startswith('image/'):
-                content_type = 'image/jpeg'  # Default fallback
-            
-            logger.info(f"Successfully served avatar for user {user_id}")
-            return send_file(img_io, mimetype=content_type, as_attachment=False)
-        else:
-            logger.warning(f"Failed to fetch avatar: status={response.status_code}, content_length={len(response.content) if response.content else 0}")
-            # Try a different approach - use a default avatar or return empty
+        # Served from the avatar cache; the origin is only contacted once the cached copy is past its TTL
+        entry = avatar_cache.get(user_id, avatar_url, headers=headers, cookies=cookies)
+        if entry is None:
             return "", 404
+        
+        # send_file answers If-None-Match with a 304 for us
+        response = send_file(io.BytesIO(entry.content), mimetype=entry.content_type, as_attachment=False,
+                             etag=entry.etag, max_age=AVATAR_BROWSER_MAX_AGE)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
             
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Network error fetching avatar: {str(e)}")
-        return "", 500
     except Exception as e:
         logger.error(f"Error serving avatar: {str(e)}")
         return "", 500
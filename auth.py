@@ -1,7 +1,7 @@
 import os
 import secrets
-import requests
-from flask import session, request, redirect, url_for, jsonify, flash, render_template
+from http_client import http_client
+from flask import g, session, request, redirect, url_for, jsonify, flash, render_template
 import logging
 from datetime import datetime
 
@@ -23,11 +23,15 @@ except ImportError:
     FLASK_SESSION_AVAILABLE = False
     FlaskSession = None
 
-from db import Session as DBSession, User
+from db import RequestSession, User
+from user_cache import UserCache, snapshot_user
+from session_store import DatabaseSessionInterface
 
 class AuthManager:
     def __init__(self, app):
         self.app = app
+        self.user_cache = UserCache.from_env()
+        self.admin_emails = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()}
         self.oauth_available = OAUTH_AVAILABLE
         if OAUTH_AVAILABLE:
             self.oauth = OAuth(app)
@@ -61,6 +65,19 @@ class AuthManager:
         decorated_function.__name__ = f.__name__
         return decorated_function
     
+    def admin_required(self, f):
+        """Decorator to restrict a route to the users listed in ADMIN_EMAILS"""
+        def decorated_function(*args, **kwargs):
+            if not self.is_admin():
+                return jsonify({'error': 'Admin access required'}), 403
+            return f(*args, **kwargs)
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    
+    def is_admin(self):
+        """Check if the signed-in user's email is listed in ADMIN_EMAILS"""
+        return self.is_authenticated() and session['user_email'].lower() in self.admin_emails
+    
     def is_authenticated(self):
         """Check if user is authenticated"""
         return 'user_id' in session and 'user_email' in session
@@ -70,46 +87,61 @@ class AuthManager:
         return self.is_authenticated() or session.get('guest_mode', False)
     
     def get_current_user(self):
-        """Get current user from session"""
+        """Get current user from session, as a detached UserSnapshot.
+
+        Memoized on flask.g for the request and in the process-wide user cache for
+        USER_CACHE_TTL seconds, so steady-state page renders don't query the database.
+        """
         if not self.is_authenticated():
             return None
         
-        try:
-            db_session = DBSession()
-            user = db_session.query(User).filter_by(id=session['user_id']).first()
-            db_session.close()
+        user_id = session['user_id']
+        user = g.get('current_user')
+        if user is not None and user.id == user_id:
             return user
-        except Exception as e:
-            logger.error(f"Error getting current user: {str(e)}")
-            return None
+        
+        user = self.user_cache.get(user_id)
+        if user is None:
+            try:
+                row = RequestSession().get(User, user_id)
+            except Exception as e:
+                logger.error(f"Error getting current user: {str(e)}")
+                return None
+            if row is None:
+                return None
+            user = snapshot_user(row)
+            self.user_cache.set(user)
+        g.current_user = user
+        return user
+    
+    def refresh_current_user(self):
+        """Drop the cached copy of the current user and load it again from the database."""
+        if self.is_authenticated():
+            self.user_cache.invalidate(session['user_id'])
+        g.pop('current_user', None)
+        return self.get_current_user()
     
     def get_current_user_with_avatar(self):
         """Get current user from session with avatar fallback"""
-        if not self.is_authenticated():
-            return None
+        user = self.get_current_user()
         
-        try:
-            db_session = DBSession()
-            user = db_session.query(User).filter_by(id=session['user_id']).first()
-            
-            # Ensure session has latest avatar info
-            if user and user.avatar_url and session.get('user_avatar') != user.avatar_url:
-                session['user_avatar'] = user.avatar_url
-                logger.debug(f"Updated session avatar from DB: {user.avatar_url}")
-            
-            db_session.close()
-            return user
-        except Exception as e:
-            logger.error(f"Error getting current user with avatar: {str(e)}")
-            return None
+        # Ensure session has latest avatar info
+        if user and user.avatar_url and session.get('user_avatar') != user.avatar_url:
+            session['user_avatar'] = user.avatar_url
+            logger.debug("Updated session avatar from DB for user %s", user.id)
+        
+        return user
     
     def login_user(self, user_data, provider):
         """Login or create user from OAuth data"""
         try:
-            # Clear any existing session data first
+            # Clear any existing session data first, under a fresh session id
             session.clear()
+            regenerate = getattr(session, 'regenerate', None)
+            if regenerate is not None:
+                regenerate()
             
-            db_session = DBSession()
+            db_session = RequestSession()
             
             # Check if user exists by email first (regardless of provider_id)
             user = db_session.query(User).filter_by(
@@ -156,18 +188,17 @@ class AuthManager:
             # Clear any guest mode flags
             session.pop('guest_mode', None)
             
-            # Debug session information
-            logger.debug(f"Setting session - User ID: {user.id}, Avatar URL: {user.avatar_url}")
-            logger.debug(f"Session after login: {dict(session)}")
+            # Replace any cached copy with the freshly written row
+            g.current_user = snapshot_user(user)
+            self.user_cache.set(g.current_user)
+            
+            logger.debug("Setting session - User ID: %s, Avatar URL: %s", user.id, user.avatar_url)
             
-            db_session.close()
             return user
             
         except Exception as e:
             logger.error(f"Error logging in user: {str(e)}")
-            if 'db_session' in locals():
-                db_session.rollback()
-                db_session.close()
+            RequestSession().rollback()
             return None
     
     def logout_user(self):
@@ -202,7 +233,7 @@ class AuthManager:
                 return jsonify({'error': 'Not authenticated'}), 401
             
             try:
-                user = self.get_current_user()
+                user = self.refresh_current_user()
                 if user:
                     # Update session with latest database values
                     session['user_name'] = user.name
@@ -268,7 +299,7 @@ class AuthManager:
                     'redirect_uri': 'http://localhost:5000/auth/google/callback'
                 }
                 
-                token_response = requests.post('https://oauth2.googleapis.com/token', data=token_data)
+                token_response = http_client.post('https://oauth2.googleapis.com/token', data=token_data)
                 token_json = token_response.json()
                 
                 if 'access_token' not in token_json:
@@ -278,10 +309,10 @@ class AuthManager:
                 
                 # Get user info using the access token
                 headers = {'Authorization': f'Bearer {token_json["access_token"]}'}
-                resp = requests.get('https://www.googleapis.com/oauth2/v3/userinfo', headers=headers)
+                resp = http_client.get('https://www.googleapis.com/oauth2/v3/userinfo', headers=headers)
                 user_data = resp.json()
                 
-                logger.debug(f"Google user data received: {user_data}")
+                logger.debug("Google user data received for %s", user_data.get('email'))
                 
                 if not user_data or not user_data.get('email'):
                     flash('Failed to get user information from provider.', 'error')
@@ -324,13 +355,20 @@ def init_auth(app):
     """Initialize authentication for the Flask app"""
     # Set up session configuration
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_hex(32))
-    app.config['SESSION_TYPE'] = 'filesystem'
-    app.config['SESSION_PERMANENT'] = False
-    app.config['SESSION_USE_SIGNER'] = True
-    app.config['SESSION_FILE_THRESHOLD'] = 500
     
-    # Initialize Flask-Session if available
-    if FLASK_SESSION_AVAILABLE:
+    # database (default): signed-in sessions in the server_sessions table, guests in the signed cookie
+    # filesystem: Flask-Session's file store; cookie: everything in Flask's signed cookie
+    backend = os.getenv('SESSION_BACKEND', 'database').lower()
+    if backend == 'database':
+        session_store = DatabaseSessionInterface.from_env()
+        app.session_interface = session_store
+        session_store.start_sweeper()
+        logger.info("Using database-backed sessions")
+    elif backend == 'filesystem' and FLASK_SESSION_AVAILABLE:
+        app.config['SESSION_TYPE'] = 'filesystem'
+        app.config['SESSION_PERMANENT'] = False
+        app.config['SESSION_USE_SIGNER'] = True
+        app.config['SESSION_FILE_THRESHOLD'] = 500
         try:
             from flask_session import Session
             Session(app)
@@ -338,7 +376,7 @@ def init_auth(app):
         except Exception as e:
             logger.warning(f"Failed to initialize Flask-Session: {e}")
     else:
-        logger.info("Using basic Flask sessions (Flask-Session not available)")
+        logger.info("Using basic Flask sessions (signed cookies)")
     
     # Create auth manager
     auth_manager = AuthManager(app)
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+MIN_AVATAR_BYTES = 100  # Anything smaller is an error page or a broken image
+
+class AvatarEntry:
+    """A cached avatar image plus the validators needed to revalidate it against the origin."""
+
+    def __init__(self, content, content_type, origin_etag=None, origin_last_modified=None, fetched_at=None):
+        self.content = content
+        self.content_type = content_type
+        self.origin_etag = origin_etag
+        self.origin_last_modified = origin_last_modified
+        self.fetched_at = fetched_at or time.time()
+        # ETag we hand to browsers; derived from the bytes so it survives restarts
+        self.etag = hashlib.sha256(content).hexdigest()[:32]
+
+    def metadata(self):
+        return {
+            'content_type': self.content_type,
+            'origin_etag': self.origin_etag,
+            'origin_last_modified': self.origin_last_modified,
+            'fetched_at': self.fetched_at
+        }
+
+class AvatarCache:
+    """Two-tier avatar cache (memory LRU + size-capped disk store) keyed by user id and avatar URL.
+
+    Entries younger than ttl are served without contacting the origin. Older entries within
+    stale_ttl are served immediately while a background conditional request revalidates them;
+    anything older is revalidated synchronously, falling back to the stale copy if the origin fails.
+    """
+
+    def __init__(self, http_client, cache_dir='avatar_cache', ttl=3600, stale_ttl=7 * 24 * 3600,
+                 memory_items=512, max_disk_bytes=50 * 1024 * 1024, timeout=15):
+        self.http_client = http_client
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.timeout = timeout
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._revalidating = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='avatar-revalidate')
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, http_client):
+        """Build a cache configured from AVATAR_CACHE_* environment variables."""
+        return cls(
+            http_client,
+            cache_dir=os.getenv('AVATAR_CACHE_DIR', 'avatar_cache'),
+            ttl=int(os.getenv('AVATAR_CACHE_TTL', '3600')),
+            stale_ttl=int(os.getenv('AVATAR_STALE_TTL', str(7 * 24 * 3600))),
+            memory_items=int(os.getenv('AVATAR_CACHE_MEMORY_ITEMS', '512')),
+            max_disk_bytes=int(float(os.getenv('AVATAR_CACHE_MAX_MB', '50')) * 1024 * 1024)
+        )
+
+    @staticmethod
+    def make_key(user_id, avatar_url):
+        return hashlib.sha256(f"{user_id}:{avatar_url}".encode('utf-8')).hexdigest()
+
+    def get(self, user_id, avatar_url, headers=None, cookies=None):
+        """Return an AvatarEntry for the user's avatar, or None if it can't be obtained."""
+        key = self.make_key(user_id, avatar_url)
+        entry = self._load(key)
+        if entry is not None:
+            age = time.time() - entry.fetched_at
+            if age < self.ttl:
+                return entry
+            if age < self.ttl + self.stale_ttl:
+                self._revalidate_in_background(key, avatar_url, entry, headers, cookies)
+                return entry
+
+        try:
+            return self._fetch(key, avatar_url, entry, headers, cookies)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Network error fetching avatar: {str(e)}")
+            if entry is not None:
+                logger.info(f"Serving stale avatar for user {user_id} after origin failure")
+            return entry
+
+    def _fetch(self, key, avatar_url, entry, headers, cookies):
+        """Fetch or conditionally revalidate an avatar from the origin and store the result."""
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.origin_etag:
+                request_headers['If-None-Match'] = entry.origin_etag
+            if entry.origin_last_modified:
+                request_headers['If-Modified-Since'] = entry.origin_last_modified
+
+        response = self.http_client.get(avatar_url, headers=request_headers, cookies=cookies,
+                                        timeout=self.timeout, allow_redirects=True)
+
+        if response.status_code == 304 and entry is not None:
+            entry.fetched_at = time.time()
+            self._store(key, entry, write_content=False)
+            logger.debug(f"Avatar revalidated (304): {avatar_url}")
+            return entry
+
+        if response.status_code == 200 and len(response.content) > MIN_AVATAR_BYTES:
+            content_type = response.headers.get('content-type', 'image/jpeg')
+            if not content_type.startswith('image/'):
+                content_type = 'image/jpeg'  # Default fallback
+            new_entry = AvatarEntry(
+                response.content,
+                content_type,
+                origin_etag=response.headers.get('etag'),
+                origin_last_modified=response.headers.get('last-modified')
+            )
+            self._store(key, new_entry)
+            logger.info(f"Fetched avatar from origin: {avatar_url}")
+            return new_entry
+
+        logger.warning(f"Failed to fetch avatar: status={response.status_code}, content_length={len(response.content) if response.content else 0}")
+        return entry
+
+    def _revalidate_in_background(self, key, avatar_url, entry, headers, cookies):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def revalidate():
+            try:
+                self._fetch(key, avatar_url, entry, headers, cookies)
+            except Exception as e:
+                logger.warning(f"Background avatar revalidation failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        self._executor.submit(revalidate)
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.img', base + '.json'
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+
+        image_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            with open(image_path, 'rb') as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+
+        entry = AvatarEntry(content, meta['content_type'], meta.get('origin_etag'),
+                            meta.get('origin_last_modified'), meta.get('fetched_at'))
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _store(self, key, entry, write_content=True):
+        self._remember(key, entry)
+        image_path, meta_path = self._paths(key)
+        try:
+            if write_content:
+                tmp_path = f"{image_path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(entry.content)
+                os.replace(tmp_path, image_path)
+            tmp_path = f"{meta_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entry.metadata(), f)
+            os.replace(tmp_path, meta_path)
+        except OSError as e:
+            logger.error(f"Failed to write avatar to disk cache: {str(e)}")
+            return
+        if write_content:
+            self._enforce_disk_limit()
+
+    def _enforce_disk_limit(self):
+        """Delete least recently written avatars until the disk store is under max_disk_bytes."""
+        try:
+            files = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.img'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, name[:-4]))
+                total += stat.st_size
+            for _, size, key in sorted(files):
+                if total <= self.max_disk_bytes:
+                    break
+                for path in self._paths(key):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+        except OSError as e:
+            logger.error(f"Failed to enforce avatar disk cache limit: {str(e)}")
@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the text pipeline hot paths.
+
+Usage:
+    python benchmark.py cleaning [--size-mb 8] [--repeat 5]
+    python benchmark.py extraction [--pages 1 20 100 300] [--pdf-dir DIR] [--repeat 3]
+    python benchmark.py sqlite-writes [--processes 4] [--threads 4] [--seconds 10] [--baseline]
+    python benchmark.py suite [--pages 1 20 100 500] [--output results.json] [--compare baseline.json]
+    python benchmark.py local-summarizer [--model fine_tuned_bart | --random large] [--clients 8] [--max-batch 1 8]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import glob
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import threading
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+
+from text_processing import clean_text_preserve_equations, clean_pages
+from pdf_extraction import PyPDF2Backend, PyMuPDFBackend, PYMUPDF_AVAILABLE, pymupdf
+from fake_gemini import FakeGeminiModel
+
+WORDS = (
+    "the model we propose a novel method for learning representations of data results show that "
+    "our approach outperforms baseline methods on benchmark datasets with significant improvements in "
+    "accuracy and efficiency diffusion transformer attention gradient loss function training inference"
+).split()
+
+ARTIFACTS = [
+    lambda rng: f"arXiv:{rng.randint(1000, 2599)}.{rng.randint(10000, 99999)}v{rng.randint(1, 4)}",
+    lambda rng: f"PACS number(s): {rng.randint(10, 99)}.{rng.randint(10, 99)}.Hk",
+    lambda rng: f"[Fig.{rng.randint(1, 12)}]",
+    lambda rng: f"[ Table.{rng.randint(1, 6)} ]",
+    lambda rng: f"10.{rng.randint(1000, 9999)}.PhysRev{rng.randint(1, 99)}",
+    lambda rng: "equa-\ntion",
+    lambda rng: "state-of-the-art",
+    lambda rng: "well- known",
+    lambda rng: "where:\n$$E = mc^2 + //sqrt{x}$$",
+    lambda rng: "$\\alpha_t = \\prod_{s=1}^{t}(1 - \\beta_s)$",
+    lambda rng: "\t\t",
+    lambda rng: "\n\n\n",
+]
+
+def synthetic_paper_text(pages, seed=0, chars_per_page=3000):
+    """Deterministic paper-like text with the artifacts the cleaner targets."""
+    rng = random.Random(seed)
+    out = []
+    for page in range(pages):
+        out.append(f"{page + 1} Section {page + 1}\n")
+        size = 0
+        while size < chars_per_page:
+            if rng.random() < 0.04:
+                token = rng.choice(ARTIFACTS)(rng)
+            else:
+                token = rng.choice(WORDS)
+            out.append(token)
+            out.append('\n' if rng.random() < 0.08 else ' ')
+            size += len(token) + 1
+        out.append('\n')
+    return ''.join(out)
+
+def legacy_clean_text(text):
+    """The original multi-pass cleaner, with its two bugs fixed, used as the golden reference.
+
+    Fixes: the "- " removal that mangled text is dropped, and the //sqrt replacement
+    template is escaped (r'\\sqrt' raised re.error, so the original never got past it).
+    """
+    text = re.sub(r'arXiv:\d+\.\d+[vV]\d*', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\bpacs\s*number\(s\)\s*:[^\n]*', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\[\s*[fF]ig\.\w+\s*\]', '', text)
+    text = re.sub(r'\[\s*[tT]able\.\w+\s*\]', '', text)
+    text = re.sub(r'\b\d+\.\d+\.\w+\b', '', text)
+    text = text.replace("-\n", "")
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\n+', '\n', text)
+    text = re.sub(r'//sqrt', r'\\sqrt', text)
+    text = re.sub(r':\s*(\$\$)', r'\1', text)
+    return text.strip()
+
+def best_time(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_cleaning(args):
+    """Check the cleaner against the golden reference, then report throughput in MB/s."""
+    failures = 0
+    for seed in range(20):
+        text = synthetic_paper_text(pages=5, seed=seed)
+        expected = legacy_clean_text(text)
+        if clean_text_preserve_equations(text)[0] != expected:
+            print(f"MISMATCH: clean_text_preserve_equations, corpus seed {seed}")
+            failures += 1
+        pages = text.split('\n\n')
+        if clean_pages(pages)[0] != legacy_clean_text('\n'.join(pages)):
+            print(f"MISMATCH: clean_pages, corpus seed {seed}")
+            failures += 1
+    print(f"Golden corpus: {40 - failures}/40 outputs identical")
+
+    pages = int(args.size_mb * 1024 * 1024 / 3000)
+    text = synthetic_paper_text(pages=pages, seed=1234)
+    page_list = text.split('\n\n')
+    mb = len(text.encode('utf-8')) / (1024 * 1024)
+    print(f"\nThroughput on {mb:.1f} MB ({pages} pages), best of {args.repeat}:")
+    for name, fn in [
+        ('legacy multi-pass', lambda: legacy_clean_text(text)),
+        ('clean_text_preserve_equations', lambda: clean_text_preserve_equations(text)),
+        ('clean_pages (per page)', lambda: clean_pages(page_list)),
+    ]:
+        elapsed = best_time(fn, args.repeat)
+        print(f"  {name:32s} {elapsed * 1000:8.1f} ms  {mb / elapsed:7.1f} MB/s")
+    return 1 if failures else 0
+
+def write_sample_pdf(path, pages, seed=0):
+    """Write a deterministic text-layer PDF of the given length with PyMuPDF."""
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        lines = [f"{page_number + 1} Section {page_number + 1}"]
+        for _ in range(45):
+            lines.append(' '.join(rng.choice(WORDS) for _ in range(12)))
+        page.insert_textbox(pymupdf.Rect(50, 50, 560, 800), '\n'.join(lines), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+def bench_extraction(args):
+    """Compare pages/sec of the local extraction backends on a set of sample PDFs."""
+    if not PYMUPDF_AVAILABLE:
+        print("PyMuPDF is not installed; it is needed to generate sample PDFs and for its backend")
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.pdf_dir:
+            pdf_paths = sorted(glob.glob(os.path.join(args.pdf_dir, '*.pdf')))
+        else:
+            pdf_paths = []
+            for pages in args.pages:
+                path = os.path.join(tmp_dir, f"sample_{pages}p.pdf")
+                write_sample_pdf(path, pages, seed=pages)
+                pdf_paths.append(path)
+
+        parallel = PyMuPDFBackend(workers=args.workers)
+        parallel.start_pool()
+        backends = [
+            ('pypdf2', PyPDF2Backend()),
+            ('pymupdf serial', PyMuPDFBackend(workers=1)),
+            (f"pymupdf {args.workers} procs", parallel),
+        ]
+        print(f"{'PDF':28s} {'pages':>6s}  " + '  '.join(f"{name:>20s}" for name, _ in backends))
+        for path in pdf_paths:
+            page_count = PyPDF2Backend().page_count(path)
+            row = []
+            for _, backend in backends:
+                backend.extract_pages(path)  # warm-up
+                elapsed = best_time(lambda: backend.extract_pages(path), args.repeat)
+                row.append(f"{page_count / elapsed:14.1f} pg/s")
+            print(f"{os.path.basename(path)[:28]:28s} {page_count:6d}  " + '  '.join(f"{cell:>20s}" for cell in row))
+    return 0
+
+def sqlite_write_worker(worker, threads, seconds, users, results):
+    """One process standing in for a Gunicorn worker: threads that save summaries, log users in and read history."""
+    from datetime import datetime
+    from sqlalchemy.exc import OperationalError
+    from db import Session, SummaryHistory, User
+
+    counts = {'writes': 0, 'reads': 0, 'locked': 0, 'errors': 0, 'max_write_ms': 0.0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def run(thread):
+        rng = random.Random(worker * 1000 + thread)
+        while time.monotonic() < deadline:
+            user_id = rng.randint(1, users)
+            started = time.perf_counter()
+            db_session = Session()
+            try:
+                roll = rng.random()
+                if roll < 0.5:
+                    summary = f"## Paper {rng.randint(1, 10**6)}\n\n" + ' '.join(rng.choice(WORDS) for _ in range(300))
+                    db_session.add(SummaryHistory(summary=summary, summary_html=summary, title='Paper',
+                                                  keywords='benchmark', user_id=user_id))
+                    db_session.commit()
+                    kind = 'writes'
+                elif roll < 0.7:
+                    user = db_session.get(User, user_id)
+                    user.last_login = datetime.utcnow()
+                    db_session.commit()
+                    kind = 'writes'
+                else:
+                    db_session.query(SummaryHistory).filter(SummaryHistory.user_id == user_id).order_by(
+                        SummaryHistory.created_at.desc()).limit(20).all()
+                    kind = 'reads'
+            except OperationalError as e:
+                db_session.rollback()
+                kind = 'locked' if 'locked' in str(e) or 'busy' in str(e) else 'errors'
+            finally:
+                db_session.close()
+            with lock:
+                counts[kind] += 1
+                if kind == 'writes':
+                    counts['max_write_ms'] = max(counts['max_write_ms'], (time.perf_counter() - started) * 1000)
+
+    pool = [threading.Thread(target=run, args=(thread,)) for thread in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put(counts)
+
+def bench_sqlite_writes(args):
+    """Hammer a scratch database from several processes at once and count 'database is locked' errors."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Workers import db with the environment set here, like app processes started with it
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'stress.db')}"
+        if args.baseline:
+            os.environ['SQLITE_TUNING'] = 'false'
+        from db import Session, User
+        db_session = Session()
+        db_session.add_all([User(email=f"user{i}@example.com", name=f"User {i}", provider_id=str(i))
+                            for i in range(1, args.users + 1)])
+        db_session.commit()
+        db_session.close()
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = [context.Process(target=sqlite_write_worker,
+                                     args=(worker, args.threads, args.seconds, args.users, results))
+                     for worker in range(args.processes)]
+        for process in processes:
+            process.start()
+        totals = {'writes': 0, 'reads': 0, 'locked': 0, 'errors': 0, 'max_write_ms': 0.0}
+        for _ in processes:
+            for key, value in results.get().items():
+                totals[key] = max(totals[key], value) if key == 'max_write_ms' else totals[key] + value
+        for process in processes:
+            process.join()
+        elapsed = args.seconds
+
+    config = 'defaults (rollback journal)' if args.baseline else 'tuned (WAL, synchronous=NORMAL, busy_timeout)'
+    print(f"SQLite {config}: {args.processes} processes x {args.threads} threads for {args.seconds}s")
+    print(f"  writes: {totals['writes']} ({totals['writes'] / elapsed:.0f}/s)  reads: {totals['reads']} "
+          f"({totals['reads'] / elapsed:.0f}/s)  slowest write: {totals['max_write_ms']:.0f} ms")
+    print(f"  'database is locked' errors: {totals['locked']}  other errors: {totals['errors']}")
+    return 1 if totals['locked'] or totals['errors'] else 0
+
+def time_runs(fn, repeat, min_run_ms=20):
+    """Time fn repeat times after a warm-up; returns best, median and mean per call in ms.
+
+    Fast functions are called in a loop until a run takes min_run_ms, like timeit, so timer
+    resolution and scheduling noise don't swamp them.
+    """
+    fn()
+    start = time.perf_counter()
+    fn()
+    warm_ms = (time.perf_counter() - start) * 1000
+    loops = max(1, int(min_run_ms / warm_ms)) if warm_ms else 1000
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        runs.append((time.perf_counter() - start) * 1000 / loops)
+    return {'best_ms': round(min(runs), 4), 'median_ms': round(statistics.median(runs), 4),
+            'mean_ms': round(statistics.mean(runs), 4), 'runs': repeat, 'loops': loops}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_pipeline(work_dir):
+    """Import the app against a scratch database, with the summary cache off and the fake summarizer."""
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(work_dir, 'suite.db')}",
+        'SUMMARY_CACHE_ENABLED': 'false',
+        'SUMMARIZER_BACKEND': 'fake',
+        'GEMINI_UPLOAD_SWEEP_SECONDS': '0',
+        'SESSION_SWEEP_SECONDS': '0',
+        'PROFILE_DIR': os.path.join(work_dir, 'profiles'),
+        'LOG_LEVEL': 'WARNING'
+    })
+    import app
+    return app
+
+def suite_corpus(args, corpus_dir):
+    """(name, text, pdf_path) per paper: generated papers of args.pages pages, plus any PDFs in --pdf-dir.
+
+    Generated PDFs are kept in corpus_dir and reused, so runs on different commits read the same bytes.
+    """
+    corpus = []
+    for pages in args.pages:
+        pdf_path = None
+        if PYMUPDF_AVAILABLE:
+            pdf_path = os.path.join(corpus_dir, f"synthetic_{pages}p.pdf")
+            if not os.path.exists(pdf_path):
+                write_sample_pdf(pdf_path, pages, seed=pages)
+        corpus.append((f"{pages}p", synthetic_paper_text(pages, seed=pages), pdf_path))
+    for pdf_path in sorted(glob.glob(os.path.join(args.pdf_dir, '*.pdf'))) if args.pdf_dir else []:
+        text = clean_pages(PyPDF2Backend().extract_pages(pdf_path))[0]
+        corpus.append((os.path.basename(pdf_path), text, pdf_path))
+    return corpus
+
+def suite_cases(app, text, pdf_path):
+    """(name, fn) for each hot path, run on one paper of the corpus."""
+    from extraction_router import ExtractionRouter
+    from summary_rendering import render_summary_html
+
+    response_text = FakeGeminiModel().generate_content(app.build_summary_prompt(text)).text
+    summary = app.format_summary_response(response_text, {})
+    cases = [
+        ('clean_text_preserve_equations', lambda: clean_text_preserve_equations(text)),
+        ('extract_title_from_text', lambda: app.extract_title_from_text(text)),
+        ('parse_summary_response', lambda: app.parse_summary_response(response_text, {})),
+        ('render_summary_html', lambda: render_summary_html(summary)),
+        ('save_summary_history', lambda: app.save_summary_history(summary, 'https://example.org/paper.pdf')),
+        ('process_text (fake Gemini)', lambda: app.process_text(text, {}))
+    ]
+    if pdf_path:
+        backends = ['pypdf2'] + (['pymupdf'] if PYMUPDF_AVAILABLE else [])
+        for backend in backends:
+            router = ExtractionRouter(None, mode='local', backend=backend)
+            cases.append((f"extract_pdf_local[{backend}]", lambda router=router: router.extract(pdf_path)))
+    return cases
+
+def compare_results(baseline, results, threshold):
+    """Print the median change of every case also in baseline. Returns the number of regressions."""
+    old = {(result['name'], result['corpus']): result for result in baseline['results']}
+    regressions = 0
+    print(f"\nAgainst {baseline.get('commit') or 'baseline'} (median, regression above +{threshold:.0%}):")
+    for result in results:
+        before = old.get((result['name'], result['corpus']))
+        if before is None or not before['median_ms']:
+            continue
+        change = result['median_ms'] / before['median_ms'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"  {result['name']:34s} {result['corpus']:>12s} {before['median_ms']:10.2f} -> "
+              f"{result['median_ms']:10.2f} ms  {change:+7.1%}{flag}")
+    return regressions
+
+def bench_suite(args):
+    """Time each hot path on every paper of the corpus, writing the results as JSON."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = args.corpus_dir or tmp_dir
+        os.makedirs(corpus_dir, exist_ok=True)
+        app = load_pipeline(tmp_dir)
+        results = []
+        print(f"{'case':34s} {'corpus':>12s} {'chars':>10s} {'best':>10s} {'median':>10s}")
+        for corpus_name, text, pdf_path in suite_corpus(args, corpus_dir):
+            for name, fn in suite_cases(app, text, pdf_path):
+                timing = time_runs(fn, args.repeat)
+                results.append(dict(name=name, corpus=corpus_name, chars=len(text), **timing))
+                print(f"{name:34s} {corpus_name:>12s} {len(text):10d} {timing['best_ms']:8.2f}ms {timing['median_ms']:8.2f}ms")
+
+    report = {
+        'suite': 'text-pipeline',
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {len(results)} results to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare_results(baseline, results, args.threshold) else 0
+    return 0
+
+# Shapes of randomly initialized BART models for the local summarizer benchmark: 'large' is
+# facebook/bart-large-cnn's (what the notebook fine-tunes), 'tiny' is for quick runs and tests
+RANDOM_BART_SIZES = {
+    'tiny': dict(vocab_size=None, d_model=32, encoder_layers=1, decoder_layers=1, encoder_attention_heads=2,
+                 decoder_attention_heads=2, encoder_ffn_dim=64, decoder_ffn_dim=64),
+    'large': dict(vocab_size=50264, d_model=1024, encoder_layers=12, decoder_layers=12, encoder_attention_heads=16,
+                  decoder_attention_heads=16, encoder_ffn_dim=4096, decoder_ffn_dim=4096)
+}
+
+def write_random_bart(path, size='tiny', seed=0):
+    """Save a randomly initialized BART summarization model, and a byte-level BPE tokenizer trained on
+    synthetic papers, to path; loads like the fine-tuned checkpoint. Its summaries are gibberish but
+    cost the same to generate as a trained model's of the same shape and length."""
+    import torch
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import BartConfig, BartForConditionalGeneration, BartTokenizerFast
+
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator([synthetic_paper_text(5, seed=seed + i) for i in range(3)], vocab_size=2000,
+                            special_tokens=['<s>', '<pad>', '</s>', '<unk>', '<mask>'])
+    tokenizer = BartTokenizerFast(tokenizer_object=bpe._tokenizer, bos_token='<s>', eos_token='</s>', cls_token='<s>',
+                                  sep_token='</s>', pad_token='<pad>', unk_token='<unk>', mask_token='<mask>')
+    shape = dict(RANDOM_BART_SIZES[size])
+    shape['vocab_size'] = shape['vocab_size'] or len(tokenizer)
+    config = BartConfig(max_position_embeddings=1024, pad_token_id=tokenizer.pad_token_id,
+                        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id,
+                        decoder_start_token_id=tokenizer.eos_token_id, forced_bos_token_id=tokenizer.bos_token_id,
+                        **shape)
+    torch.manual_seed(seed)
+    BartForConditionalGeneration(config).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return path
+
+def run_local_summarizer(model_path, texts, clients, quantize, max_batch_size, args):
+    """Send texts to a fresh local summarizer from clients concurrent threads; returns throughput and latency."""
+    from summarizers import Seq2SeqBackend
+
+    backend = Seq2SeqBackend(model_path, max_input_tokens=args.input_tokens, max_output_tokens=args.output_tokens,
+                             min_output_tokens=args.output_tokens, num_beams=args.num_beams, quantize=quantize,
+                             max_batch_size=max_batch_size, batch_wait=args.batch_wait_ms / 1000)
+    backend.generate(None, texts[0])  # Load the model and warm up
+    warm_up = backend.info()
+    work = list(texts)
+    latencies = []
+    output_tokens = []
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                if not work:
+                    return
+                text = work.pop()
+            started = time.perf_counter()
+            response = backend.generate(None, text, timeout=3600)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                output_tokens.append(response.usage_metadata.candidates_token_count)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    info = backend.info()
+    backend.close()
+    batches = info['batches'] - warm_up['batches']
+    return {
+        'clients': clients,
+        'int8': info['int8'],
+        'max_batch_size': max_batch_size,
+        'requests': len(latencies),
+        'seconds': round(elapsed, 2),
+        'requests_per_sec': round(len(latencies) / elapsed, 3),
+        'output_tokens_per_sec': round(sum(output_tokens) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000),
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000),
+        'avg_batch_size': round((info['requests'] - warm_up['requests']) / batches, 2) if batches else None
+    }
+
+def bench_local_summarizer(args):
+    """Throughput and latency of the local summarizer: float32 vs int8, one request per call vs micro-batches."""
+    import torch
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = args.model or write_random_bart(os.path.join(tmp_dir, f"random_bart_{args.random}"), args.random)
+        # Paper chunks of about --input-tokens each, as the map phase of a long paper sends them
+        texts = [synthetic_paper_text(1, seed=i, chars_per_page=args.input_tokens * 4) for i in range(args.requests)]
+        print(f"Model {args.model or 'random ' + args.random} on {torch.get_num_threads()} threads: {args.requests} requests "
+              f"of ~{args.input_tokens} tokens -> {args.output_tokens} tokens, {args.num_beams} beam(s)")
+        print(f"{'int8':>5s} {'batch':>5s} {'clients':>7s} {'req/s':>8s} {'tok/s':>8s} {'p50':>9s} {'p95':>9s} {'avg batch':>9s}")
+        results = []
+        for quantize in args.quantize:
+            for max_batch_size in args.max_batch:
+                for clients in args.clients:
+                    result = run_local_summarizer(model_path, texts, clients, quantize, max_batch_size, args)
+                    results.append(result)
+                    print(f"{str(result['int8']):>5s} {max_batch_size:5d} {clients:7d} {result['requests_per_sec']:8.3f} "
+                          f"{result['output_tokens_per_sec']:8.1f} {result['p50_ms']:7d}ms {result['p95_ms']:7d}ms "
+                          f"{result['avg_batch_size'] or 0:9.2f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'suite': 'local-summarizer', 'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                       'commit': git_commit(), 'platform': platform.platform(), 'config': {key: value for key, value in vars(args).items() if key != 'func'},
+                       'results': results}, f, indent=2)
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the text pipeline hot paths")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    cleaning = subparsers.add_parser('cleaning', help="text cleaning correctness and throughput")
+    cleaning.add_argument('--size-mb', type=float, default=8)
+    cleaning.add_argument('--repeat', type=int, default=5)
+    cleaning.set_defaults(func=bench_cleaning)
+
+    extraction = subparsers.add_parser('extraction', help="local PDF extraction backends, pages/sec")
+    extraction.add_argument('--pages', type=int, nargs='+', default=[1, 20, 100, 300])
+    extraction.add_argument('--pdf-dir', help="benchmark the PDFs in this directory instead of generated samples")
+    extraction.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 4))
+    extraction.add_argument('--repeat', type=int, default=3)
+    extraction.set_defaults(func=bench_extraction)
+
+    sqlite_writes = subparsers.add_parser('sqlite-writes', help="concurrent-write stress test of the database settings")
+    sqlite_writes.add_argument('--processes', type=int, default=4)
+    sqlite_writes.add_argument('--threads', type=int, default=4)
+    sqlite_writes.add_argument('--seconds', type=float, default=10)
+    sqlite_writes.add_argument('--users', type=int, default=50)
+    sqlite_writes.add_argument('--baseline', action='store_true', help="run without the SQLite tuning, for comparison")
+    sqlite_writes.set_defaults(func=bench_sqlite_writes)
+
+    suite = subparsers.add_parser('suite', help="hot paths on a 1-500 page corpus with a fake Gemini, as JSON")
+    suite.add_argument('--pages', type=int, nargs='+', default=[1, 20, 100, 500])
+    suite.add_argument('--pdf-dir', help="also run on the real PDFs in this directory")
+    suite.add_argument('--corpus-dir', help="keep the generated PDFs here and reuse them on later runs")
+    suite.add_argument('--repeat', type=int, default=5)
+    suite.add_argument('--output', help="write the results to this JSON file")
+    suite.add_argument('--compare', help="compare against the JSON results of an earlier run")
+    suite.add_argument('--threshold', type=float, default=0.10, help="median slowdown counted as a regression (raise it on shared or throttled machines)")
+    suite.set_defaults(func=bench_suite)
+
+    local = subparsers.add_parser('local-summarizer', help="local BART summarizer throughput and latency, float32 vs int8 and batched")
+    local.add_argument('--model', help="checkpoint to load, e.g. fine_tuned_bart; default is a randomly initialized BART")
+    local.add_argument('--random', choices=sorted(RANDOM_BART_SIZES), default='large', help="shape of the random model")
+    local.add_argument('--requests', type=int, default=16)
+    local.add_argument('--clients', type=int, nargs='+', default=[8])
+    local.add_argument('--max-batch', type=int, nargs='+', default=[1, 8])
+    local.add_argument('--quantize', type=lambda value: value.lower() == 'true', nargs='+', default=[False, True],
+                       help="true/false; both by default")
+    local.add_argument('--input-tokens', type=int, default=512)
+    local.add_argument('--output-tokens', type=int, default=64)
+    local.add_argument('--num-beams', type=int, default=1)
+    local.add_argument('--batch-wait-ms', type=float, default=10)
+    local.add_argument('--output', help="write the results to this JSON file")
+    local.set_defaults(func=bench_local_summarizer)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import re
+
+# Rough token estimate for English prose and LaTeX; avoids a count_tokens round trip per chunk
+CHARS_PER_TOKEN = 4
+
+SECTION_HEADING_RE = re.compile(
+    r'^(?:#{1,6}\s+\S'                                   # markdown headings from Gemini extraction
+    r'|(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+[A-Z][^.!?]{0,80}$'  # "3.2 Method", "IV. Results"
+    r'|(?:abstract|introduction|related work|background|methods?|methodology|experiments?|results'
+    r'|discussion|conclusions?|acknowledg(?:e)?ments?|references|appendix)\b[^.!?]{0,40}$)',
+    re.IGNORECASE
+)
+DISPLAY_MATH_OPEN_RE = re.compile(r'\\begin\{([a-zA-Z*]+)\}')
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z\\$])')
+
+def estimate_tokens(text):
+    """Estimate the number of model tokens in text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _equation_open(line, state):
+    """Track whether a display equation ($$...$$ or \\begin{env}...\\end{env}) is still open after line."""
+    if state is None:
+        if line.count('$$') % 2 == 1:
+            return '$$'
+        match = DISPLAY_MATH_OPEN_RE.search(line)
+        if match and f'\\end{{{match.group(1)}}}' not in line[match.end():]:
+            return match.group(1)
+        return None
+    if state == '$$':
+        return None if line.count('$$') % 2 == 1 else state
+    return None if f'\\end{{{state}}}' in line else state
+
+def split_blocks(text):
+    """Split text into (is_heading, block) pairs: one block per line, except that a display
+    equation spanning several lines stays in a single block."""
+    blocks = []
+    current = []
+    equation = None
+    for line in text.split('\n'):
+        if equation is None and SECTION_HEADING_RE.match(line.strip()):
+            blocks.append((True, line))
+            continue
+        current.append(line)
+        equation = _equation_open(line, equation)
+        if equation is None:
+            blocks.append((False, '\n'.join(current)))
+            current = []
+    if current:
+        blocks.append((False, '\n'.join(current)))
+    return [(is_heading, block) for is_heading, block in blocks if block.strip()]
+
+def _split_oversized(block, max_chars):
+    """Break a block that alone exceeds the budget at sentence boundaries, then hard-wrap."""
+    pieces = []
+    current = ''
+    for sentence in SENTENCE_END_RE.split(block):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_into_chunks(text, max_tokens):
+    """Split text into chunks of at most max_tokens (estimated), preferring section boundaries.
+
+    A section heading starts a new chunk once the current one is at least half full, so
+    chunks tend to line up with the paper's sections. Display equations are never split.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    current_len = 0
+
+    def flush():
+        nonlocal current, current_len
+        if current:
+            chunks.append('\n'.join(current).strip())
+        current = []
+        current_len = 0
+
+    heading = None
+    for is_heading, block in split_blocks(text):
+        if is_heading:
+            if current_len >= max_chars // 2:
+                flush()
+            # Keep a heading together with the block that follows it
+            heading = f"{heading}\n{block}" if heading else block
+            continue
+        if heading:
+            block = f"{heading}\n{block}"
+            heading = None
+        pieces = [block] if len(block) <= max_chars else _split_oversized(block, max_chars)
+        for piece in pieces:
+            if current_len + len(piece) + 1 > max_chars:
+                flush()
+            current.append(piece)
+            current_len += len(piece) + 1
+    if heading:
+        current.append(heading)
+    flush()
+    return [chunk for chunk in chunks if chunk]
@@ -1,10 +1,52 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+import os
+import logging
+from sqlalchemy import create_engine, event, Column, Integer, String, Text, DateTime, ForeignKey, Index
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship
 from datetime import datetime
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# db is imported before app.py loads .env, and DATABASE_URL has to be known here
+load_dotenv()
+
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///history.db')
+
+# Per-connection SQLite settings. WAL lets readers run alongside the single writer, and a
+# writer that finds the database locked waits up to busy_timeout instead of failing at once.
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', 'true').lower() not in ('0', 'false', 'no')
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable across crashes in WAL mode
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '10000'))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '32768'))
+
+def configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout first: switching the journal mode itself needs a lock
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        mode = cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}").fetchone()[0]
+        if mode.lower() != SQLITE_JOURNAL_MODE.lower():
+            logger.warning(f"SQLite journal_mode is {mode}, not {SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size = {-SQLITE_CACHE_SIZE_KB}")  # Negative means KiB rather than pages
+    finally:
+        cursor.close()
+
+def create_database_engine(url):
+    """create_engine, plus the SQLite connection settings above when url is an SQLite database."""
+    new_engine = create_engine(url)
+    if new_engine.dialect.name == 'sqlite' and SQLITE_TUNING:
+        event.listen(new_engine, 'connect', configure_sqlite)
+    return new_engine
 
 Base = declarative_base()
-engine = create_engine('sqlite:///history.db')
+engine = create_database_engine(DATABASE_URL)
+
+# Session gives a fresh session to code that manages its own (jobs, caches, background threads);
+# RequestSession is the one session of the current request, removed in app.teardown_appcontext
 Session = sessionmaker(bind=engine)
+RequestSession = scoped_session(Session)
 
 class User(Base):
     __tablename__ = 'users'
@@ -24,6 +66,10 @@ class SummaryHistory(Base):
     __tablename__ = 'summary_history'
     id = Column(Integer, primary_key=True)
     summary = Column(Text, nullable=False)
+    summary_html = Column(Text, nullable=True)  # Pre-rendered at save time; see summary_rendering.py
+    title = Column(String(500), nullable=True)  # Parsed from the summary at save time, for search
+    keywords = Column(Text, nullable=True)  # Comma-separated, parsed from the summary at save time
+    renderer_version = Column(Integer, nullable=True)  # RENDERER_VERSION that produced summary_html
     original_url = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -31,4 +77,57 @@ class SummaryHistory(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=True)  # Nullable for backward compatibility
     user = relationship("User", back_populates="summaries")
 
+    # Serves the per-user history, newest first, including the id tiebreaker of its keyset cursor
+    __table_args__ = (Index('ix_summary_history_user_created', 'user_id', 'created_at', 'id'),)
+
+class SummaryCacheEntry(Base):
+    __tablename__ = 'summary_cache'
+    cache_key = Column(String(64), primary_key=True)  # SHA-256 of content digest + prompt/model version
+    summary = Column(Text, nullable=False)  # Raw markdown summary, same format as SummaryHistory.summary
+    size_bytes = Column(Integer, nullable=False, default=0)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_accessed = Column(DateTime, default=datetime.utcnow, index=True)
+
+class GeminiUpload(Base):
+    __tablename__ = 'gemini_uploads'
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 of the uploaded PDF
+    file_name = Column(String(255), nullable=False)  # Gemini file resource name (files/...), used for deletion
+    file_uri = Column(String(500), nullable=False)
+    mime_type = Column(String(100), nullable=False, default='application/pdf')
+    size_bytes = Column(Integer, nullable=False, default=0)
+    use_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used = Column(DateTime, default=datetime.utcnow, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)  # When Gemini deletes the file (UTC)
+
+class ServerSession(Base):
+    __tablename__ = 'server_sessions'
+    sid = Column(String(64), primary_key=True)  # Random id; the cookie only carries it, signed
+    data = Column(Text, nullable=False)  # The Flask session, serialized with Flask's tagged JSON
+    user_id = Column(Integer, nullable=True, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)  # Deleted by the session sweeper once past
+
+class SummaryJob(Base):
+    __tablename__ = 'summary_jobs'
+    id = Column(String(36), primary_key=True)  # UUID4 handed to the client for polling
+    status = Column(String(20), nullable=False, default='queued', index=True)  # queued, running, done, failed
+    stage = Column(String(50), nullable=False, default='queued')  # downloading, extracting, summarizing, saving, ...
+    input_type = Column(String(10), nullable=False)  # 'text', 'file' or 'url'
+    input_text = Column(Text, nullable=True)
+    file_path = Column(String(500), nullable=True)  # Uploaded file kept on disk until the job finishes
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the upload, computed while it was saved
+    original_url = Column(String, nullable=True)
+    options = Column(Text, nullable=True)  # JSON of per-request pipeline options, e.g. the PDF summary mode
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    summary = Column(Text, nullable=True)  # Raw markdown result
+    error = Column(Text, nullable=True)
+    details = Column(Text, nullable=True)  # JSON reported by the pipeline, e.g. the extraction routing decision
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(64), nullable=True)  # Worker process that queued or runs the job; it heartbeats updated_at
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+    finished_at = Column(DateTime, nullable=True)
+
 Base.metadata.create_all(engine)
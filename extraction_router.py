@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import logging
+import threading
+
+from pdf_extraction import get_backend
+from text_processing import clean_pages
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_MODES = ('auto', 'local', 'gemini')
+
+# A page with fewer non-whitespace characters than this counts as empty (scanned, or a figure)
+EMPTY_PAGE_CHARS = 50
+
+WORD_TOKEN_PATTERN = re.compile(r"""(?<!\S)[(\["']?[A-Za-z][a-z'-]*[.,;:!?)\]"']*(?!\S)""")
+NON_PRINTABLE_PATTERN = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f\ufffd]')
+# (cid:NN) is what broken font encodings extract as; private-use glyphs and long symbol runs are the same story
+GARBAGE_PATTERN = re.compile(r'\(cid:\d+\)|[\ue000-\uf8ff]|[^\w\s]{8,}')
+# Greek, arrows, super/subscripts, math operators and math alphanumerics: equations flattened into glyphs
+EQUATION_GLYPH_PATTERN = re.compile(
+    r'[\u0370-\u03ff\u2070-\u209f\u2190-\u21ff\u2200-\u22ff\u27c0-\u27ef\u2980-\u2aff\U0001d400-\U0001d7ff]'
+)
+
+def score_text_layer(pages):
+    """Measure the quality of a PDF's extracted text layer from its raw page texts."""
+    text = '\n'.join(pages)
+    page_count = len(pages)
+    chars = len(text)
+    non_whitespace = chars - sum(text.count(c) for c in ' \n\t')
+    tokens = len(text.split())
+    return {
+        'pages': page_count,
+        'chars': chars,
+        'chars_per_page': round(non_whitespace / page_count, 1) if page_count else 0.0,
+        'empty_page_ratio': round(sum(1 for page in pages if len(''.join(page.split())) < EMPTY_PAGE_CHARS) / page_count, 4) if page_count else 1.0,
+        'printable_ratio': round(1 - len(NON_PRINTABLE_PATTERN.findall(text)) / chars, 4) if chars else 0.0,
+        'word_ratio': round(len(WORD_TOKEN_PATTERN.findall(text)) / tokens, 4) if tokens else 0.0,
+        'garbage_ratio': round(sum(len(m) for m in GARBAGE_PATTERN.findall(text)) / chars, 4) if chars else 0.0,
+        'equation_glyph_density': round(len(EQUATION_GLYPH_PATTERN.findall(text)) / chars, 4) if chars else 0.0
+    }
+
+class ExtractionDecision:
+    """Which extraction path a PDF took, why, the text-layer scores behind it, and per-step timings."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        # 'local', 'gemini', 'local_fallback' (Gemini failed after escalation) or 'local_rejected' (not escalated)
+        self.method = None
+        self.backend = None
+        self.reasons = []
+        self.metrics = {}
+        self.timings_ms = {}
+
+    def time(self, step, start):
+        self.timings_ms[step] = round((time.perf_counter() - start) * 1000, 1)
+
+    def to_dict(self):
+        return {
+            'mode': self.mode,
+            'method': self.method,
+            'backend': self.backend,
+            'reasons': self.reasons,
+            'metrics': self.metrics,
+            'timings_ms': self.timings_ms
+        }
+
+class ExtractionRouter:
+    """Extracts PDFs locally and escalates to remote (Gemini) extraction only when the text layer is poor.
+
+    In 'auto' mode the local text is scored and kept if every check passes; 'local' never escalates
+    and 'gemini' always does. If remote extraction fails, the local text is used when there is any.
+    """
+
+    def __init__(self, remote_extract, mode='auto', backend=None, min_chars_per_page=300,
+                 max_empty_page_ratio=0.3, min_printable_ratio=0.98, min_word_ratio=0.5,
+                 max_garbage_ratio=0.02, max_equation_density=0.05):
+        if mode not in EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode: {mode}")
+        self.remote_extract = remote_extract
+        self.mode = mode
+        self.backend = backend
+        self.min_chars_per_page = min_chars_per_page
+        self.max_empty_page_ratio = max_empty_page_ratio
+        self.min_printable_ratio = min_printable_ratio
+        self.min_word_ratio = min_word_ratio
+        self.max_garbage_ratio = max_garbage_ratio
+        self.max_equation_density = max_equation_density
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, remote_extract):
+        """Build a router configured from EXTRACTION_* environment variables."""
+        return cls(
+            remote_extract,
+            mode=os.getenv('EXTRACTION_MODE', 'auto').lower(),
+            min_chars_per_page=float(os.getenv('EXTRACTION_MIN_CHARS_PER_PAGE', '300')),
+            max_empty_page_ratio=float(os.getenv('EXTRACTION_MAX_EMPTY_PAGE_RATIO', '0.3')),
+            min_printable_ratio=float(os.getenv('EXTRACTION_MIN_PRINTABLE_RATIO', '0.98')),
+            min_word_ratio=float(os.getenv('EXTRACTION_MIN_WORD_RATIO', '0.5')),
+            max_garbage_ratio=float(os.getenv('EXTRACTION_MAX_GARBAGE_RATIO', '0.02')),
+            max_equation_density=float(os.getenv('EXTRACTION_MAX_EQUATION_DENSITY', '0.05'))
+        )
+
+    def assess(self, metrics):
+        """Return the list of quality checks the metrics fail; empty means the text layer is usable."""
+        checks = [
+            (metrics['chars_per_page'] < self.min_chars_per_page, 'too_few_chars_per_page'),
+            (metrics['empty_page_ratio'] > self.max_empty_page_ratio, 'too_many_empty_pages'),
+            (metrics['printable_ratio'] < self.min_printable_ratio, 'non_printable_chars'),
+            (metrics['word_ratio'] < self.min_word_ratio, 'few_word_tokens'),
+            (metrics['garbage_ratio'] > self.max_garbage_ratio, 'garbage_glyphs'),
+            (metrics['equation_glyph_density'] > self.max_equation_density, 'equation_heavy')
+        ]
+        return [reason for failed, reason in checks if failed]
+
+    def extract(self, pdf_path, content_hash=None, escalate=True, remote_extract=None, mode=None):
+        """Extract a PDF's text. Returns (text, equation_placeholders, ExtractionDecision); text starts with
+        'Error' if nothing could be extracted.
+
+        With escalate=False a text layer that fails the checks is returned as is with method
+        'local_rejected', leaving the caller to choose another path (e.g. direct PDF summarization).
+        remote_extract and mode override the router's remote extraction and mode for this call.
+        """
+        remote_extract = remote_extract or self.remote_extract
+        mode = mode or self.mode
+        decision = ExtractionDecision(mode)
+        started = time.perf_counter()
+        text = None
+        equation_placeholders = {}
+
+        if mode != 'gemini':
+            try:
+                step = time.perf_counter()
+                extraction_backend = get_backend(self.backend)
+                decision.backend = extraction_backend.name
+                pages = extraction_backend.extract_pages(pdf_path)
+                decision.time('local', step)
+
+                step = time.perf_counter()
+                decision.metrics = score_text_layer(pages)
+                decision.reasons = self.assess(decision.metrics)
+                decision.time('scoring', step)
+
+                step = time.perf_counter()
+                text, equation_placeholders = clean_pages(pages)
+                decision.time('cleaning', step)
+            except Exception as e:
+                logger.error(f"Local extraction failed: {str(e)}")
+                decision.reasons = ['local_extraction_failed']
+
+            if mode == 'local' or not decision.reasons:
+                decision.method = 'local'
+        else:
+            decision.reasons = ['mode_gemini']
+
+        if decision.method is None and not escalate:
+            decision.method = 'local_rejected'
+        elif decision.method is None:
+            step = time.perf_counter()
+            try:
+                text, equation_placeholders = remote_extract(pdf_path, content_hash=content_hash)
+                decision.method = 'gemini'
+                decision.time('gemini', step)
+            except Exception as e:
+                decision.time('gemini', step)
+                logger.error(f"Failed to extract text with Gemini: {str(e)}")
+                decision.method = 'local_fallback'
+                if text is None and mode == 'gemini':
+                    step = time.perf_counter()
+                    try:
+                        text, equation_placeholders = clean_pages(get_backend(self.backend).extract_pages(pdf_path))
+                    except Exception as local_error:
+                        logger.error(f"Local extraction failed: {str(local_error)}")
+                    decision.time('fallback', step)
+
+        decision.time('total', started)
+        self._record(decision)
+        logger.info(f"Extraction decision for {pdf_path}: {decision.method} "
+                    f"(reasons={decision.reasons}, metrics={decision.metrics}, timings_ms={decision.timings_ms})")
+
+        if not text:
+            return "Error: No text extracted from PDF. The PDF may be scanned or encrypted. Consider using OCR.", {}, decision
+        return text, equation_placeholders, decision
+
+    def _record(self, decision):
+        with self._lock:
+            stats = self._stats.setdefault(decision.method, {'count': 0, 'total_ms': 0.0, 'reasons': {}})
+            stats['count'] += 1
+            stats['total_ms'] += decision.timings_ms.get('total', 0.0)
+            for reason in decision.reasons:
+                stats['reasons'][reason] = stats['reasons'].get(reason, 0) + 1
+
+    def metrics(self):
+        """Return decision counts, average latency and escalation reasons per extraction method."""
+        with self._lock:
+            return {
+                method: {
+                    'count': stats['count'],
+                    'avg_ms': round(stats['total_ms'] / stats['count'], 1),
+                    'reasons': dict(stats['reasons'])
+                }
+                for method, stats in self._stats.items()
+            }
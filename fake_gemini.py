@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+A deterministic stand-in for Gemini, for benchmarks and load tests that must run offline.
+
+The same prompt always gets the same response: a summary in the format the summarization prompt
+asks for (TITLE/SUMMARY/KEYWORDS, with an equation), sized by the length of the prompt.
+FakeGeminiModel replaces the model in-process; FakeGeminiServer serves the REST API's
+generateContent and streamGenerateContent, for an app started with GEMINI_API_ENDPOINT.
+
+Usage:
+    python fake_gemini.py [--port 8765] [--latency-ms 800] [--tokens-per-sec 200] [--error-rate 0] [--rate-limit-rate 0]
+"""
+
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "we propose a method for learning representations that improves accuracy and efficiency on benchmark "
+    "datasets results show the model outperforms strong baselines using attention diffusion gradient training"
+).split()
+
+def prompt_text(contents):
+    """The text parts of generate_content's contents (a string, or a list of strings and file parts)."""
+    if isinstance(contents, str):
+        return contents
+    return '\n'.join(part for part in contents if isinstance(part, str))
+
+def fake_response_text(prompt, min_words=120, max_words=900):
+    """A deterministic summary of the prompt, in the TITLE/SUMMARY/KEYWORDS format."""
+    rng = random.Random(hashlib.sha256(prompt.encode('utf-8')).digest())
+    words = max(min_words, min(max_words, len(prompt) // 40))
+    paragraphs = []
+    while words > 0:
+        size = min(words, rng.randint(40, 90))
+        paragraphs.append(' '.join(rng.choice(WORDS) for _ in range(size)).capitalize() + '.')
+        words -= size
+    paragraphs[0] += " The objective is $\\mathcal{L} = \\sum_i \\log p(x_i)$."
+    title = ' '.join(rng.choice(WORDS) for _ in range(6)).title()
+    keywords = ', '.join(sorted({rng.choice(WORDS) for _ in range(6)}))
+    return f"TITLE: {title}\nSUMMARY: " + '\n\n'.join(paragraphs) + f"\nKEYWORDS: {keywords}"
+
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+class FakeResponse:
+    """Quacks like a GenerateContentResponse (or one chunk of a streamed one)."""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class FakeGeminiModel:
+    """Drop-in for genai.GenerativeModel.generate_content; calls made are counted in .calls."""
+
+    def __init__(self, chunk_chars=200):
+        self.chunk_chars = chunk_chars
+        self.calls = 0
+
+    def generate_content(self, contents, generation_config=None, request_options=None, stream=False):
+        self.calls += 1
+        prompt = prompt_text(contents)
+        text = fake_response_text(prompt)
+        usage = FakeUsage(len(prompt) // 4, len(text) // 4)
+        if not stream:
+            return FakeResponse(text, usage)
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        return [FakeResponse(chunk, usage if i == len(chunks) - 1 else None) for i, chunk in enumerate(chunks)]
+
+def response_json(text, usage=None):
+    """A GenerateContentResponse (or one streamed chunk of it) in the REST API's JSON."""
+    response = {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'index': 0}]}
+    if usage is not None:
+        response['candidates'][0]['finishReason'] = 'STOP'
+        response['usageMetadata'] = {
+            'promptTokenCount': usage.prompt_token_count,
+            'candidatesTokenCount': usage.candidates_token_count,
+            'totalTokenCount': usage.prompt_token_count + usage.candidates_token_count
+        }
+    return response
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    """Serves generateContent/streamGenerateContent with configurable latency, token rate and failures.
+
+    latency is the time to the first token; the rest of the response is paced at tokens_per_sec.
+    error_rate of the calls fail with a 500 and rate_limit_rate with a 429, both before any output,
+    which the app's retries see as InternalServerError and TooManyRequests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.8, tokens_per_sec=200.0, error_rate=0.0,
+                 rate_limit_rate=0.0, seed=0):
+        super().__init__(address, FakeGeminiHandler)
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'calls': 0, 'errors': 0, 'rate_limited': 0}
+
+    @property
+    def endpoint(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-gemini', daemon=True).start()
+        return self
+
+    def outcome(self):
+        """'error', 'rate_limited' or 'ok' for the next call."""
+        with self.lock:
+            self.counts['calls'] += 1
+            roll = self.rng.random()
+            if roll < self.error_rate:
+                self.counts['errors'] += 1
+                return 'error'
+            if roll < self.error_rate + self.rate_limit_rate:
+                self.counts['rate_limited'] += 1
+                return 'rate_limited'
+            return 'ok'
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    chunk_tokens = 20
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        prompt = '\n'.join(part.get('text', '') for content in body.get('contents', [])
+                           for part in content.get('parts', []))
+        outcome = self.server.outcome()
+        if outcome == 'error':
+            return self.send_error_json(500, 'INTERNAL', 'Injected fake Gemini failure')
+        if outcome == 'rate_limited':
+            return self.send_error_json(429, 'RESOURCE_EXHAUSTED', 'Injected fake Gemini rate limit')
+
+        text = fake_response_text(prompt)
+        usage = FakeUsage(len(prompt) // 4, len(text) // 4)
+        chunk_chars = self.chunk_tokens * 4
+        chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        chunk_delay = self.chunk_tokens / self.server.tokens_per_sec if self.server.tokens_per_sec else 0
+        time.sleep(self.server.latency)
+
+        if ':streamGenerateContent' not in self.path:
+            time.sleep(chunk_delay * (len(chunks) - 1))
+            return self.send_json(200, response_json(text, usage))
+
+        # A JSON array written element by element, which the REST client parses as it arrives
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(chunk_delay)
+            last = i == len(chunks) - 1
+            element = json.dumps(response_json(chunk, usage if last else None))
+            self.wfile.write((('[' if i == 0 else ',') + element + (']' if last else '')).encode('utf-8'))
+            self.wfile.flush()
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, reason, message):
+        self.send_json(status, {'error': {'code': status, 'message': message, 'status': reason}})
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini REST server for offline load tests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=800)
+    parser.add_argument('--tokens-per-sec', type=float, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeGeminiServer((args.host, args.port), latency=args.latency_ms / 1000, tokens_per_sec=args.tokens_per_sec,
+                              error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    print(f"Fake Gemini on {server.endpoint}; start the app with GEMINI_API_ENDPOINT={server.endpoint}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import google.generativeai as genai
+
+from db import GeminiUpload
+from summary_cache import hash_file
+
+logger = logging.getLogger(__name__)
+
+class UploadMetrics:
+    """Counters for uploads made versus uploads avoided by reusing a live handle."""
+
+    def __init__(self):
+        self.uploads = 0
+        self.bytes_uploaded = 0
+        self.reuses = 0
+        self.bytes_saved = 0
+        self.invalidated = 0
+        self.deleted = 0
+
+    def to_dict(self):
+        return {
+            'uploads': self.uploads,
+            'bytes_uploaded': self.bytes_uploaded,
+            'reuses': self.reuses,
+            'bytes_saved': self.bytes_saved,
+            'invalidated': self.invalidated,
+            'deleted': self.deleted
+        }
+
+class UploadHandle:
+    """A Gemini file usable as a generate_content part."""
+
+    def __init__(self, content_hash, file_name, file_uri, mime_type, size_bytes, expires_at, reused=False):
+        self.content_hash = content_hash
+        self.file_name = file_name
+        self.file_uri = file_uri
+        self.mime_type = mime_type
+        self.size_bytes = size_bytes
+        self.expires_at = expires_at
+        self.reused = reused
+
+    def as_part(self):
+        return genai.protos.FileData(mime_type=self.mime_type, file_uri=self.file_uri)
+
+class GeminiUploadRegistry:
+    """Maps PDF content hashes to live Gemini file handles so the same bytes are uploaded once.
+
+    Handles are shared across retries, requests and worker processes through the gemini_uploads
+    table. A handle is reused while it has more than min_remaining left before Gemini expires it;
+    a background sweep deletes handles that have expired or gone unused for idle_ttl.
+    """
+
+    def __init__(self, session_factory, ttl=timedelta(hours=47), min_remaining=timedelta(minutes=30),
+                 idle_ttl=timedelta(hours=6), sweep_interval=600, enabled=True,
+                 upload_file=None, delete_file=None):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.min_remaining = min_remaining
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.enabled = enabled
+        self.upload_file = upload_file or genai.upload_file
+        self.delete_file = delete_file or genai.delete_file
+        self._metrics = UploadMetrics()
+        self._lock = threading.Lock()
+        self._hash_locks = {}
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, session_factory):
+        """Build a registry configured from GEMINI_UPLOAD_* environment variables."""
+        return cls(
+            session_factory,
+            ttl=timedelta(hours=float(os.getenv('GEMINI_UPLOAD_TTL_HOURS', '47'))),
+            min_remaining=timedelta(minutes=float(os.getenv('GEMINI_UPLOAD_MIN_REMAINING_MINUTES', '30'))),
+            idle_ttl=timedelta(hours=float(os.getenv('GEMINI_UPLOAD_IDLE_HOURS', '6'))),
+            sweep_interval=int(os.getenv('GEMINI_UPLOAD_SWEEP_SECONDS', '600')),
+            enabled=os.getenv('GEMINI_UPLOAD_REUSE', 'true').lower() not in ('0', 'false', 'no'),
+        )
+
+    @contextmanager
+    def _hash_lock(self, content_hash):
+        """Hold the per-hash lock. Entries are reference counted, so one is only dropped once no thread
+        holds or waits on it, and every caller for a hash gets the same lock object."""
+        with self._lock:
+            entry = self._hash_locks.setdefault(content_hash, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._hash_locks[content_hash]
+
+    def acquire(self, pdf_path, content_hash=None, display_name="research_paper"):
+        """Return an UploadHandle for the PDF, reusing a live upload of the same bytes if there is one."""
+        content_hash = content_hash or hash_file(pdf_path)
+        # Concurrent requests for the same paper in this process wait for a single upload
+        with self._hash_lock(content_hash):
+            handle = self._lookup(content_hash) if self.enabled else None
+            if handle is not None:
+                with self._lock:
+                    self._metrics.reuses += 1
+                    self._metrics.bytes_saved += handle.size_bytes
+                logger.info(f"Reusing Gemini upload {handle.file_name} for {content_hash[:12]}")
+                return handle
+            return self._upload(pdf_path, content_hash, display_name)
+
+    def _lookup(self, content_hash):
+        db_session = self.session_factory()
+        try:
+            entry = db_session.get(GeminiUpload, content_hash)
+            if entry is None or entry.expires_at - datetime.utcnow() < self.min_remaining:
+                return None
+            entry.use_count = (entry.use_count or 0) + 1
+            entry.last_used = datetime.utcnow()
+            handle = UploadHandle(content_hash, entry.file_name, entry.file_uri, entry.mime_type,
+                                  entry.size_bytes, entry.expires_at, reused=True)
+            db_session.commit()
+            return handle
+        except Exception as e:
+            logger.error(f"Gemini upload registry lookup failed: {str(e)}")
+            db_session.rollback()
+            return None
+        finally:
+            db_session.close()
+
+    def _upload(self, pdf_path, content_hash, display_name):
+        size = os.path.getsize(pdf_path)
+        logger.info(f"Uploading {pdf_path} to Gemini ({size} bytes)")
+        uploaded = self.upload_file(path=pdf_path, display_name=display_name)
+        with self._lock:
+            self._metrics.uploads += 1
+            self._metrics.bytes_uploaded += size
+
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+        if getattr(uploaded, 'expiration_time', None):
+            remote_expiry = uploaded.expiration_time
+            if remote_expiry.tzinfo is not None:
+                remote_expiry = remote_expiry.astimezone(timezone.utc).replace(tzinfo=None)
+            expires_at = min(expires_at, remote_expiry)
+        handle = UploadHandle(content_hash, uploaded.name, uploaded.uri, uploaded.mime_type or 'application/pdf',
+                              size, expires_at)
+        logger.info(f"Successfully uploaded file '{uploaded.display_name}' as: {uploaded.uri}")
+
+        if self.enabled:
+            db_session = self.session_factory()
+            try:
+                db_session.merge(GeminiUpload(
+                    content_hash=content_hash,
+                    file_name=handle.file_name,
+                    file_uri=handle.file_uri,
+                    mime_type=handle.mime_type,
+                    size_bytes=size,
+                    use_count=1,
+                    created_at=now,
+                    last_used=now,
+                    expires_at=expires_at
+                ))
+                db_session.commit()
+            except Exception as e:
+                logger.error(f"Failed to record Gemini upload: {str(e)}")
+                db_session.rollback()
+            finally:
+                db_session.close()
+        return handle
+
+    def invalidate(self, handle):
+        """Forget a handle Gemini no longer accepts, so the next acquire uploads again."""
+        db_session = self.session_factory()
+        try:
+            db_session.query(GeminiUpload).filter(
+                GeminiUpload.content_hash == handle.content_hash,
+                GeminiUpload.file_name == handle.file_name
+            ).delete(synchronize_session=False)
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Failed to invalidate Gemini upload: {str(e)}")
+            db_session.rollback()
+        finally:
+            db_session.close()
+        with self._lock:
+            self._metrics.invalidated += 1
+        logger.warning(f"Invalidated Gemini upload {handle.file_name} for {handle.content_hash[:12]}")
+
+    def sweep(self):
+        """Drop expired handles and delete idle ones from Gemini. Returns the number removed."""
+        db_session = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            stale = db_session.query(GeminiUpload).filter(
+                (GeminiUpload.expires_at < now + self.min_remaining) |
+                (GeminiUpload.last_used < now - self.idle_ttl)
+            ).all()
+            to_delete = [entry.file_name for entry in stale if entry.expires_at > now]
+            for entry in stale:
+                db_session.delete(entry)
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Gemini upload sweep failed: {str(e)}")
+            db_session.rollback()
+            return 0
+        finally:
+            db_session.close()
+
+        # Files past their expiry are already gone on Gemini's side; only live ones need a delete call
+        for file_name in to_delete:
+            try:
+                self.delete_file(file_name)
+                with self._lock:
+                    self._metrics.deleted += 1
+            except Exception as e:
+                logger.warning(f"Failed to delete Gemini file {file_name}: {str(e)}")
+
+        if stale:
+            logger.info(f"Gemini upload sweep: removed {len(stale)} handles, deleted {len(to_delete)} remote files")
+        return len(stale)
+
+    def start_sweeper(self):
+        """Run sweep every sweep_interval seconds on a daemon thread."""
+        if self._sweeper is not None or self.sweep_interval <= 0:
+            return
+
+        def run():
+            while not self._stop.wait(self.sweep_interval):
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name='gemini-upload-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def metrics(self):
+        """Return a snapshot of the upload metrics."""
+        with self._lock:
+            return self._metrics.to_dict()
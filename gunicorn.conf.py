@@ -0,0 +1,33 @@
+"""Gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+
+With several workers, set PROMETHEUS_MULTIPROC_DIR so /metrics reports every worker rather than
+whichever one served the scrape.
+"""
+
+import os
+import glob
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+# Summaries stream for minutes; a shorter timeout would kill workers mid-request
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+
+def on_starting(server):
+    # Samples left by a previous run's workers would otherwise be added to this run's
+    multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+            os.remove(path)
+
+def post_fork(server, worker):
+    # Runs in the new worker before the app (and its threads) load; the app's own call is then a no-op
+    from pdf_extraction import start_extraction_pool
+    start_extraction_pool()
+
+def child_exit(server, worker):
+    # Drop a dead worker's live gauges (in-flight requests and pipelines); its counters and histograms stay
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Full-text search over summary history with an SQLite FTS5 index.
+
+summary_history_fts indexes each summary's title, keywords and markdown, plus an owner
+token ('u<user_id>') that scopes every query to one user. Triggers on summary_history keep
+it in sync. Running this module fills title/keywords for old rows and rebuilds the index.
+
+Usage:
+    python history_search.py [--batch-size 500]
+"""
+
+import re
+import html
+import logging
+import argparse
+
+from sqlalchemy import DateTime, text
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'summary_history_fts'
+
+FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, keywords, summary, owner,
+        tokenize = 'porter unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS summary_history_fts_ai AFTER INSERT ON summary_history BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, keywords, summary, owner)
+        VALUES (new.id, new.title, new.keywords, new.summary, 'u' || coalesce(new.user_id, 0));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS summary_history_fts_ad AFTER DELETE ON summary_history BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    # Only the indexed columns: re-rendering summary_html doesn't touch the index
+    f"""CREATE TRIGGER IF NOT EXISTS summary_history_fts_au
+        AFTER UPDATE OF title, keywords, summary, user_id ON summary_history BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, title, keywords, summary, owner)
+        VALUES (new.id, new.title, new.keywords, new.summary, 'u' || coalesce(new.user_id, 0));
+    END"""
+]
+
+# bm25 column weights: a match in the title counts most, then keywords, then the body; owner not at all
+RANK_WEIGHTS = (10.0, 5.0, 1.0, 0.0)
+SNIPPET_TOKENS = 24
+MAX_QUERY_TERMS = 12
+
+# Unlikely control characters mark highlights so the text can be HTML-escaped before the <mark> tags go in
+HIGHLIGHT_OPEN = '\x02'
+HIGHLIGHT_CLOSE = '\x03'
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+TITLE_PATTERN = re.compile(r'\s*##\s*(.+)')
+KEYWORDS_PATTERN = re.compile(r'\*\*Keywords:\*\*\s*(.+?)\s*$')
+
+search_available = False
+
+def summary_title_and_keywords(summary):
+    """Parse (title, keywords) from a summary in the stored markdown format; title is None if absent."""
+    title_match = TITLE_PATTERN.match(summary)
+    keywords_match = KEYWORDS_PATTERN.search(summary)
+    title = title_match.group(1).strip() if title_match else None
+    keywords = [k.strip() for k in keywords_match.group(1).split(',') if k.strip()] if keywords_match else []
+    return title, keywords
+
+def ensure_search_index(engine):
+    """Create the FTS table and its triggers if missing, and index any rows the index lacks.
+
+    Runs at startup and from migrate_db.py once the columns it indexes exist. The row counts are
+    compared on every run, so an index left empty by an earlier failed attempt gets filled.
+    """
+    global search_available
+    try:
+        with engine.begin() as conn:
+            columns = {row[1] for row in conn.execute(text("PRAGMA table_info(summary_history)"))}
+            if not {'title', 'keywords'} <= columns:
+                logger.warning("summary_history lacks the title/keywords columns; run migrate_db.py to enable search")
+                search_available = False
+                return
+            for statement in FTS_SCHEMA:
+                conn.execute(text(statement))
+            indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+            total = conn.execute(text("SELECT count(*) FROM summary_history")).scalar()
+            if indexed < total:
+                conn.execute(text(f"""
+                    INSERT INTO {FTS_TABLE}(rowid, title, keywords, summary, owner)
+                    SELECT id, title, keywords, summary, 'u' || coalesce(user_id, 0) FROM summary_history
+                    WHERE id NOT IN (SELECT rowid FROM {FTS_TABLE})
+                """))
+                logger.info(f"Indexed {total - indexed} summaries missing from the search index")
+        search_available = True
+    except Exception as e:
+        # SQLite builds without FTS5: search falls back to a LIKE scan
+        logger.warning(f"Full-text search unavailable, falling back to LIKE queries: {str(e)}")
+        search_available = False
+
+def build_match_query(query, user_id):
+    """Turn free text into an FTS5 query scoped to the user's rows.
+
+    Each word becomes a quoted term so user input can't inject FTS syntax; the last one is a
+    prefix term so partial words match while typing (the prefix indexes keep short prefixes from
+    expanding into a scan of every matching term). Returns None if there is nothing to search.
+    """
+    terms = TERM_PATTERN.findall(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return f"owner:u{int(user_id or 0)} AND {{title keywords summary}}: ({' '.join(quoted)})"
+
+def highlight_html(fragment):
+    """HTML-escape a highlighted fragment, turning the highlight markers into <mark> tags."""
+    escaped = html.escape(fragment or '')
+    return escaped.replace(HIGHLIGHT_OPEN, '<mark>').replace(HIGHLIGHT_CLOSE, '</mark>')
+
+def search_history(db_session, user_id, query, limit=20):
+    """Return the user's summaries matching query, best first, with highlighted title and snippet."""
+    if not search_available:
+        return _search_history_like(db_session, user_id, query, limit)
+
+    match = build_match_query(query, user_id)
+    if match is None:
+        return []
+    statement = text(f"""
+        SELECT h.id, h.created_at, h.original_url, h.summary_html,
+               highlight({FTS_TABLE}, 0, :open, :close) AS title,
+               snippet({FTS_TABLE}, 2, :open, :close, '…', :tokens) AS snippet,
+               bm25({FTS_TABLE}, {', '.join(str(w) for w in RANK_WEIGHTS)}) AS rank
+        FROM {FTS_TABLE}
+        JOIN summary_history h ON h.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH :match
+        ORDER BY rank
+        LIMIT :limit
+    """).columns(created_at=DateTime)
+    rows = db_session.execute(statement, {
+        'open': HIGHLIGHT_OPEN,
+        'close': HIGHLIGHT_CLOSE,
+        'tokens': SNIPPET_TOKENS,
+        'match': match,
+        'limit': limit
+    }).mappings().all()
+    return [{
+        'id': row['id'],
+        'created_at': row['created_at'],
+        'original_url': row['original_url'],
+        'title_html': highlight_html(row['title']),
+        'snippet_html': highlight_html(row['snippet']),
+        'summary_html': row['summary_html'],
+        'rank': row['rank']
+    } for row in rows]
+
+def _search_history_like(db_session, user_id, query, limit):
+    from db import SummaryHistory
+
+    terms = TERM_PATTERN.findall(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+    records = db_session.query(SummaryHistory).filter(SummaryHistory.user_id == user_id)
+    for term in terms:
+        records = records.filter(SummaryHistory.summary.ilike(f"%{term}%"))
+    records = records.order_by(SummaryHistory.created_at.desc()).limit(limit).all()
+    return [{
+        'id': r.id,
+        'created_at': r.created_at,
+        'original_url': r.original_url,
+        'title_html': html.escape(r.title or ''),
+        'snippet_html': html.escape(r.summary[:200]),
+        'summary_html': r.summary_html,
+        'rank': None
+    } for r in records]
+
+def backfill_metadata(session_factory, batch_size=500):
+    """Fill title/keywords for rows saved before they were stored. Returns the number updated."""
+    from db import SummaryHistory
+
+    updated = 0
+    last_id = 0
+    while True:
+        db_session = session_factory()
+        try:
+            records = db_session.query(SummaryHistory).filter(
+                SummaryHistory.id > last_id,
+                SummaryHistory.title.is_(None)
+            ).order_by(SummaryHistory.id.asc()).limit(batch_size).all()
+            if not records:
+                break
+            for record in records:
+                title, keywords = summary_title_and_keywords(record.summary)
+                record.title = title or ''
+                record.keywords = ', '.join(keywords)
+            db_session.commit()
+            last_id = records[-1].id
+            updated += len(records)
+            logger.info(f"Filled title/keywords for {updated} summaries (up to id {last_id})")
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+    return updated
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Backfill summary titles/keywords and rebuild the search index")
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    from db import Session, engine
+    updated = backfill_metadata(Session, batch_size=args.batch_size)
+    ensure_search_index(engine)
+    if search_available:
+        with engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+            conn.execute(text(f"""
+                INSERT INTO {FTS_TABLE}(rowid, title, keywords, summary, owner)
+                SELECT id, title, keywords, summary, 'u' || coalesce(user_id, 0) FROM summary_history
+            """))
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+    logger.info(f"✅ Search index rebuilt ({updated} summaries got titles/keywords)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+import time
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+class HostStats:
+    """Per-host request counters and latency for an HttpClient."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.connections_opened = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'connections_opened': self.connections_opened,
+            'pool_hits': max(self.requests - self.connections_opened, 0),
+            'avg_latency_ms': round(self.total_latency / self.requests * 1000, 2) if self.requests else 0.0,
+            'max_latency_ms': round(self.max_latency * 1000, 2)
+        }
+
+class NoCookiesPolicy(DefaultCookiePolicy):
+    """The shared session serves every user, so it must never keep cookies set by a response."""
+
+    def set_ok(self, cookie, request):
+        return False
+
+class _InstrumentedAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report each new connection (TCP + TLS handshake)."""
+
+    def __init__(self, client, **kwargs):
+        self.client = client
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        client = self.client
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                client._record_connection(self.host)
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                client._record_connection(self.host)
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
+
+class HttpClient:
+    """Process-wide HTTP client: one keep-alive session with per-host connection pools,
+    default timeouts, retries limited to transient failures, and per-host metrics."""
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, connect_timeout=5.0, read_timeout=30.0,
+                 retries=2, backoff_factor=0.5):
+        self.default_timeout = (connect_timeout, read_timeout)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+        # Connect errors are retried for any method (nothing was sent); read errors and
+        # retryable statuses only for idempotent methods, so token POSTs are never replayed.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        self.session = self._make_session(retry, pool_connections, pool_maxsize)
+        # For callers that retry whole operations themselves, so attempts don't multiply
+        self.single_attempt_session = self._make_session(Retry(total=0, raise_on_status=False),
+                                                         pool_connections, pool_maxsize)
+
+    def _make_session(self, retry, pool_connections, pool_maxsize):
+        adapter = _InstrumentedAdapter(
+            self,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.cookies.set_policy(NoCookiesPolicy())
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @classmethod
+    def from_env(cls):
+        """Build a client configured from HTTP_* environment variables."""
+        return cls(
+            pool_connections=int(os.getenv('HTTP_POOL_CONNECTIONS', '10')),
+            pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', '10')),
+            connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+            read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', '30')),
+            retries=int(os.getenv('HTTP_RETRIES', '2'))
+        )
+
+    def _host_stats(self, host):
+        stats = self._stats.get(host)
+        if stats is None:
+            stats = self._stats.setdefault(host, HostStats())
+        return stats
+
+    def _record_connection(self, host):
+        with self._lock:
+            self._host_stats(host).connections_opened += 1
+
+    def request(self, method, url, retry=True, **kwargs):
+        """Send a request through the shared session; same arguments as requests.request.
+
+        retry=False makes a single attempt, for callers with their own retry loop.
+        """
+        kwargs.setdefault('timeout', self.default_timeout)
+        session = self.session if retry else self.single_attempt_session
+        host = urlsplit(url).hostname or ''
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._host_stats(host).errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self._host_stats(host)
+                stats.requests += 1
+                stats.total_latency += elapsed
+                stats.max_latency = max(stats.max_latency, elapsed)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def metrics(self):
+        """Return a snapshot of per-host metrics."""
+        with self._lock:
+            return {host: stats.to_dict() for host, stats in self._stats.items()}
+
+# Shared client used for arXiv/PDF downloads, avatar fetches and OAuth calls
+http_client = HttpClient.from_env()
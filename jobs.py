@@ -0,0 +1,274 @@
+import os
+import json
+import uuid
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from db import Session as DBSession, SummaryJob
+from logging_config import bind_log_context, current_log_context, log_context, update_log_context
+from profiling import profile_requested, profile_thread
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+class JobManager:
+    """Runs summary jobs on a bounded thread pool, with job state persisted in SQLite.
+
+    Each worker process owns the jobs it queued or runs and touches their updated_at every
+    heartbeat_interval seconds. Jobs not touched for stale_after belong to a worker that died;
+    the sweep that runs with the heartbeat re-queues them on a live worker.
+    """
+
+    def __init__(self, app, runner, max_workers=4, stale_after=120, max_attempts=3, retention_days=7,
+                 heartbeat_interval=30):
+        self.app = app
+        self.runner = runner
+        self.max_workers = max_workers
+        self.stale_after = timedelta(seconds=stale_after)
+        self.max_attempts = max_attempts
+        self.retention = timedelta(days=retention_days)
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summary-job')
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    def submit(self, input_type, user_id=None, input_text=None, file_path=None, content_hash=None, original_url=None,
+               options=None):
+        """Persist a new job and hand it to the worker pool. Returns the job id."""
+        job_id = str(uuid.uuid4())
+        db_session = DBSession()
+        try:
+            db_session.add(SummaryJob(
+                id=job_id,
+                status='queued',
+                stage='queued',
+                input_type=input_type,
+                input_text=input_text,
+                file_path=file_path,
+                content_hash=content_hash,
+                original_url=original_url,
+                options=json.dumps(options) if options else None,
+                user_id=user_id,
+                worker_id=self.worker_id
+            ))
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+        logger.info(f"Queued summary job {job_id} ({input_type})")
+        self.executor.submit(self._run, job_id, current_log_context().get('request_id'), profile_requested.get())
+        return job_id
+
+    def get(self, job_id):
+        """Return a job as a plain dict, or None if it doesn't exist."""
+        db_session = DBSession()
+        try:
+            job = db_session.get(SummaryJob, job_id)
+            return self._to_dict(job) if job else None
+        finally:
+            db_session.close()
+
+    def set_stage(self, job_id, stage, **details):
+        """Record the pipeline stage a running job has reached, merging any details reported with it."""
+        fields = {'stage': stage}
+        if details:
+            job = self.get(job_id)
+            merged = dict(job['details'] if job else {}, **details)
+            fields['details'] = json.dumps(merged)
+        self._update(job_id, **fields)
+        update_log_context(stage=stage)
+        logger.info(f"Job {job_id} stage: {stage}")
+
+    def heartbeat(self):
+        """Mark this worker's queued and running jobs as alive."""
+        db_session = DBSession()
+        try:
+            db_session.query(SummaryJob).filter(
+                SummaryJob.worker_id == self.worker_id,
+                SummaryJob.status.in_(('queued', 'running'))
+            ).update({SummaryJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Failed to heartbeat summary jobs: {str(e)}")
+            db_session.rollback()
+        finally:
+            db_session.close()
+
+    def recover(self):
+        """Take over and re-enqueue jobs whose worker died, and purge old finished jobs.
+
+        A job is taken over with a conditional update, so when several workers sweep at once
+        only one of them re-enqueues it. Returns the number of jobs re-enqueued.
+        """
+        db_session = DBSession()
+        recovered = []
+        abandoned = 0
+        try:
+            now = datetime.utcnow()
+            stale = db_session.query(SummaryJob.id, SummaryJob.status, SummaryJob.attempts, SummaryJob.updated_at).filter(
+                SummaryJob.status.in_(('queued', 'running')),
+                SummaryJob.updated_at < now - self.stale_after
+            ).order_by(SummaryJob.created_at.asc()).all()
+            for job_id, status, attempts, updated_at in stale:
+                if attempts >= self.max_attempts:
+                    fields = {SummaryJob.status: 'failed', SummaryJob.stage: 'failed', SummaryJob.finished_at: now,
+                              SummaryJob.error: "Job was interrupted too many times and has been abandoned."}
+                else:
+                    fields = {SummaryJob.status: 'queued', SummaryJob.stage: 'queued'}
+                fields.update({SummaryJob.worker_id: self.worker_id, SummaryJob.updated_at: now})
+                taken = db_session.query(SummaryJob).filter(
+                    SummaryJob.id == job_id,
+                    SummaryJob.status == status,
+                    SummaryJob.updated_at == updated_at
+                ).update(fields, synchronize_session=False)
+                if taken and attempts >= self.max_attempts:
+                    abandoned += 1
+                elif taken:
+                    recovered.append(job_id)
+
+            purged = db_session.query(SummaryJob).filter(
+                SummaryJob.status.in_(('done', 'failed')),
+                SummaryJob.finished_at < now - self.retention
+            ).delete(synchronize_session=False)
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Failed to recover summary jobs: {str(e)}")
+            db_session.rollback()
+            return 0
+        finally:
+            db_session.close()
+
+        for job_id in recovered:
+            self.executor.submit(self._run, job_id)
+        if recovered or abandoned or purged:
+            logger.info(f"Recovered {len(recovered)} jobs from dead workers, abandoned {abandoned}, "
+                        f"purged {purged} finished jobs")
+        return len(recovered)
+
+    def start_sweeper(self):
+        """Heartbeat this worker's jobs and recover dead workers' every heartbeat_interval seconds."""
+        if self._sweeper is not None or self.heartbeat_interval <= 0:
+            return
+
+        def run():
+            while not self._stop.wait(self.heartbeat_interval):
+                self.heartbeat()
+                self.recover()
+
+        self._sweeper = threading.Thread(target=run, name='summary-job-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def _claim(self, job_id):
+        """Atomically move a job from queued to running so only one worker runs it."""
+        db_session = DBSession()
+        try:
+            claimed = db_session.query(SummaryJob).filter(
+                SummaryJob.id == job_id,
+                SummaryJob.status == 'queued'
+            ).update({
+                SummaryJob.status: 'running',
+                SummaryJob.attempts: SummaryJob.attempts + 1,
+                SummaryJob.worker_id: self.worker_id,
+                SummaryJob.updated_at: datetime.utcnow()
+            }, synchronize_session=False)
+            db_session.commit()
+            if not claimed:
+                return None
+            return self._to_dict(db_session.get(SummaryJob, job_id))
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+    def _update(self, job_id, **fields):
+        db_session = DBSession()
+        try:
+            fields['updated_at'] = datetime.utcnow()
+            db_session.query(SummaryJob).filter(SummaryJob.id == job_id).update(fields, synchronize_session=False)
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Failed to update job {job_id}: {str(e)}")
+            db_session.rollback()
+        finally:
+            db_session.close()
+
+    def _run(self, job_id, request_id=None, profiled=False):
+        # Pool threads are reused, so the context is bound per job and reset afterwards
+        token = bind_log_context(request_id=request_id, job_id=job_id)
+        try:
+            with profile_thread('job', request_id, profiled):
+                self._run_job(job_id)
+        finally:
+            log_context.reset(token)
+
+    def _run_job(self, job_id):
+        try:
+            job = self._claim(job_id)
+        except Exception as e:
+            logger.error(f"Failed to claim job {job_id}: {str(e)}")
+            return
+        if job is None:
+            logger.debug(f"Job {job_id} already claimed by another worker")
+            return
+
+        logger.info(f"Running summary job {job_id} (attempt {job['attempts']})")
+        try:
+            with self.app.app_context():
+                summary, error = self.runner(job, lambda stage, **details: self.set_stage(job_id, stage, **details))
+        except Exception as e:
+            logger.error(f"Summary job {job_id} crashed: {str(e)}", exc_info=True)
+            summary, error = None, f"An unexpected error occurred: {str(e)}"
+
+        now = datetime.utcnow()
+        if error:
+            self._update(job_id, status='failed', stage='failed', error=error, summary=summary, finished_at=now)
+            logger.warning(f"Summary job {job_id} failed: {error}")
+        else:
+            self._update(job_id, status='done', stage='done', summary=summary, finished_at=now)
+            logger.info(f"Summary job {job_id} finished")
+
+    @staticmethod
+    def _to_dict(job):
+        return {
+            'id': job.id,
+            'status': job.status,
+            'stage': job.stage,
+            'input_type': job.input_type,
+            'input_text': job.input_text,
+            'file_path': job.file_path,
+            'content_hash': job.content_hash,
+            'original_url': job.original_url,
+            'options': json.loads(job.options) if job.options else {},
+            'user_id': job.user_id,
+            'summary': job.summary,
+            'error': job.error,
+            'details': json.loads(job.details) if job.details else {},
+            'attempts': job.attempts,
+            'created_at': job.created_at,
+            'updated_at': job.updated_at,
+            'finished_at': job.finished_at
+        }
+
+def init_jobs(app, runner):
+    """Create the job manager for the Flask app, resume jobs left by dead workers and keep sweeping for them"""
+    job_manager = JobManager(
+        app,
+        runner,
+        max_workers=int(os.getenv('SUMMARY_WORKERS', '4')),
+        stale_after=int(os.getenv('SUMMARY_JOB_STALE_SECONDS', '120')),
+        max_attempts=int(os.getenv('SUMMARY_JOB_MAX_ATTEMPTS', '3')),
+        retention_days=int(os.getenv('SUMMARY_JOB_RETENTION_DAYS', '7')),
+        heartbeat_interval=int(os.getenv('SUMMARY_JOB_HEARTBEAT_SECONDS', '30'))
+    )
+    job_manager.recover()
+    job_manager.start_sweeper()
+    return job_manager
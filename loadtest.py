@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test: runs the app under Gunicorn against a local fake Gemini server and a local
+arXiv-style PDF server, drives a mixed workload at a target request rate and reports p50/p95/p99
+latency per route and per pipeline stage.
+
+Usage:
+    python loadtest.py [--rps 2] [--duration 60] [--mix text=40,upload=20,url=20,history=20]
+                       [--workers 2] [--threads 8] [--stream-workers 4] [--gemini-latency-ms 800] [--gemini-tokens-per-sec 200]
+                       [--gemini-error-rate 0] [--gemini-429-rate 0] [--output report.json]
+
+Requests arrive open-loop (Poisson at --rps) and workload latencies are measured from the time a
+request was due, so a saturated server shows up as growing latency instead of a lower request rate.
+Stage percentiles are estimated from the summary_stage_seconds histogram buckets on /metrics.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import secrets
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from benchmark import WORDS, synthetic_paper_text, write_sample_pdf
+from fake_gemini import FakeGeminiServer, fake_response_text
+from pdf_extraction import PYMUPDF_AVAILABLE
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# arXiv-style ids served by the fixture server, and the length of each paper
+FIXTURE_PAPERS = {'2401.00001': 1, '2401.00002': 5, '2401.00003': 20, '2401.00004': 60}
+TEXT_PAGES = [1, 3, 10]
+WORKLOADS = ('text', 'upload', 'url', 'history')
+
+class FixtureServer(ThreadingHTTPServer):
+    """Serves generated papers at /pdf/<arXiv id> as application/pdf, like arxiv.org/pdf."""
+
+    daemon_threads = True
+
+    def __init__(self, pdfs, address=('127.0.0.1', 0)):
+        super().__init__(address, FixtureHandler)
+        self.pdfs = pdfs
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='pdf-fixtures', daemon=True).start()
+        return self
+
+class FixtureHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        paper_id = self.path.rsplit('/', 1)[-1].removesuffix('.pdf')
+        data = self.server.pdfs.get(paper_id)
+        if not self.path.startswith('/pdf/') or data is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def build_fixture_pdfs(work_dir):
+    pdfs = {}
+    for paper_id, pages in FIXTURE_PAPERS.items():
+        path = os.path.join(work_dir, f"{paper_id}.pdf")
+        write_sample_pdf(path, pages, seed=pages)
+        with open(path, 'rb') as f:
+            pdfs[paper_id] = f.read()
+    return pdfs
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def seed_users(users, secret_key, history_per_user=20):
+    """Create signed-in users with some history; returns a session cookie header per user.
+
+    Runs in this process against the app's database (DATABASE_URL is already set), writing the
+    server-side sessions the app's DatabaseSessionInterface will find for the signed ids.
+    """
+    from flask import Flask
+    from db import Session, ServerSession, SummaryHistory, User
+    from session_store import DatabaseSessionInterface
+    from summary_rendering import RENDERER_VERSION, render_summary_html
+
+    signer_app = Flask('loadtest')
+    signer_app.secret_key = secret_key
+    interface = DatabaseSessionInterface(Session)
+    sid_serializer = interface.get_sid_serializer(signer_app)
+    cookie_name = signer_app.config['SESSION_COOKIE_NAME']
+
+    now = datetime.utcnow()
+    cookies = []
+    db_session = Session()
+    try:
+        for i in range(1, users + 1):
+            user = User(email=f"load{i}@example.com", name=f"Load User {i}", provider_id=f"load-{i}")
+            db_session.add(user)
+            db_session.flush()
+            for j in range(history_per_user):
+                response = fake_response_text(f"seed {i} {j}")
+                title = response.split('\n', 1)[0].removeprefix('TITLE: ')
+                summary = f"## {title}\n\n{response.split('SUMMARY: ', 1)[1].rsplit('KEYWORDS:', 1)[0].strip()}"
+                db_session.add(SummaryHistory(summary=summary, summary_html=render_summary_html(summary),
+                                              renderer_version=RENDERER_VERSION, title=title,
+                                              keywords=response.rsplit('KEYWORDS: ', 1)[1], user_id=user.id))
+            sid = secrets.token_urlsafe(32)
+            data = {'user_id': user.id, 'user_email': user.email, 'user_name': user.name}
+            db_session.add(ServerSession(sid=sid, data=interface.serializer.dumps(data), user_id=user.id,
+                                         updated_at=now, expires_at=now + timedelta(days=1)))
+            cookies.append({'Cookie': f"{cookie_name}={sid_serializer.dumps(sid)}"})
+        db_session.commit()
+    finally:
+        db_session.close()
+    return cookies
+
+def start_app(args, env, log_path):
+    """Start Gunicorn with the app and wait until it answers /metrics."""
+    log = open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://{env['GUNICORN_BIND']}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if requests.get(f"{base_url}/metrics", timeout=2).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    with open(log_path) as f:
+        print(f.read()[-4000:], file=sys.stderr)
+    raise RuntimeError("The app did not start; its log is above")
+
+class Recorder:
+    """Latencies and failures per name (an HTTP route or a whole workload)."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.failures = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, ok=True):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.failures[name] += 1
+
+    def timed(self, name, send, ok=lambda response: response.ok):
+        """Send one request and record its latency; returns the response, or None if it failed to send."""
+        started = time.perf_counter()
+        try:
+            response = send()
+        except requests.RequestException:
+            self.record(name, time.perf_counter() - started, ok=False)
+            return None
+        self.record(name, time.perf_counter() - started, ok=ok(response))
+        return response
+
+class LoadTest:
+    def __init__(self, args, base_url, cookies, fixtures):
+        self.args = args
+        self.base_url = base_url
+        self.cookies = cookies
+        self.fixtures = fixtures
+        self.recorder = Recorder()
+        self.local = threading.local()
+
+    @property
+    def http(self):
+        # One connection pool per client thread
+        http = getattr(self.local, 'http', None)
+        if http is None:
+            http = self.local.http = requests.Session()
+        return http
+
+    def run_text(self, rng, headers):
+        text = synthetic_paper_text(rng.choice(TEXT_PAGES), seed=rng.randrange(10**9))
+        started = time.perf_counter()
+        event = first_chunk = None
+        try:
+            with self.http.post(f"{self.base_url}/summary/stream", data={'text': text}, headers=headers,
+                                stream=True, timeout=self.args.job_timeout) as response:
+                if response.status_code == 503:
+                    # Every streaming slot is busy: queue a job instead, as the summarize page does
+                    self.recorder.record('POST /summary/stream (503)', time.perf_counter() - started)
+                    return self.run_job({'text': text}, None, headers)
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('event: '):
+                        continue
+                    event = line[len('event: '):]
+                    if event == 'chunk' and first_chunk is None:
+                        first_chunk = time.perf_counter() - started
+                        self.recorder.record('POST /summary/stream (first chunk)', first_chunk)
+                    if event in ('done', 'error'):
+                        break
+        except requests.RequestException:
+            event = 'error'
+        self.recorder.record('POST /summary/stream', time.perf_counter() - started, ok=event == 'done')
+        return event == 'done'
+
+    def run_job(self, fields, files, headers):
+        """Submit a summary job and poll it to the end; returns whether it succeeded."""
+        response = self.recorder.timed('POST /summary', lambda: self.http.post(
+            f"{self.base_url}/summary", data=fields, files=files, headers=headers, timeout=60))
+        if response is None or response.status_code != 202:
+            return False
+        status_url = f"{self.base_url}{response.json()['status_url']}"
+        deadline = time.monotonic() + self.args.job_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.args.poll_interval)
+            response = self.recorder.timed('GET /jobs/<id>', lambda: self.http.get(status_url, headers=headers, timeout=30))
+            if response is None or not response.ok:
+                return False
+            status = response.json()['status']
+            if status in ('done', 'failed'):
+                return status == 'done'
+        return False
+
+    def run_upload(self, rng, headers):
+        paper_id = rng.choice(list(self.fixtures))
+        return self.run_job({}, {'file': (f"{paper_id}.pdf", self.fixtures[paper_id], 'application/pdf')}, headers)
+
+    def run_url(self, rng, headers):
+        paper_id = rng.choice(list(self.fixtures))
+        return self.run_job({'url': f"{self.args.fixture_url}/pdf/{paper_id}"}, None, headers)
+
+    def run_history(self, rng, headers):
+        roll = rng.random()
+        if roll < 0.4:
+            route, url = 'GET /history', f"{self.base_url}/history"
+        elif roll < 0.7:
+            route, url = 'GET /history.json', f"{self.base_url}/history.json"
+        else:
+            route, url = 'GET /history/search', f"{self.base_url}/history/search?q={rng.choice(WORDS)}"
+        response = self.recorder.timed(route, lambda: self.http.get(url, headers=headers, timeout=30))
+        return response is not None and response.ok
+
+    def run_one(self, workload, due, seed):
+        rng = random.Random(seed)
+        headers = rng.choice(self.cookies)
+        try:
+            ok = getattr(self, f"run_{workload}")(rng, headers)
+        except Exception:
+            ok = False
+        # Measured from when the request was due, so time spent waiting for a client thread counts too
+        self.recorder.record(f"workload {workload}", time.perf_counter() - due, ok=ok)
+
+    def drive(self, mix):
+        rng = random.Random(self.args.seed)
+        workloads, weights = zip(*mix.items())
+        pool = ThreadPoolExecutor(max_workers=self.args.max_concurrency, thread_name_prefix='load')
+        futures = []
+        started = time.perf_counter()
+        due = started
+        while due < started + self.args.duration:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            workload = rng.choices(workloads, weights)[0]
+            futures.append(pool.submit(self.run_one, workload, due, rng.random()))
+            due += rng.expovariate(self.args.rps)
+        wait(futures)
+        pool.shutdown()
+        return time.perf_counter() - started, len(futures)
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def scrape_metrics(base_url):
+    """Parse /metrics into {(sample name, sorted label items): value}."""
+    from prometheus_client.parser import text_string_to_metric_families
+    text = requests.get(f"{base_url}/metrics", timeout=30).text
+    samples = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+def histogram_quantile(q, buckets):
+    """Estimate a quantile from cumulative (upper bound, count) buckets, interpolating like PromQL's."""
+    total = buckets[-1][1]
+    if not total:
+        return None
+    rank = q * total
+    lower, lower_count = 0.0, 0.0
+    for upper, count in buckets:
+        if count >= rank:
+            if upper == float('inf'):
+                return lower
+            return lower + (upper - lower) * (rank - lower_count) / (count - lower_count)
+        lower, lower_count = upper, count
+    return lower
+
+def stage_report(before, after):
+    """Per-stage count and p50/p95/p99 from the summary_stage_seconds buckets added during the run."""
+    buckets = defaultdict(list)
+    for (name, labels), value in after.items():
+        if name != 'summary_stage_seconds_bucket':
+            continue
+        labels = dict(labels)
+        delta = value - before.get((name, tuple(sorted(labels.items()))), 0.0)
+        buckets[labels['stage']].append((float(labels['le']), delta))
+    errors = counter_deltas(before, after, 'summary_stage_errors_total')
+    report = {}
+    for stage, stage_buckets in sorted(buckets.items()):
+        stage_buckets.sort()
+        if stage_buckets[-1][1]:
+            report[stage] = {'count': int(stage_buckets[-1][1]), 'failures': int(errors.get(f"stage={stage}", 0)),
+                             **{f"p{int(q * 100)}": histogram_quantile(q, stage_buckets) for q in (0.5, 0.95, 0.99)}}
+    return report
+
+def counter_deltas(before, after, name):
+    deltas = {}
+    for (sample, labels), value in after.items():
+        if sample == name:
+            delta = value - before.get((sample, labels), 0.0)
+            if delta:
+                deltas[','.join(f"{k}={v}" for k, v in labels)] = delta
+    return deltas
+
+def route_report(recorder):
+    report = {}
+    for name, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        report[name] = {'count': len(values), 'failures': recorder.failures[name],
+                        **{f"p{int(q * 100)}": percentile(values, q) for q in (0.5, 0.95, 0.99)}}
+    return report
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"  {'':42s} {'count':>7s} {'fail':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s}")
+    for name, row in rows.items():
+        cells = ' '.join(f"{row[p] * 1000:7.0f}ms" if row[p] is not None else f"{'-':>9s}" for p in ('p50', 'p95', 'p99'))
+        print(f"  {name[:42]:42s} {row['count']:7d} {row.get('failures', 0):6d} {cells}")
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        name, weight = item.split('=')
+        if name not in WORKLOADS:
+            raise argparse.ArgumentTypeError(f"Unknown workload {name!r}; use {', '.join(WORKLOADS)}")
+        mix[name] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test with local Gemini and arXiv stand-ins")
+    parser.add_argument('--rps', type=float, default=2.0, help="target arrival rate (requests/second)")
+    parser.add_argument('--duration', type=float, default=60, help="seconds of arrivals; in-flight work is awaited")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('text=40,upload=20,url=20,history=20'))
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=2, help="Gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=8, help="threads per Gunicorn worker")
+    parser.add_argument('--summary-workers', type=int, default=4, help="background summary jobs per worker")
+    parser.add_argument('--stream-workers', type=int, default=4,
+                        help="concurrent streamed summaries per worker; past this, text falls back to jobs")
+    parser.add_argument('--summary-cache', action='store_true', help="leave the summary cache on")
+    parser.add_argument('--gemini-latency-ms', type=float, default=800, help="fake Gemini time to first token")
+    parser.add_argument('--gemini-tokens-per-sec', type=float, default=200)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0, help="fraction of calls failing with 500")
+    parser.add_argument('--gemini-429-rate', type=float, default=0.0, help="fraction of calls failing with 429")
+    parser.add_argument('--max-concurrency', type=int, default=256, help="client threads")
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--job-timeout', type=float, default=300)
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the report as JSON")
+    args = parser.parse_args()
+
+    if not PYMUPDF_AVAILABLE:
+        print("PyMuPDF is not installed; it is needed to generate the fixture PDFs", file=sys.stderr)
+        return 1
+
+    with tempfile.TemporaryDirectory(prefix='loadtest_') as work_dir:
+        gemini = FakeGeminiServer(latency=args.gemini_latency_ms / 1000, tokens_per_sec=args.gemini_tokens_per_sec,
+                                  error_rate=args.gemini_error_rate, rate_limit_rate=args.gemini_429_rate,
+                                  seed=args.seed).start()
+        fixture_pdfs = build_fixture_pdfs(work_dir)
+        fixture_server = FixtureServer(fixture_pdfs).start()
+        args.fixture_url = fixture_server.base_url
+
+        secret_key = secrets.token_hex(32)
+        multiproc_dir = os.path.join(work_dir, 'metrics')
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(work_dir, 'loadtest.db')}",
+            SECRET_KEY=secret_key,
+            SESSION_BACKEND='database',
+            SUMMARIZER_BACKEND='gemini',
+            GEMINI_API_KEY='fake-key',
+            GEMINI_API_ENDPOINT=gemini.endpoint,
+            PROMETHEUS_MULTIPROC_DIR=multiproc_dir,
+            GUNICORN_BIND=f"127.0.0.1:{free_port()}",
+            GUNICORN_WORKERS=str(args.workers),
+            GUNICORN_THREADS=str(args.threads),
+            SUMMARY_WORKERS=str(args.summary_workers),
+            SUMMARY_STREAM_WORKERS=str(args.stream_workers),
+            SUMMARY_CACHE_ENABLED='true' if args.summary_cache else 'false',
+            # No Files API in the fake: PDFs are extracted locally and their text summarized
+            EXTRACTION_MODE='local',
+            PDF_SUMMARY_MODE='extract',
+            GEMINI_UPLOAD_SWEEP_SECONDS='0',
+            PROFILE_DIR=os.path.join(work_dir, 'profiles'),
+            LOG_LEVEL='WARNING'
+        )
+        os.environ.update({'DATABASE_URL': env['DATABASE_URL'], 'PROMETHEUS_MULTIPROC_DIR': multiproc_dir})
+        os.makedirs(multiproc_dir, exist_ok=True)
+        cookies = seed_users(args.users, secret_key)
+
+        process, base_url = start_app(args, env, os.path.join(work_dir, 'app.log'))
+        try:
+            before = scrape_metrics(base_url)
+            load_test = LoadTest(args, base_url, cookies, fixture_pdfs)
+            print(f"Driving {args.rps} req/s for {args.duration:.0f}s against {args.workers} workers x "
+                  f"{args.threads} threads (mix: {', '.join(f'{k}={v:g}' for k, v in args.mix.items())})")
+            elapsed, sent = load_test.drive(args.mix)
+            after = scrape_metrics(base_url)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            gemini.shutdown()
+            fixture_server.shutdown()
+
+    routes = route_report(load_test.recorder)
+    stages = stage_report(before, after)
+    report = {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'config': {key: value for key, value in vars(args).items() if key != 'mix'},
+        'mix': args.mix,
+        'requests': sent,
+        'elapsed_seconds': round(elapsed, 1),
+        'achieved_rps': round(sent / elapsed, 2),
+        'routes': routes,
+        'stages': stages,
+        'retries': counter_deltas(before, after, 'summary_retries_total'),
+        'fallbacks': counter_deltas(before, after, 'summary_fallbacks_total'),
+        'model_tokens': counter_deltas(before, after, 'summarizer_tokens_total'),
+        'fake_gemini': gemini.counts
+    }
+
+    print(f"\n{sent} workloads in {elapsed:.1f}s ({report['achieved_rps']} req/s); fake Gemini: {gemini.counts}")
+    print_table("Routes and workloads (workloads are measured from when they were due)", routes)
+    print_table("Pipeline stages (estimated from histogram buckets)", stages)
+    for title in ('retries', 'fallbacks'):
+        if report[title]:
+            print(f"\n{title.capitalize()}: " + ', '.join(f"{k} {v:g}" for k, v in report[title].items()))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote the report to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import os
+import time
+import functools
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from flask import Response, g, request
+
+# prometheus_client picks its value store when it is imported: with PROMETHEUS_MULTIPROC_DIR set,
+# every worker writes its samples to files in that directory and /metrics adds them up
+load_dotenv()
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    from prometheus_client import multiprocess
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    Counter = Gauge = Histogram = None
+    PROMETHEUS_AVAILABLE = False
+
+# From a cache hit's render to a long paper's map-reduce summarization
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+class _NoopMetric:
+    """Stands in for every metric when prometheus_client is not installed."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+def _metric(cls, name, documentation, labelnames=(), **kwargs):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return cls(name, documentation, labelnames, **kwargs)
+
+STAGE_SECONDS = _metric(
+    Histogram, 'summary_stage_seconds',
+    'Time spent in each summary pipeline stage (download, upload, extraction_local, extraction_gemini, '
+    'local_fallback, chunk_summarization, summarization, parsing, render, save)',
+    ['stage'], buckets=STAGE_BUCKETS
+)
+STAGE_ERRORS = _metric(Counter, 'summary_stage_errors_total', 'Pipeline stages that raised', ['stage'])
+RETRIES = _metric(Counter, 'summary_retries_total', 'Retried attempts of downloads and Gemini calls', ['operation'])
+FALLBACKS = _metric(
+    Counter, 'summary_fallbacks_total',
+    'Fallback paths taken: extraction_local (Gemini extraction failed), direct_to_extract '
+    '(direct PDF summary failed) and placeholder_summary (summarization failed)',
+    ['kind']
+)
+CACHE_LOOKUPS = _metric(Counter, 'summary_cache_lookups_total', 'Summary cache lookups by result (memory_hit, database_hit, miss, expired, error)', ['result'])
+MODEL_TOKENS = _metric(Counter, 'summarizer_tokens_total',
+                       'Summarizer model tokens by backend, call and direction (input/output)',
+                       ['backend', 'operation', 'direction'])
+BATCH_SIZE = _metric(Histogram, 'summarizer_batch_size', 'Requests per generate call of a local summarization model',
+                     ['backend'], buckets=(1, 2, 4, 8, 16, 32))
+BATCH_QUEUE_SECONDS = _metric(Histogram, 'summarizer_queue_seconds',
+                              'Time requests to a local summarization model waited for their batch to start',
+                              ['backend'], buckets=STAGE_BUCKETS)
+BATCH_SECONDS = _metric(Histogram, 'summarizer_batch_seconds', 'Duration of local summarization model generate calls',
+                        ['backend'], buckets=STAGE_BUCKETS)
+PIPELINES_IN_PROGRESS = _metric(Gauge, 'summary_pipelines_in_progress', 'Summary pipelines currently running',
+                                multiprocess_mode='livesum')
+HTTP_IN_PROGRESS = _metric(Gauge, 'http_requests_in_progress', 'HTTP requests currently being handled',
+                           multiprocess_mode='livesum')
+HTTP_SECONDS = _metric(Histogram, 'http_request_duration_seconds', 'HTTP request latency by endpoint',
+                       ['endpoint', 'method', 'status'], buckets=STAGE_BUCKETS)
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+@contextmanager
+def stage_timer(stage):
+    """Time the block as one pipeline stage, counting it as an error of that stage if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+def count_retry(operation):
+    """A backoff on_backoff handler counting the retries of operation."""
+    def on_backoff(details):
+        RETRIES.labels(operation).inc()
+    return on_backoff
+
+def count_fallback(kind):
+    FALLBACKS.labels(kind).inc()
+
+def count_cache_lookup(result):
+    CACHE_LOOKUPS.labels(result).inc()
+
+def count_model_tokens(backend, operation, response):
+    """Add a summarizer response's usage metadata (the last chunk's, for a stream) to the token counters."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    MODEL_TOKENS.labels(backend, operation, 'input').inc(getattr(usage, 'prompt_token_count', 0) or 0)
+    MODEL_TOKENS.labels(backend, operation, 'output').inc(getattr(usage, 'candidates_token_count', 0) or 0)
+
+def observe_batch(backend, size, queue_waits, seconds):
+    """Record one micro-batched generate call: its size, how long each request queued and how long it ran."""
+    BATCH_SIZE.labels(backend).observe(size)
+    for wait in queue_waits:
+        BATCH_QUEUE_SECONDS.labels(backend).observe(wait)
+    BATCH_SECONDS.labels(backend).observe(seconds)
+
+def track_pipeline(func):
+    """Count calls to func as running summary pipelines."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        PIPELINES_IN_PROGRESS.inc()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            PIPELINES_IN_PROGRESS.dec()
+    return wrapper
+
+def metrics_registry():
+    """The registry to expose: this process's, or every worker's when running in multiprocess mode."""
+    if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def init_metrics(app):
+    """Track in-flight requests and latency per endpoint, and serve Prometheus text on /metrics."""
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        HTTP_IN_PROGRESS.inc()
+
+    def observe_request(started, endpoint, method, status):
+        HTTP_IN_PROGRESS.dec()
+        HTTP_SECONDS.labels(endpoint or 'unknown', method, str(status)).observe(time.perf_counter() - started)
+
+    @app.after_request
+    def record_request_status(response):
+        g.metrics_status = response.status_code
+        started = g.get('metrics_started')
+        if response.is_streamed and started is not None:
+            # The request tears down when the body starts, not when it ends (e.g. /summary/stream):
+            # time it until the server closes the response instead
+            g.pop('metrics_started')
+            endpoint, method, status = request.endpoint, request.method, response.status_code
+            response.call_on_close(lambda: observe_request(started, endpoint, method, status))
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exception=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        observe_request(started, request.endpoint, request.method, g.pop('metrics_status', 500))
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        """Prometheus text exposition of the pipeline and request metrics"""
+        if not PROMETHEUS_AVAILABLE:
+            return Response("prometheus_client is not installed\n", status=503, mimetype='text/plain')
+        return Response(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -7,6 +7,10 @@ import sqlite3
 import os
 import logging
 
+from sqlalchemy import create_engine
+
+from history_search import ensure_search_index
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -103,6 +107,24 @@ def migrate_database():
         else:
             logger.info("✅ Users table already has correct schema")
         
+        # Add columns introduced after the tables were first created
+        add_missing_columns(cursor, 'summary_jobs', {
+            'content_hash': 'VARCHAR(64)',
+            'details': 'TEXT',
+            'options': 'TEXT',
+            'worker_id': 'VARCHAR(64)'
+        })
+        add_missing_columns(cursor, 'summary_history', {
+            'summary_html': 'TEXT',
+            'renderer_version': 'INTEGER',
+            'title': 'VARCHAR(500)',
+            'keywords': 'TEXT'
+        })
+        
+        # Per-user history is read newest first, a page at a time
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_summary_history_user_created ON summary_history(user_id, created_at, id)")
+        logger.info("✅ Ensured ix_summary_history_user_created index on summary_history")
+        
         # Verify final schema
         cursor.execute("SELECT COUNT(*) FROM users")
         user_count = cursor.fetchone()[0]
@@ -117,6 +139,10 @@ def migrate_database():
         logger.info(f"- Orphaned summaries (no user_id): {orphaned_summaries}")
         
         conn.commit()
+
+        # Search index over the title/keywords columns added above, filling in rows it lacks
+        ensure_search_index(create_engine(f"sqlite:///{db_path}"))
+        logger.info("✅ Ensured the summary history search index")
         logger.info("🎉 Database migration completed successfully!")
         
     except Exception as e:
@@ -126,6 +152,20 @@ def migrate_database():
     finally:
         conn.close()
 
+def add_missing_columns(cursor, table, columns):
+    """Add any of the given {name: type} columns that an existing table lacks"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table,))
+    if not cursor.fetchone():
+        logger.info(f"{table} table doesn't exist yet, it will be created on first run")
+        return
+    
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {col[1] for col in cursor.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+            logger.info(f"✅ Added {name} column to {table}")
+
 def verify_database():
     """Verify the database structure after migration"""
     db_path = 'history.db'
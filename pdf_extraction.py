@@ -0,0 +1,161 @@
+import os
+import atexit
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pymupdf
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    try:
+        import fitz as pymupdf
+        PYMUPDF_AVAILABLE = True
+    except ImportError:
+        logger.warning("PyMuPDF not available. Local PDF extraction will use PyPDF2.")
+        PYMUPDF_AVAILABLE = False
+        pymupdf = None
+
+# Documents with fewer pages are extracted in-process; the pool start-up isn't worth it
+PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '32'))
+MIN_PAGES_PER_TASK = 8
+
+class ExtractionBackend:
+    """Local PDF text extraction engine. Subclasses implement page_count and extract_range."""
+    name = None
+
+    def page_count(self, pdf_path):
+        raise NotImplementedError
+
+    def extract_range(self, pdf_path, start, stop):
+        """Return the text of pages [start, stop) as a list of strings."""
+        raise NotImplementedError
+
+    def extract_pages(self, pdf_path):
+        """Return the text of every page as a list of strings."""
+        return self.extract_range(pdf_path, 0, self.page_count(pdf_path))
+
+class PyPDF2Backend(ExtractionBackend):
+    """Pure-Python extraction with PyPDF2; slow but has no native dependencies."""
+    name = 'pypdf2'
+
+    def page_count(self, pdf_path):
+        with open(pdf_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+
+    def extract_range(self, pdf_path, start, stop):
+        with open(pdf_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            return [reader.pages[i].extract_text() or '' for i in range(start, min(stop, len(reader.pages)))]
+
+def _extract_range_pymupdf(pdf_path, start, stop):
+    """Extract pages [start, stop) with PyMuPDF, falling back to PyPDF2 for pages it fails on.
+
+    Module-level so it can run in a worker process; deliberately doesn't log, since a
+    forked child may inherit a logging lock held by another thread of the parent.
+    """
+    pages = []
+    fallback_reader = None
+    fallback_file = None
+    try:
+        with pymupdf.open(pdf_path) as doc:
+            for i in range(start, min(stop, doc.page_count)):
+                try:
+                    pages.append(doc[i].get_text())
+                except Exception:
+                    if fallback_reader is None:
+                        fallback_file = open(pdf_path, 'rb')
+                        fallback_reader = PyPDF2.PdfReader(fallback_file)
+                    try:
+                        pages.append(fallback_reader.pages[i].extract_text() or '')
+                    except Exception:
+                        pages.append('')
+    finally:
+        if fallback_file is not None:
+            fallback_file.close()
+    return pages
+
+class PyMuPDFBackend(ExtractionBackend):
+    """PyMuPDF extraction; large documents are split into page ranges extracted on a process pool."""
+    name = 'pymupdf'
+
+    def __init__(self, workers=None):
+        self.workers = workers if workers is not None else int(os.getenv('PDF_EXTRACT_WORKERS', str(min(os.cpu_count() or 1, 4))))
+        self._pool = None
+
+    def page_count(self, pdf_path):
+        with pymupdf.open(pdf_path) as doc:
+            return doc.page_count
+
+    def extract_range(self, pdf_path, start, stop):
+        return _extract_range_pymupdf(pdf_path, start, stop)
+
+    def start_pool(self):
+        """Fork the extraction worker processes; call it while the process is still single-threaded.
+
+        A child forked while other threads run can inherit a lock one of them holds (logging,
+        the allocator, sqlite) and hang on it, so the pool is never created lazily: until
+        start_pool has run, extract_pages works in-process. Only fork-based pools, since
+        spawn/forkserver children re-import the __main__ module, which for `python app.py`
+        would re-run the whole app start-up in every worker.
+        """
+        if self._pool is None and self.workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+            # A fork pool forks all of its workers on the first submit; do it now, not mid-request
+            pool.submit(int).result()
+            self._pool = pool
+            atexit.register(pool.shutdown)
+        return self._pool
+
+    def extract_pages(self, pdf_path):
+        total = self.page_count(pdf_path)
+        pool = self._pool if total >= PARALLEL_MIN_PAGES else None
+        if pool is None:
+            return self.extract_range(pdf_path, 0, total)
+
+        task_size = max(MIN_PAGES_PER_TASK, -(-total // (self.workers * 2)))
+        ranges = [(start, min(start + task_size, total)) for start in range(0, total, task_size)]
+        logger.info(f"Extracting {total} pages in {len(ranges)} ranges on {self.workers} processes")
+        try:
+            futures = [pool.submit(_extract_range_pymupdf, pdf_path, start, stop) for start, stop in ranges]
+        except BrokenProcessPool as e:
+            # A worker died; the pool can't be re-forked safely now that threads are running
+            logger.warning(f"Extraction pool is broken, extracting in-process: {str(e)}")
+            return self.extract_range(pdf_path, 0, total)
+        pages = []
+        for (start, stop), future in zip(ranges, futures):
+            try:
+                pages.extend(future.result())
+            except Exception as e:
+                logger.warning(f"Parallel extraction of pages {start}-{stop} failed, retrying in-process: {str(e)}")
+                pages.extend(self.extract_range(pdf_path, start, stop))
+        return pages
+
+BACKENDS = {
+    PyPDF2Backend.name: PyPDF2Backend,
+    PyMuPDFBackend.name: PyMuPDFBackend,
+}
+_backend_instances = {}
+
+def get_backend(name=None):
+    """Return the extraction backend called name, defaulting to PDF_EXTRACTION_BACKEND."""
+    name = (name or os.getenv('PDF_EXTRACTION_BACKEND') or ('pymupdf' if PYMUPDF_AVAILABLE else 'pypdf2')).lower()
+    if name == 'pymupdf' and not PYMUPDF_AVAILABLE:
+        logger.warning("PyMuPDF requested but not installed, using PyPDF2")
+        name = 'pypdf2'
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF extraction backend: {name}")
+    if name not in _backend_instances:
+        _backend_instances[name] = BACKENDS[name]()
+    return _backend_instances[name]
+
+def start_extraction_pool():
+    """Start the default backend's worker processes, if it uses any; see PyMuPDFBackend.start_pool."""
+    backend = get_backend()
+    if isinstance(backend, PyMuPDFBackend):
+        backend.start_pool()
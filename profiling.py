@@ -0,0 +1,248 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import abort, g, jsonify, request, send_file
+
+logger = logging.getLogger(__name__)
+
+# Whether the current request (and the job or stream thread working for it) is being profiled
+profile_requested = contextvars.ContextVar('profile_requested', default=False)
+
+PROFILE_NAME_PATTERN = re.compile(r'^[\w.-]+$')
+# Endpoints never worth profiling; their own cost would dominate anything sampled
+UNPROFILED_ENDPOINTS = {'static', 'prometheus_metrics', 'list_profiles', 'download_profile'}
+
+_profiler = None
+
+class ThreadSampler:
+    """Samples one thread's stack every interval seconds from a helper thread.
+
+    Stacks are kept in the folded format (root;caller;callee count) read by flamegraph.pl,
+    speedscope and inferno. Time spent blocked, e.g. waiting on Gemini, shows up as samples
+    in the blocking call.
+    """
+
+    def __init__(self, thread_id, interval=0.005, max_seconds=300):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.duration = 0.0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def start(self):
+        self.started = time.perf_counter()
+        deadline = self.started + self.max_seconds
+
+        def run():
+            while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+                self._sample()
+
+        self._thread = threading.Thread(target=run, name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class ProfileStore:
+    """Profiles on disk: <name>.folded holds the stacks and <name>.json what was profiled.
+
+    Only the newest max_profiles are kept.
+    """
+
+    def __init__(self, directory='profiles', max_profiles=200):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, name, sampler, info):
+        meta = dict(info, name=name, samples=sampler.samples, interval_ms=sampler.interval * 1000,
+                    duration_ms=round(sampler.duration * 1000, 1),
+                    created_at=datetime.utcnow().isoformat(timespec='seconds'))
+        with self._lock:
+            with open(os.path.join(self.directory, f"{name}.folded"), 'w') as f:
+                f.write(sampler.folded())
+            with open(os.path.join(self.directory, f"{name}.json"), 'w') as f:
+                json.dump(meta, f)
+            self._prune()
+        return meta
+
+    def _prune(self):
+        names = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')),
+                       key=lambda entry: entry.stat().st_mtime)
+        for entry in names[:max(0, len(names) - self.max_profiles)]:
+            for suffix in ('.json', '.folded'):
+                try:
+                    os.remove(entry.path[:-len('.json')] + suffix)
+                except OSError:
+                    pass
+
+    def list(self):
+        """Metadata of the stored profiles, newest first."""
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    with open(entry.path) as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return sorted(profiles, key=lambda meta: meta['created_at'], reverse=True)
+
+    def path(self, name):
+        """Path of a stored profile's stacks, or None if there is no such profile."""
+        if not PROFILE_NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, f"{name}.folded")
+        return path if os.path.exists(path) else None
+
+class Profiler:
+    """Decides which requests to profile and stores their profiles.
+
+    Admins ask for a profile with an X-Profile: 1 header or ?profile=1; in addition sample_rate
+    of all requests are profiled at random. The profile of a request is saved under its request id,
+    and the background job or stream thread that runs its pipeline under <request id>-job or -stream.
+    """
+
+    def __init__(self, store, sample_rate=0.0, interval=0.005, max_seconds=300):
+        self.store = store
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_seconds = max_seconds
+
+    @classmethod
+    def from_env(cls):
+        """Build a profiler configured from PROFILE_* environment variables."""
+        return cls(
+            ProfileStore(os.getenv('PROFILE_DIR', 'profiles'), int(os.getenv('PROFILE_MAX_STORED', '200'))),
+            sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+            interval=float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000,
+            max_seconds=float(os.getenv('PROFILE_MAX_SECONDS', '300')),
+        )
+
+    def wants_profile(self, is_admin):
+        if request.endpoint in UNPROFILED_ENDPOINTS:
+            return None
+        flag = request.headers.get('X-Profile') or request.args.get('profile')
+        if flag and flag.lower() in ('1', 'true', 'yes') and is_admin():
+            return 'requested'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    @contextmanager
+    def sample_thread(self, name, info):
+        sampler = ThreadSampler(threading.get_ident(), self.interval, self.max_seconds)
+        sampler.start()
+        try:
+            yield sampler
+        finally:
+            sampler.stop()
+            try:
+                self.store.save(name, sampler, info)
+            except Exception as e:
+                logger.error(f"Failed to store profile {name}: {str(e)}")
+
+@contextmanager
+def profile_thread(part, request_id, enabled=None):
+    """Profile the current thread as part of a request's profile if that request is being profiled.
+
+    enabled defaults to the current context's flag; threads that don't inherit the request's
+    context (job pools) pass the flag captured when the work was handed to them.
+    """
+    if enabled is None:
+        enabled = profile_requested.get()
+    if _profiler is None or not enabled or not request_id:
+        yield
+        return
+    token = profile_requested.set(True)
+    try:
+        with _profiler.sample_thread(f"{request_id}-{part}", {'request_id': request_id, 'part': part,
+                                                              'thread': threading.current_thread().name}):
+            yield
+    finally:
+        profile_requested.reset(token)
+
+def init_profiling(app, is_admin, admin_required):
+    """Profile requests on demand or at random, and serve the stored profiles on /debug/profiles."""
+    global _profiler
+    profiler = _profiler = Profiler.from_env()
+
+    @app.before_request
+    def start_profile():
+        reason = profiler.wants_profile(is_admin)
+        if reason is None or 'request_id' not in g:
+            return
+        g.profile_token = profile_requested.set(True)
+        g.profile = profiler.sample_thread(g.request_id, {
+            'request_id': g.request_id,
+            'part': 'request',
+            'reason': reason,
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint
+        })
+        g.profile.__enter__()
+
+    @app.teardown_request
+    def finish_profile(exception=None):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        profile.__exit__(None, None, None)
+        profile_requested.reset(g.pop('profile_token'))
+
+    @app.route('/debug/profiles')
+    @admin_required
+    def list_profiles():
+        """Stored request profiles, newest first"""
+        return jsonify(profiler.store.list())
+
+    @app.route('/debug/profiles/<name>')
+    @admin_required
+    def download_profile(name):
+        """One stored profile's stacks in folded format, for flamegraph.pl or speedscope"""
+        path = profiler.store.path(name)
+        if path is None:
+            abort(404)
+        return send_file(os.path.abspath(path), mimetype='text/plain', as_attachment=True,
+                         download_name=f"{name}.folded")
+
+    return profiler
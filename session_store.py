@@ -0,0 +1,225 @@
+import os
+import secrets
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from db import Base, ServerSession, Session as DBSession, create_database_engine
+
+logger = logging.getLogger(__name__)
+
+class StoredSession(SecureCookieSession):
+    """A Flask session kept either in the signed cookie itself (sid is None) or in the server_sessions table."""
+
+    def __init__(self, initial=None, sid=None, written_at=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.written_at = written_at
+        self.loaded_user_id = dict.get(self, 'user_id')
+        self.stale_sid = None
+
+    def regenerate(self):
+        """Issue a fresh session id on the next save and delete the stored row under the old one."""
+        if self.sid is not None:
+            self.stale_sid = self.sid
+            self.sid = None
+            self.written_at = None
+        self.modified = True
+
+def is_signed_in(session):
+    return 'user_id' in session
+
+class DatabaseSessionInterface(SecureCookieSessionInterface):
+    """Stores signed-in users' sessions in a database table and everyone else's in the signed cookie.
+
+    Server-side sessions are looked up by a random id carried in the (signed) cookie and expire
+    after PERMANENT_SESSION_LIFETIME; a row is only rewritten when the session changed or more than
+    touch_interval has passed, so steady-state requests are reads. Guest sessions never touch the
+    database. A background sweep deletes expired rows in batches.
+    """
+
+    session_class = StoredSession
+    sid_salt = 'server-session-id'
+
+    def __init__(self, session_factory, server_side=is_signed_in, touch_interval=timedelta(minutes=5),
+                 sweep_interval=600, sweep_batch=500):
+        self.session_factory = session_factory
+        self.server_side = server_side
+        self.touch_interval = touch_interval
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls):
+        """Build a session store configured from SESSION_* environment variables.
+
+        SESSION_DATABASE_URL puts sessions in their own database (any SQLAlchemy URL); by default
+        they share the application database.
+        """
+        url = os.getenv('SESSION_DATABASE_URL')
+        if url:
+            session_engine = create_database_engine(url)
+            Base.metadata.create_all(session_engine, tables=[ServerSession.__table__])
+            session_factory = sessionmaker(bind=session_engine)
+        else:
+            session_factory = DBSession
+        return cls(
+            session_factory,
+            touch_interval=timedelta(seconds=float(os.getenv('SESSION_TOUCH_SECONDS', '300'))),
+            sweep_interval=int(os.getenv('SESSION_SWEEP_SECONDS', '600')),
+            sweep_batch=int(os.getenv('SESSION_SWEEP_BATCH', '500')),
+        )
+
+    def get_sid_serializer(self, app):
+        if not app.secret_key:
+            return None
+        keys = list(app.config.get('SECRET_KEY_FALLBACKS') or []) + [app.secret_key]
+        return URLSafeTimedSerializer(keys, salt=self.sid_salt, signer_kwargs={
+            'key_derivation': self.key_derivation,
+            'digest_method': self.digest_method
+        })
+
+    def open_session(self, app, request):
+        sid_serializer = self.get_sid_serializer(app)
+        if sid_serializer is None:
+            return None
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value:
+            return self.session_class()
+        try:
+            sid = sid_serializer.loads(value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            # Not a session id: a guest session held in the cookie
+            return super().open_session(app, request)
+        return self._load(sid)
+
+    def _load(self, sid):
+        db_session = self.session_factory()
+        try:
+            row = db_session.execute(
+                select(ServerSession.data, ServerSession.updated_at).where(
+                    ServerSession.sid == sid,
+                    ServerSession.expires_at > datetime.utcnow()
+                )
+            ).first()
+        except Exception as e:
+            logger.error(f"Failed to load session: {str(e)}")
+            row = None
+        finally:
+            db_session.close()
+        if row is None:
+            return self.session_class()
+        return self.session_class(self.serializer.loads(row.data), sid=sid, written_at=row.updated_at)
+
+    def save_session(self, app, session, response):
+        if session.sid is not None and dict.get(session, 'user_id') != session.loaded_user_id:
+            # A different user on a stored session: never carry the old id across (session fixation)
+            session.regenerate()
+        if session.stale_sid is not None:
+            self._delete(session.stale_sid)
+            session.stale_sid = None
+
+        if not self.server_side(session):
+            if session.sid is not None:
+                # Signed out: drop the stored copy; whatever is left goes back into the cookie
+                self._delete(session.sid)
+                session.sid = None
+                session.modified = True
+            return super().save_session(app, session, response)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        now = datetime.utcnow()
+        is_new = session.sid is None
+        if is_new:
+            session.sid = secrets.token_urlsafe(32)
+        if is_new or session.modified or session.written_at is None or now - session.written_at > self.touch_interval:
+            self._store(session, now, now + app.permanent_session_lifetime)
+
+        if is_new or self.should_set_cookie(app, session):
+            response.set_cookie(
+                self.get_cookie_name(app),
+                self.get_sid_serializer(app).dumps(session.sid),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=self.get_cookie_domain(app),
+                path=self.get_cookie_path(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+            response.vary.add('Cookie')
+
+    def _store(self, session, now, expires_at):
+        db_session = self.session_factory()
+        try:
+            db_session.merge(ServerSession(
+                sid=session.sid,
+                data=self.serializer.dumps(dict(session)),
+                user_id=session.get('user_id'),
+                updated_at=now,
+                expires_at=expires_at
+            ))
+            db_session.commit()
+            session.written_at = now
+        except Exception as e:
+            logger.error(f"Failed to store session: {str(e)}")
+            db_session.rollback()
+        finally:
+            db_session.close()
+
+    def _delete(self, sid):
+        db_session = self.session_factory()
+        try:
+            db_session.query(ServerSession).filter(ServerSession.sid == sid).delete(synchronize_session=False)
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Failed to delete session: {str(e)}")
+            db_session.rollback()
+        finally:
+            db_session.close()
+
+    def sweep(self):
+        """Delete expired sessions, sweep_batch rows per transaction. Returns the number deleted."""
+        deleted = 0
+        while True:
+            db_session = self.session_factory()
+            try:
+                expired = select(ServerSession.sid).where(
+                    ServerSession.expires_at <= datetime.utcnow()
+                ).limit(self.sweep_batch)
+                # Short batches keep the write lock brief for the requests running meanwhile
+                count = db_session.query(ServerSession).filter(
+                    ServerSession.sid.in_(expired.scalar_subquery())
+                ).delete(synchronize_session=False)
+                db_session.commit()
+            except Exception as e:
+                logger.error(f"Session sweep failed: {str(e)}")
+                db_session.rollback()
+                break
+            finally:
+                db_session.close()
+            deleted += count
+            if count < self.sweep_batch:
+                break
+        if deleted:
+            logger.info(f"Session sweep: deleted {deleted} expired sessions")
+        return deleted
+
+    def start_sweeper(self):
+        """Run sweep every sweep_interval seconds on a daemon thread."""
+        if self._sweeper is not None or self.sweep_interval <= 0:
+            return
+
+        def run():
+            while not self._stop.wait(self.sweep_interval):
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name='session-sweeper', daemon=True)
+        self._sweeper.start()
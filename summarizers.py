@@ -0,0 +1,438 @@
+import os
+import time
+import queue
+import logging
+import warnings
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from chunking import estimate_tokens
+from fake_gemini import FakeGeminiModel
+from metrics import observe_batch
+from summary_cache import hash_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GEMINI_MODEL = 'gemini-2.0-flash'
+
+# What generate and stream return when the backend has no response type of its own;
+# shaped like Gemini's responses so the app's token metrics read both
+Usage = namedtuple('Usage', ['prompt_token_count', 'candidates_token_count'])
+Generation = namedtuple('Generation', ['text', 'usage_metadata'], defaults=(None,))
+
+def configure_gemini():
+    """Configure the Gemini client (models, uploads) from GEMINI_API_KEY and GEMINI_API_ENDPOINT."""
+    endpoint = os.getenv('GEMINI_API_ENDPOINT')
+    if endpoint:
+        # Another server speaking the REST API, e.g. fake_gemini.py for load tests
+        genai.configure(api_key=os.getenv('GEMINI_API_KEY'), transport='rest', client_options={'api_endpoint': endpoint})
+    else:
+        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+
+class SummarizerBackend:
+    """A model the pipeline can summarize with. Subclasses implement generate.
+
+    prompt is the full instruction prompt and text the paper text (or part summaries) it wraps;
+    backends that don't follow instructions (follows_instructions = False) summarize text alone
+    and return a bare summary. document is a handle from upload_document, for backends that
+    read PDFs themselves (supports_documents). config holds Gemini-style generation settings
+    (temperature, top_p, max_output_tokens); backends ignore the ones they have no use for.
+    """
+    name = None
+    supports_documents = False
+    follows_instructions = True
+    # Longest input the model takes, in tokens; None when only the app's chunking limits apply
+    context_tokens = None
+
+    @property
+    def model_id(self):
+        """Identifies the model in summary cache keys, so each model's summaries are cached apart."""
+        return self.name
+
+    def generate(self, prompt, text=None, document=None, config=None, timeout=120):
+        """Return a response with .text and, when known, .usage_metadata."""
+        raise NotImplementedError
+
+    def stream(self, prompt, text=None, document=None, config=None, timeout=120):
+        """Yield the response in chunks with .text; only the last carries usage_metadata.
+
+        Backends that can't stream yield the whole response as one chunk.
+        """
+        yield self.generate(prompt, text, document, config, timeout)
+
+    def count_tokens(self, text):
+        """Tokens in text as this backend counts them; an estimate unless it has a local tokenizer."""
+        return estimate_tokens(text)
+
+    def upload_document(self, pdf_path, content_hash=None):
+        """Make a PDF available to generate and stream as their document argument."""
+        raise NotImplementedError(f"The {self.name} summarizer cannot read PDFs")
+
+    def start(self):
+        """Get ready for the first request in the background, e.g. load a local model."""
+
+    def info(self):
+        return {
+            'name': self.name,
+            'model': self.model_id,
+            'supports_documents': self.supports_documents,
+            'follows_instructions': self.follows_instructions,
+            'context_tokens': self.context_tokens
+        }
+
+class GeminiBackend(SummarizerBackend):
+    """Gemini through google.generativeai; PDFs go through the shared upload registry."""
+    name = 'gemini'
+    supports_documents = True
+
+    def __init__(self, uploads, model_name=DEFAULT_GEMINI_MODEL):
+        self.uploads = uploads
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    @classmethod
+    def from_env(cls, uploads):
+        """Build a backend for GEMINI_MODEL; the client must have been configured with configure_gemini."""
+        return cls(uploads, os.getenv('GEMINI_MODEL', DEFAULT_GEMINI_MODEL))
+
+    @property
+    def model_id(self):
+        return self.model_name
+
+    def _generate_content(self, prompt, document, config, timeout, stream):
+        contents = prompt if document is None else [prompt, document.as_part()]
+        try:
+            return self.model.generate_content(contents, generation_config=config,
+                                               request_options={"timeout": timeout}, stream=stream)
+        except (google_exceptions.NotFound, google_exceptions.PermissionDenied):
+            # A reused upload Gemini no longer accepts; the next attempt uploads the PDF again
+            if document is not None and document.reused:
+                self.uploads.invalidate(document)
+            raise
+
+    def generate(self, prompt, text=None, document=None, config=None, timeout=120):
+        return self._generate_content(prompt, document, config, timeout, stream=False)
+
+    def stream(self, prompt, text=None, document=None, config=None, timeout=120):
+        return self._generate_content(prompt, document, config, timeout, stream=True)
+
+    def upload_document(self, pdf_path, content_hash=None):
+        """Upload the PDF, or reuse the live upload of the same bytes."""
+        return self.uploads.acquire(pdf_path, content_hash)
+
+class FakeBackend(SummarizerBackend):
+    """Deterministic offline stand-in (fake_gemini.py) for benchmarks, load tests and development."""
+    name = 'fake'
+    supports_documents = True
+
+    def __init__(self, chunk_chars=200):
+        self.model = FakeGeminiModel(chunk_chars)
+
+    @classmethod
+    def from_env(cls):
+        return cls()
+
+    def _contents(self, prompt, document):
+        return prompt if document is None else [prompt, f"Attached PDF {document}"]
+
+    def generate(self, prompt, text=None, document=None, config=None, timeout=120):
+        return self.model.generate_content(self._contents(prompt, document), generation_config=config)
+
+    def stream(self, prompt, text=None, document=None, config=None, timeout=120):
+        return self.model.generate_content(self._contents(prompt, document), generation_config=config, stream=True)
+
+    def upload_document(self, pdf_path, content_hash=None):
+        # The content hash is all the fake needs: the same PDF always gets the same summary
+        return content_hash or hash_file(pdf_path)
+
+class GenerationRequest:
+    """One text waiting on the inference thread; requests with the same key can share a generate call."""
+
+    def __init__(self, text, max_new_tokens, min_new_tokens):
+        self.text = text
+        self.key = (max_new_tokens, min_new_tokens)
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+class Seq2SeqBackend(SummarizerBackend):
+    """A local Hugging Face seq2seq summarization model, e.g. the fine-tuned BART from the notebook.
+
+    Such models take no instructions: they get the paper text, truncated to max_input_tokens,
+    and return a bare summary. The model is loaded once per process, when the backend starts,
+    with its Linear layers dynamically quantized to int8 for CPU inference when quantize is set.
+
+    Calls are micro-batched on one inference thread: a request waits up to batch_wait seconds
+    for others to join it, up to max_batch_size, and the batch runs as one generate call padded
+    to its longest input. Concurrent chunk summaries of a long paper batch with each other.
+    """
+    name = 'hf'
+    follows_instructions = False
+
+    def __init__(self, model_path='fine_tuned_bart', max_input_tokens=1024, max_output_tokens=512,
+                 min_output_tokens=64, num_beams=4, quantize=True, max_batch_size=8, batch_wait=0.01, threads=0):
+        self.model_path = model_path
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.min_output_tokens = min_output_tokens
+        self.num_beams = num_beams
+        self.quantize = quantize
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait
+        self.threads = threads
+        self.context_tokens = max_input_tokens
+        self.tokenizer = None
+        self.model = None
+        self.quantized = False
+        self._load_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        # Fast tokenizers reject concurrent calls that change their truncation or padding settings
+        self._tokenizer_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._held = deque()
+        self._thread = None
+        self._stats = {'batches': 0, 'requests': 0, 'generate_seconds': 0.0, 'queue_seconds': 0.0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a backend configured from HF_SUMMARIZER_* environment variables."""
+        return cls(
+            os.getenv('HF_SUMMARIZER_MODEL', 'fine_tuned_bart'),
+            max_input_tokens=int(os.getenv('HF_SUMMARIZER_MAX_INPUT_TOKENS', '1024')),
+            max_output_tokens=int(os.getenv('HF_SUMMARIZER_MAX_OUTPUT_TOKENS', '512')),
+            min_output_tokens=int(os.getenv('HF_SUMMARIZER_MIN_OUTPUT_TOKENS', '64')),
+            num_beams=int(os.getenv('HF_SUMMARIZER_NUM_BEAMS', '4')),
+            quantize=os.getenv('HF_SUMMARIZER_QUANTIZE', 'true').lower() not in ('0', 'false', 'no'),
+            max_batch_size=int(os.getenv('HF_SUMMARIZER_MAX_BATCH', '8')),
+            batch_wait=float(os.getenv('HF_SUMMARIZER_BATCH_WAIT_MS', '10')) / 1000,
+            threads=int(os.getenv('HF_SUMMARIZER_THREADS', '0'))
+        )
+
+    @property
+    def model_id(self):
+        return f"hf:{os.path.basename(os.path.normpath(self.model_path))}"
+
+    def load(self):
+        """Load the tokenizer and model once; transformers and torch are only imported when needed."""
+        with self._load_lock:
+            if self.model is not None:
+                return self.model
+            import torch
+            from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            started = time.perf_counter()
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+            model = AutoModelForSeq2SeqLM.from_pretrained(self.model_path)
+            model.eval()
+            if self.quantize:
+                model = self._quantize(model)
+            self.model = model
+            logger.info(f"Loaded summarization model {self.model_path} in {time.perf_counter() - started:.1f}s "
+                         f"(int8: {self.quantized}, threads: {torch.get_num_threads()})")
+            return model
+
+    def _quantize(self, model):
+        """Swap the model's Linear layers for int8 ones with dynamically quantized activations."""
+        import torch
+        try:
+            from torch.ao.quantization import quantize_dynamic
+        except ImportError:
+            logger.warning("Dynamic quantization is not available in this torch build, running in float32")
+            return model
+        with warnings.catch_warnings():
+            # Eager-mode quantization is deprecated in favour of torchao but still ships with torch
+            warnings.simplefilter('ignore')
+            model = quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.quantized = True
+        return model
+
+    def start(self):
+        """Start the inference thread, which loads the model; generate starts it on first use."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._serve, name='summarizer-inference', daemon=True)
+                self._thread.start()
+
+    def generate(self, prompt, text=None, document=None, config=None, timeout=120):
+        if document is not None:
+            raise NotImplementedError(f"The {self.name} summarizer cannot read PDFs")
+        max_new_tokens = min(self.max_output_tokens, (config or {}).get('max_output_tokens') or self.max_output_tokens)
+        request = GenerationRequest(text if text is not None else prompt, max_new_tokens,
+                                    min(self.min_output_tokens, max_new_tokens))
+        self.start()
+        self._requests.put(request)
+        try:
+            return request.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Still queued: keep it out of the next batch (a no-op once its batch is running)
+            request.future.cancel()
+            raise
+
+    def close(self):
+        """Stop the inference thread once the requests queued before this call have run."""
+        with self._start_lock:
+            if self._thread is not None:
+                self._requests.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def _serve(self):
+        try:
+            self.load()
+        except Exception as e:
+            # Retried by the first batch, which reports the error to its requests
+            logger.error(f"Failed to load summarization model {self.model_path}: {str(e)}")
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._run_batch(batch)
+
+    def _next_batch(self):
+        """Block for a request, then gather ones with the same settings until the batch is full or batch_wait is up.
+
+        Requests with other settings are held, in order, for the following batches; requests whose
+        caller has given up (a cancelled future) are dropped.
+        """
+        while True:
+            first = self._held.popleft() if self._held else self._requests.get()
+            if first is None:
+                return None
+            if first.future.set_running_or_notify_cancel():
+                break
+        batch = [first]
+        held = []
+        while self._held and len(batch) < self.max_batch_size:
+            self._gather(self._held.popleft(), batch, held)
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Closing: run this batch, then stop
+                self._requests.put(None)
+                break
+            self._gather(request, batch, held)
+        self._held.extendleft(reversed(held))
+        return batch
+
+    @staticmethod
+    def _gather(request, batch, held):
+        if request.key != batch[0].key:
+            if not request.future.cancelled():
+                held.append(request)
+        elif request.future.set_running_or_notify_cancel():
+            batch.append(request)
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            import torch
+
+            model = self.load()
+            max_new_tokens, min_new_tokens = batch[0].key
+            with self._tokenizer_lock:
+                inputs = self.tokenizer([request.text for request in batch], truncation=True,
+                                        max_length=self.max_input_tokens, padding=True, return_tensors='pt')
+            with torch.inference_mode():
+                output = model.generate(**inputs, num_beams=self.num_beams, max_new_tokens=max_new_tokens,
+                                        min_new_tokens=min_new_tokens)
+            with self._tokenizer_lock:
+                summaries = self.tokenizer.batch_decode(output, skip_special_tokens=True)
+            input_tokens = inputs['attention_mask'].sum(dim=1).tolist()
+            output_tokens = (output != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        except Exception as e:
+            logger.error(f"Local summarization batch of {len(batch)} failed: {str(e)}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        queue_waits = [started - request.enqueued for request in batch]
+        observe_batch(self.name, len(batch), queue_waits, finished - started)
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['requests'] += len(batch)
+            self._stats['generate_seconds'] += finished - started
+            self._stats['queue_seconds'] += sum(queue_waits)
+        for request, summary, prompt_tokens, candidate_tokens in zip(batch, summaries, input_tokens, output_tokens):
+            request.future.set_result(Generation(summary, Usage(int(prompt_tokens), int(candidate_tokens))))
+
+    def count_tokens(self, text):
+        self.load()
+        with self._tokenizer_lock:
+            return len(self.tokenizer(text, add_special_tokens=False)['input_ids'])
+
+    def info(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats.pop('batches')
+        requests = stats.pop('requests')
+        return dict(
+            super().info(),
+            loaded=self.model is not None,
+            int8=self.quantized,
+            max_batch_size=self.max_batch_size,
+            batch_wait_ms=self.batch_wait * 1000,
+            queued=self._requests.qsize() + len(self._held),
+            batches=batches,
+            requests=requests,
+            avg_batch_size=round(requests / batches, 2) if batches else None,
+            avg_generate_ms=round(stats['generate_seconds'] * 1000 / batches, 1) if batches else None,
+            avg_queue_ms=round(stats['queue_seconds'] * 1000 / requests, 1) if requests else None
+        )
+
+class SummarizerRegistry:
+    """The configured summarizer backends, each built the first time it is used.
+
+    factories maps backend names to zero-argument constructors. default serves requests that
+    don't pick a backend; allowed lists the ones a request may pick.
+    """
+
+    def __init__(self, factories, default='gemini', allowed=None):
+        if default not in factories:
+            raise ValueError(f"Unknown summarizer backend: {default}")
+        self.factories = factories
+        self.default = default
+        self.allowed = [name for name in (allowed or [default]) if name in factories]
+        if default not in self.allowed:
+            self.allowed.insert(0, default)
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, factories):
+        """Build a registry from SUMMARIZER_BACKEND (the default) and SUMMARIZER_BACKENDS (per-request choices)."""
+        default = os.getenv('SUMMARIZER_BACKEND', 'gemini').lower()
+        allowed = [name.strip().lower() for name in os.getenv('SUMMARIZER_BACKENDS', '').split(',') if name.strip()]
+        for name in allowed:
+            if name not in factories:
+                logger.warning(f"Ignoring unknown summarizer backend in SUMMARIZER_BACKENDS: {name}")
+        return cls(factories, default, allowed)
+
+    def get(self, name=None):
+        """Return the backend called name, defaulting to the configured default. Raises ValueError for unknown names."""
+        name = (name or self.default).lower()
+        if name not in self.factories:
+            raise ValueError(f"Unknown summarizer backend: {name}")
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self.factories[name]()
+            return self._instances[name]
+
+    def metrics(self):
+        """The default and selectable backends, with the details of those built so far."""
+        with self._lock:
+            built = {name: backend.info() for name, backend in self._instances.items()}
+        return {'default': self.default, 'allowed': self.allowed, 'loaded': built}
@@ -0,0 +1,204 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+from db import SummaryCacheEntry
+from metrics import count_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_bytes(data):
+    """Return the SHA-256 hex digest of a bytes object."""
+    return hashlib.sha256(data).hexdigest()
+
+def hash_text(text):
+    """Return the SHA-256 hex digest of a text string (UTF-8 encoded)."""
+    return hash_bytes(text.encode('utf-8'))
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class SummaryCache:
+    """Content-addressed summary cache: an in-process LRU in front of the summary_cache table."""
+
+    def __init__(self, session_factory, version, memory_items=256, max_entries=5000,
+                 max_bytes=200 * 1024 * 1024, max_age=timedelta(days=30), evict_every=50, enabled=True):
+        self.session_factory = session_factory
+        self.version = version
+        self.memory_items = memory_items
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+        self.enabled = enabled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+
+    @classmethod
+    def from_env(cls, session_factory, version):
+        """Build a cache configured from SUMMARY_CACHE_* environment variables."""
+        return cls(
+            session_factory,
+            version,
+            memory_items=int(os.getenv('SUMMARY_CACHE_MEMORY_ITEMS', '256')),
+            max_entries=int(os.getenv('SUMMARY_CACHE_MAX_ENTRIES', '5000')),
+            max_bytes=int(float(os.getenv('SUMMARY_CACHE_MAX_MB', '200')) * 1024 * 1024),
+            max_age=timedelta(days=float(os.getenv('SUMMARY_CACHE_MAX_AGE_DAYS', '30'))),
+            enabled=os.getenv('SUMMARY_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no'),
+        )
+
+    def make_key(self, namespace, content_digest, model=None):
+        """Build a cache key from an input kind ('pdf', 'text'), its content digest, the cache version and
+        the model that summarizes it."""
+        version = f"{self.version}:{model}" if model else self.version
+        return hash_text(f"{namespace}:{content_digest}:{version}")
+
+    def _remember(self, key, summary, created_at):
+        with self._lock:
+            self._memory[key] = (summary, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached summary for key, or None on a miss."""
+        if not self.enabled or not key:
+            return None
+
+        with self._lock:
+            remembered = self._memory.get(key)
+            if remembered is not None:
+                summary, created_at = remembered
+                if created_at is None or datetime.utcnow() - created_at <= self.max_age:
+                    self._memory.move_to_end(key)
+                    logger.info(f"Summary cache hit (memory): {key[:12]}")
+                    count_cache_lookup('memory_hit')
+                    return summary
+                # Expired: the database lookup below counts it and deletes the row
+                del self._memory[key]
+
+        db_session = self.session_factory()
+        try:
+            entry = db_session.get(SummaryCacheEntry, key)
+            if entry is None:
+                logger.info(f"Summary cache miss: {key[:12]}")
+                count_cache_lookup('miss')
+                return None
+
+            now = datetime.utcnow()
+            if entry.created_at and now - entry.created_at > self.max_age:
+                logger.info(f"Summary cache entry expired: {key[:12]}")
+                count_cache_lookup('expired')
+                db_session.delete(entry)
+                db_session.commit()
+                return None
+
+            entry.last_accessed = now
+            entry.hit_count = (entry.hit_count or 0) + 1
+            summary = entry.summary
+            created_at = entry.created_at
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Summary cache lookup failed: {str(e)}")
+            count_cache_lookup('error')
+            db_session.rollback()
+            return None
+        finally:
+            db_session.close()
+
+        self._remember(key, summary, created_at)
+        logger.info(f"Summary cache hit (database): {key[:12]}")
+        count_cache_lookup('database_hit')
+        return summary
+
+    def set(self, key, summary):
+        """Store a summary under key in both tiers."""
+        if not self.enabled or not key or not summary:
+            return
+
+        now = datetime.utcnow()
+        self._remember(key, summary, now)
+
+        db_session = self.session_factory()
+        try:
+            db_session.merge(SummaryCacheEntry(
+                cache_key=key,
+                summary=summary,
+                size_bytes=len(summary.encode('utf-8')),
+                hit_count=0,
+                created_at=now,
+                last_accessed=now
+            ))
+            db_session.commit()
+            logger.info(f"Stored summary in cache: {key[:12]}")
+        except Exception as e:
+            logger.error(f"Failed to store summary in cache: {str(e)}")
+            db_session.rollback()
+            return
+        finally:
+            db_session.close()
+
+        with self._lock:
+            self._writes_since_evict += 1
+            should_evict = self._writes_since_evict >= self.evict_every
+            if should_evict:
+                self._writes_since_evict = 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Drop entries older than max_age, then least recently used entries until under the size limits."""
+        db_session = self.session_factory()
+        try:
+            cutoff = datetime.utcnow() - self.max_age
+            expired = db_session.query(SummaryCacheEntry).filter(
+                SummaryCacheEntry.created_at < cutoff
+            ).delete(synchronize_session=False)
+
+            count, total_bytes = db_session.query(
+                func.count(SummaryCacheEntry.cache_key),
+                func.coalesce(func.sum(SummaryCacheEntry.size_bytes), 0)
+            ).one()
+
+            evicted = 0
+            victims = []
+            if count > self.max_entries or total_bytes > self.max_bytes:
+                rows = db_session.query(
+                    SummaryCacheEntry.cache_key, SummaryCacheEntry.size_bytes
+                ).order_by(SummaryCacheEntry.last_accessed.asc()).all()
+                for cache_key, size_bytes in rows:
+                    if count <= self.max_entries and total_bytes <= self.max_bytes:
+                        break
+                    victims.append(cache_key)
+                    count -= 1
+                    total_bytes -= size_bytes or 0
+                if victims:
+                    evicted = db_session.query(SummaryCacheEntry).filter(
+                        SummaryCacheEntry.cache_key.in_(victims)
+                    ).delete(synchronize_session=False)
+
+            db_session.commit()
+            # Entries gone from the table must not outlive it in this process's memory tier
+            with self._lock:
+                for cache_key in [k for k, (_, created_at) in self._memory.items()
+                                  if created_at is not None and created_at < cutoff] + victims:
+                    self._memory.pop(cache_key, None)
+            if expired or evicted:
+                logger.info(f"Summary cache eviction: {expired} expired, {evicted} over budget")
+        except Exception as e:
+            logger.error(f"Summary cache eviction failed: {str(e)}")
+            db_session.rollback()
+        finally:
+            db_session.close()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Markdown-to-HTML rendering of stored summaries, and a backfill command for existing rows.
+
+Usage:
+    python summary_rendering.py [--batch-size 200] [--force]
+"""
+
+import logging
+import argparse
+import threading
+
+import markdown
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the extensions or rendering below change; rows from an older renderer
+# are re-rendered lazily when read, or all at once by running this module
+RENDERER_VERSION = 1
+MARKDOWN_EXTENSIONS = ['nl2br', 'fenced_code', 'tables']
+
+_local = threading.local()
+
+def render_summary_html(summary):
+    """Render a stored markdown summary to HTML."""
+    # Building a Markdown instance loads its extensions; reuse one per thread
+    renderer = getattr(_local, 'renderer', None)
+    if renderer is None:
+        renderer = _local.renderer = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    try:
+        return renderer.convert(summary)
+    finally:
+        renderer.reset()
+
+def is_rendered(record):
+    """Whether a SummaryHistory row has HTML from the current renderer."""
+    return record.summary_html is not None and record.renderer_version == RENDERER_VERSION
+
+def render_record(record):
+    """(Re-)render a SummaryHistory row's HTML from its markdown."""
+    record.summary_html = render_summary_html(record.summary)
+    record.renderer_version = RENDERER_VERSION
+
+def backfill(session_factory, batch_size=200, force=False):
+    """Render every row whose HTML is missing or stale (all rows with force). Returns the number rendered."""
+    from sqlalchemy import or_
+    from db import SummaryHistory
+
+    rendered = 0
+    last_id = 0
+    while True:
+        db_session = session_factory()
+        try:
+            query = db_session.query(SummaryHistory).filter(SummaryHistory.id > last_id)
+            if not force:
+                query = query.filter(or_(
+                    SummaryHistory.summary_html.is_(None),
+                    SummaryHistory.renderer_version.is_(None),
+                    SummaryHistory.renderer_version != RENDERER_VERSION
+                ))
+            records = query.order_by(SummaryHistory.id.asc()).limit(batch_size).all()
+            if not records:
+                break
+            for record in records:
+                render_record(record)
+            db_session.commit()
+            last_id = records[-1].id
+            rendered += len(records)
+            logger.info(f"Rendered {rendered} summaries (up to id {last_id})")
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+    return rendered
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Pre-render the HTML of stored summaries")
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--force', action='store_true', help="re-render rows that are already current")
+    args = parser.parse_args()
+
+    from db import Session
+    count = backfill(Session, batch_size=args.batch_size, force=args.force)
+    logger.info(f"✅ Backfill complete: {count} summaries rendered with renderer version {RENDERER_VERSION}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Compiled once at import. Each removal pattern starts with a character class so the regex
+# engine can skip ahead to candidate positions instead of trying every offset; the word-boundary
+# checks become lookbehinds after the first character.
+STRIP_PATTERN = re.compile(
+    r'[aA](?i:rxiv:\d+\.\d+v\d*)'                          # arXiv IDs
+    r'|[pP](?<!\w[pP])(?i:acs\s*number\(s\)\s*:[^\n]*)'    # PACS numbers
+    r'|\[\s*(?:[fF]ig|[tT]able)\.\w+\s*\]'                 # figure/table references
+    r'|\d(?<!\w\d)\d*\.\d+\.\w+\b'                         # DOI patterns
+)
+MULTI_SPACE_PATTERN = re.compile(r' {2,}')
+MULTI_NEWLINE_PATTERN = re.compile(r'\n{2,}')
+COLON_BEFORE_DISPLAY_MATH_PATTERN = re.compile(r':\s*(\$\$)')
+
+def _clean(text):
+    # Remove arXiv IDs, PACS numbers, figure/table references and DOI patterns in one pass
+    text = STRIP_PATTERN.sub('', text)
+
+    # Join hyphenated line breaks
+    text = text.replace('-\n', '')
+
+    # Normalize whitespace
+    text = text.replace('\t', ' ')
+    text = MULTI_SPACE_PATTERN.sub(' ', text)
+    text = MULTI_NEWLINE_PATTERN.sub('\n', text)
+
+    # Minimal LaTeX cleanup to avoid breaking equations
+    text = text.replace('//sqrt', '\\sqrt')
+    text = COLON_BEFORE_DISPLAY_MATH_PATTERN.sub(r'\1', text)
+    return text
+
+def clean_text_preserve_equations(text):
+    """Clean text while preserving LaTeX equations."""
+    try:
+        return _clean(text).strip(), {}
+    except re.error as e:
+        logger.error(f"Regex error in clean_text_preserve_equations: {str(e)}")
+        return text, {}
+
+def clean_pages(pages):
+    """Clean an iterable of page texts one page at a time and join them.
+
+    Same result as cleaning the newline-joined pages, except for a pattern that spans a page
+    break. Lets extraction backends clean pages as they go (or in parallel) instead of running
+    every pass over one full-size copy of the document.
+    """
+    # Pages are newline-terminated as when joined, so a trailing "-\n" still joins across pages
+    cleaned = [_clean(page + '\n') for page in pages if page]
+    return MULTI_NEWLINE_PATTERN.sub('\n', ''.join(cleaned)).strip(), {}
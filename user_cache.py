@@ -0,0 +1,70 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# A detached copy of a User row: safe to keep across requests and threads, and reading it never queries
+UserSnapshot = namedtuple('UserSnapshot', ['id', 'email', 'name', 'provider', 'avatar_url', 'created_at', 'last_login'])
+
+def snapshot_user(user):
+    """Copy the columns of a User row into a UserSnapshot."""
+    return UserSnapshot(user.id, user.email, user.name, user.provider, user.avatar_url, user.created_at, user.last_login)
+
+class UserCache:
+    """Process-wide TTL + LRU cache of UserSnapshots keyed by user id.
+
+    Each worker process has its own copy and invalidation only reaches the process that made the
+    change, so ttl bounds how long another worker can serve a changed name or avatar.
+    """
+
+    def __init__(self, ttl=60, max_items=1024, enabled=True):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache configured from USER_CACHE_* environment variables."""
+        return cls(
+            ttl=float(os.getenv('USER_CACHE_TTL', '60')),
+            max_items=int(os.getenv('USER_CACHE_MAX_ITEMS', '1024')),
+            enabled=os.getenv('USER_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no'),
+        )
+
+    def get(self, user_id):
+        """Return the cached snapshot for user_id, or None if missing or older than ttl."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, snapshot):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[snapshot.id] = (time.monotonic(), snapshot)
+            self._entries.move_to_end(snapshot.id)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        logger.debug(f"Invalidated cached user {user_id}")
+
+    def metrics(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}